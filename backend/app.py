@@ -1,29 +1,67 @@
-from flask import Flask, request, redirect, session, jsonify, send_from_directory
+from flask import Flask, Response, g, request, redirect, session, jsonify, send_from_directory, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-import requests
 import base64
 import secrets
 import os
 import json
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from dotenv import load_dotenv
 from urllib.parse import urlencode
-import google.generativeai as genai
+import logging
+import requests
+from spotify_client import SpotifyClient, SpotifyAPIError, parse_pool_sizes
+from mood_cache import MoodCache
+from mood_index import MoodSimilarityIndex
+from mood_lexicon import MoodLexicon
+from mood_warmer import MoodWarmer, TrendingMoods
+from mood_classifier import MoodClassifier, TrainingLog
+from recommendation_cache import RecommendationCache
+from session_store import ServerSideSessionInterface, create_session_store
+from track_catalog import TrackCatalog
+from track_cache import TrackMetadataCache
+from track_record import Track, FAST_JSON, dumps_json, loads_json
+from oauth_state_store import create_state_store
+from log_config import configure_logging
+from metrics import MetricsRegistry, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from token_manager import TokenManager, ClientCredentialsProvider, store_token
+from upstream_scheduler import UpstreamScheduler, BULK, create_rate_state, endpoint_for, parse_rate_limits
 
 load_dotenv()
 
+# Leveled logging through a background writer; LOG_LEVEL=DEBUG shows per-request detail
+configure_logging()
+logger = logging.getLogger(__name__)
+
 current_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.dirname(current_dir)
 
+class MoodifyJSONProvider(DefaultJSONProvider):
+    """jsonify that understands Track records and encodes with orjson when FAST_JSON is on"""
+    
+    @staticmethod
+    def default(o):
+        if isinstance(o, Track):
+            return o.to_dict()
+        return DefaultJSONProvider.default(o)
+    
+    def dumps(self, obj, **kwargs):
+        if not FAST_JSON:
+            return super().dumps(obj, **kwargs)
+        return dumps_json(obj, default=self.default, sort_keys=self.sort_keys,
+                          indent=kwargs.get('indent')).decode('utf-8')
+
 app = Flask(__name__, 
            static_folder=os.path.join(project_root, 'static'), 
            static_url_path='/static')
+app.json = MoodifyJSONProvider(app)
 
 # Enhanced session configuration
 app.secret_key = os.getenv('FLASK_SECRET_KEY', 'moodify_secret_key_2025_fixed')
-app.config['SESSION_TYPE'] = 'filesystem'
 app.config['SESSION_PERMANENT'] = False
-app.config['SESSION_USE_SIGNER'] = True
-app.config['SESSION_KEY_PREFIX'] = 'moodify:'
 app.config['PERMANENT_SESSION_LIFETIME'] = 3600  # 1 hour
 # Explicit cookie settings to improve cross-site OAuth behavior in development
 # Use Lax so top-level GET navigations (OAuth redirects) will include the cookie
@@ -31,9 +69,22 @@ app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 # For local development we don't use HTTPS, so keep secure=False. In production set True.
 app.config['SESSION_COOKIE_SECURE'] = False
 app.config['SESSION_COOKIE_HTTPONLY'] = True
+# Session data lives server-side; the cookie only holds an opaque id. Sessions expire
+# PERMANENT_SESSION_LIFETIME after their last write, and the SQLite tier is shared by every worker.
+session_store = create_session_store(
+    os.getenv('SESSION_BACKEND', 'sqlite'),
+    path=os.getenv('SESSION_DB', os.path.join(current_dir, '.sessions.db')),
+    ttl=int(app.permanent_session_lifetime.total_seconds()),
+    max_entries=int(os.getenv('SESSION_CACHE_SIZE', '10000')),
+    sweep_interval=int(os.getenv('SESSION_SWEEP_INTERVAL', '60')),
+    # How long a worker trusts its cached copy before checking whether another worker rewrote it
+    validate_interval=float(os.getenv('SESSION_VALIDATE_INTERVAL', '1.0')),
+)
+app.session_interface = ServerSideSessionInterface(session_store)
 
 # Enable CORS for Live Server (port 5500)
-CORS(app, origins=['http://127.0.0.1:5500', 'http://localhost:5500', 'http://127.0.0.1:5000', 'http://localhost:5000'])
+CORS_ORIGINS = ['http://127.0.0.1:5500', 'http://localhost:5500', 'http://127.0.0.1:5000', 'http://localhost:5000']
+CORS(app, origins=CORS_ORIGINS)
 
 SPOTIFY_CLIENT_ID = os.getenv('SPOTIFY_CLIENT_ID')
 SPOTIFY_CLIENT_SECRET = os.getenv('SPOTIFY_CLIENT_SECRET')
@@ -41,61 +92,190 @@ SPOTIFY_CLIENT_SECRET = os.getenv('SPOTIFY_CLIENT_SECRET')
 REDIRECT_URI = os.getenv('REDIRECT_URI', 'http://127.0.0.1:5000/callback')
 SPOTIFY_SCOPE = 'playlist-modify-public playlist-modify-private user-read-private user-read-email user-library-read user-top-read'
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
-
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-1.5-flash')
+# Send Gemini calls to another host over REST, e.g. the fake backend in benchmarks/bench_e2e.py;
+# an http:// endpoint is called without TLS
+GEMINI_API_ENDPOINT = os.getenv('GEMINI_API_ENDPOINT')
+# One model per process, created on first use: the SDK import alone costs most of a second
+_gemini_model = None
+_gemini_lock = threading.Lock()
 
 SPOTIFY_AUTH_URL = 'https://accounts.spotify.com/authorize'
-SPOTIFY_TOKEN_URL = 'https://accounts.spotify.com/api/token'
-SPOTIFY_API_BASE = 'https://api.spotify.com/v1'
+SPOTIFY_TOKEN_URL = os.getenv('SPOTIFY_TOKEN_URL', 'https://accounts.spotify.com/api/token')
+SPOTIFY_API_BASE = os.getenv('SPOTIFY_API_BASE', 'https://api.spotify.com/v1')
 
-# File to persist OAuth states (development helper) to avoid relying on browser session cookies
-STATES_FILE = os.path.join(current_dir, '.oauth_states.json')
+# Per-stage latency histograms and upstream status counters, rendered for Prometheus at /metrics
+metrics = MetricsRegistry()
+stage_seconds = metrics.histogram('moodify_stage_seconds', 'Time spent in each stage of a request', ['stage'])
+request_seconds = metrics.histogram('moodify_http_request_seconds', 'Time to serve a request, by route', ['endpoint'])
+http_responses = metrics.counter('moodify_http_responses_total', 'Responses served, by route and status',
+                                 ['endpoint', 'status'])
+upstream_responses = metrics.counter('moodify_upstream_responses_total',
+                                     'Spotify and Gemini call outcomes ("error" when no response came back)',
+                                     ['service', 'endpoint', 'status'])
 
-def _read_states():
+def record_spotify_response(url, status_code):
+    upstream_responses.inc('spotify', endpoint_for(url), status_code or 'error')
+
+# Every Spotify call is admitted by the scheduler: per-endpoint token buckets, a concurrency cap
+# that favours interactive calls over bulk playlist writes, and 429 Retry-After holds that the
+# SQLite backend shares with the other worker processes
+upstream_scheduler = UpstreamScheduler(
+    state=create_rate_state(
+        os.getenv('UPSTREAM_STATE_BACKEND', 'sqlite'),
+        path=os.getenv('UPSTREAM_STATE_DB', os.path.join(current_dir, '.upstream_state.db')),
+    ),
+    max_concurrency=int(os.getenv('UPSTREAM_MAX_CONCURRENCY', '32')),
+    rate=float(os.getenv('UPSTREAM_RATE', '20')),
+    burst=float(os.getenv('UPSTREAM_BURST', '40')),
+    rate_limits=parse_rate_limits(os.getenv('UPSTREAM_RATE_LIMITS', 'playlists-tracks=5:10')),
+    max_wait=float(os.getenv('UPSTREAM_MAX_WAIT', '30')),
+)
+
+# One keep-alive connection pool per Spotify host, shared by every request in this process
+spotify = SpotifyClient(
+    SPOTIFY_TOKEN_URL,
+    SPOTIFY_API_BASE,
+    pool_sizes=parse_pool_sizes(os.getenv('SPOTIFY_POOL_SIZES', 'accounts.spotify.com=4,api.spotify.com=20')),
+    timeout=(float(os.getenv('SPOTIFY_CONNECT_TIMEOUT', '3.05')), float(os.getenv('SPOTIFY_READ_TIMEOUT', '10'))),
+    scheduler=upstream_scheduler,
+    on_response=record_spotify_response,
+)
+SPOTIFY_PREWARM = os.getenv('SPOTIFY_PREWARM', 'false').lower() == 'true'
+
+# AI mood analyses keyed on normalized mood text, so repeat moods skip the Gemini round trip
+mood_cache = MoodCache(
+    max_entries=int(os.getenv('MOOD_CACHE_SIZE', '2048')),
+    ttl=int(os.getenv('MOOD_CACHE_TTL', '86400')),
+    path=os.getenv('MOOD_CACHE_FILE') or None,
+)
+# Near-duplicate moods ("feeling chill tonight" vs "chill night vibes") reuse a prior analysis;
+# a negation or opposite-valence word ("not sad", "upbeat" vs "sad") never matches
+mood_index = MoodSimilarityIndex(
+    threshold=float(os.getenv('MOOD_SIMILARITY_THRESHOLD', '0.8')),
+    max_entries=int(os.getenv('MOOD_INDEX_SIZE', '4096')),
+)
+# Weighted keyword engine for when Gemini is off or fails; terms and profiles live in a data file
+keyword_lexicon = MoodLexicon.load(os.getenv('MOOD_LEXICON_FILE', os.path.join(current_dir, 'mood_lexicon.json')))
+# Local classifier consulted before Gemini; only moods below the confidence threshold escalate.
+# Train it from the Gemini training log with: python backend/mood_classifier.py --help
+MOOD_CLASSIFIER_FILE = os.getenv('MOOD_CLASSIFIER_FILE', os.path.join(current_dir, '.mood_classifier.npz'))
+MOOD_CLASSIFIER_THRESHOLD = float(os.getenv('MOOD_CLASSIFIER_THRESHOLD', '0.7'))
+mood_classifier = None
+if os.path.exists(MOOD_CLASSIFIER_FILE):
     try:
-        if os.path.exists(STATES_FILE):
-            with open(STATES_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-    except Exception:
-        pass
-    return {}
+        mood_classifier = MoodClassifier.load(MOOD_CLASSIFIER_FILE)
+    except Exception as e:
+        logger.warning("Could not load mood classifier from %s: %s", MOOD_CLASSIFIER_FILE, e)
+# Every Gemini analysis is appended here as classifier training data (set empty to disable)
+MOOD_TRAINING_LOG = os.getenv('MOOD_TRAINING_LOG', os.path.join(current_dir, '.mood_training.jsonl'))
+training_log = TrainingLog(MOOD_TRAINING_LOG) if MOOD_TRAINING_LOG else None
+# /recommendations responses shared across users; stale entries are served while refreshing
+recommendation_cache = RecommendationCache(
+    max_entries=int(os.getenv('RECOMMENDATION_CACHE_SIZE', '1024')),
+    ttl=int(os.getenv('RECOMMENDATION_CACHE_TTL', '300')),
+    stale_ttl=int(os.getenv('RECOMMENDATION_CACHE_STALE_TTL', '3600')),
+)
 
-def _write_states(states):
+# Hot moods are analysed and fetched with the app token at startup and every WARM_MOODS_INTERVAL
+# seconds (0 warms once), along with the WARM_TRENDING_COUNT moods requested most lately
+trending_moods = TrendingMoods(half_life=int(os.getenv('TRENDING_HALF_LIFE', '3600')))
+mood_warmer = MoodWarmer(
+    lambda mood: warm_mood(mood),
+    os.getenv('WARM_MOODS', 'chill,happy,sad,workout,focus').split(','),
+    trending=trending_moods,
+    trending_count=int(os.getenv('WARM_TRENDING_COUNT', '5')),
+    min_trending_score=float(os.getenv('WARM_TRENDING_MIN_SCORE', '3')),
+    interval=int(os.getenv('WARM_MOODS_INTERVAL', '240')),
+)
+
+# Display metadata per track id, filled from /recommendations responses and batched /tracks lookups
+track_metadata_cache = TrackMetadataCache(
+    max_entries=int(os.getenv('TRACK_CACHE_SIZE', '10000')),
+    ttl=int(os.getenv('TRACK_CACHE_TTL', '86400')),
+    path=os.getenv('TRACK_CACHE_FILE') or None,
+)
+# "spotify" asks Spotify's /recommendations endpoint; "local" ranks the memory-mapped track catalog
+# (built with backend/track_catalog.py ingest) and only falls back to Spotify when it has no match
+RECOMMENDATION_ENGINE = os.getenv('RECOMMENDATION_ENGINE', 'spotify')
+TRACK_CATALOG_DIR = os.getenv('TRACK_CATALOG_DIR', os.path.join(current_dir, 'catalog'))
+RECOMMENDATION_LIMIT = 10
+track_catalog = None
+if RECOMMENDATION_ENGINE == 'local':
     try:
-        with open(STATES_FILE, 'w', encoding='utf-8') as f:
-            json.dump(states, f)
-    except Exception:
-        pass
+        track_catalog = TrackCatalog.load(TRACK_CATALOG_DIR)
+        logger.info("Loaded local track catalog: %d tracks", len(track_catalog))
+    except (OSError, ValueError) as e:
+        logger.warning("Could not load track catalog from %s, using Spotify recommendations: %s",
+                       TRACK_CATALOG_DIR, e)
+
+# "sequential" waits for Gemini and falls back to keywords on failure; "hedged" races the
+# keyword result (and its Spotify fetch) against Gemini and stops waiting after the budget
+MOOD_ANALYSIS_MODE = os.getenv('MOOD_ANALYSIS_MODE', 'sequential')
+MOOD_ANALYSIS_BUDGET_MS = int(os.getenv('MOOD_ANALYSIS_BUDGET_MS', '800'))
+# Gemini calls in flight per process; when all are busy requests skip the hedge and serve keywords
+MOOD_HEDGE_WORKERS = int(os.getenv('MOOD_HEDGE_WORKERS', '16'))
+# How long /api/recommendations/stream keeps the stream open for Gemini to refine the first batch
+MOOD_REFINE_TIMEOUT_MS = int(os.getenv('MOOD_REFINE_TIMEOUT_MS', '10000'))
+_hedge_executor = None
+_hedge_executor_pid = None
+_hedge_slots = None
+_hedge_lock = threading.Lock()
+# Which path served each recommendation request: cache, classifier, ai, keyword, keyword-timeout or keyword-busy
+mood_analysis_paths = Counter()
+
+# Refreshes user access tokens TOKEN_REFRESH_MARGIN seconds before they expire
+token_manager = TokenManager(
+    lambda refresh_token: refresh_access_token(refresh_token),
+    margin=int(os.getenv('TOKEN_REFRESH_MARGIN', '60')),
+)
+
+# App-level token for Spotify calls that don't act on behalf of a user (catalog, genres, warmers)
+app_tokens = ClientCredentialsProvider(
+    lambda: fetch_client_credentials_token(),
+    margin=int(os.getenv('TOKEN_REFRESH_MARGIN', '60')),
+)
+
+# Spotify accepts at most 100 URIs per add-tracks request
+PLAYLIST_CHUNK_SIZE = 100
+PLAYLIST_ADD_CONCURRENCY = int(os.getenv('PLAYLIST_ADD_CONCURRENCY', '4'))
+PLAYLIST_CHUNK_RETRIES = int(os.getenv('PLAYLIST_CHUNK_RETRIES', '3'))
+
+# Outstanding OAuth states live server-side so /callback doesn't depend on the browser session cookie.
+# The SQLite backend is shared by every worker process; "memory" is enough for a single process.
+oauth_states = create_state_store(
+    os.getenv('OAUTH_STATE_BACKEND', 'sqlite'),
+    path=os.getenv('OAUTH_STATE_DB', os.path.join(current_dir, '.oauth_states.db')),
+    ttl=int(os.getenv('OAUTH_STATE_TTL', '600')),
+    sweep_interval=int(os.getenv('OAUTH_STATE_SWEEP_INTERVAL', '60')),
+)
 
 def save_oauth_state(state):
-    import time
-    states = _read_states()
     try:
-        states[state] = {'ts': int(time.time())}
-        _write_states(states)
-        print(f"✅ Persisted oauth_state to file: {state}")
+        oauth_states.save(state)
+        logger.debug("Persisted oauth_state %s", state)
     except Exception as e:
-        print(f"⚠️ Failed to persist oauth_state: {e}")
+        logger.warning("Failed to persist oauth_state: %s", e)
 
 def pop_oauth_state(state):
-    states = _read_states()
     try:
-        if state in states:
-            del states[state]
-            _write_states(states)
-            print(f"✅ Removed persisted oauth_state: {state}")
+        if oauth_states.pop(state):
+            logger.debug("Removed persisted oauth_state %s", state)
             return True
     except Exception as e:
-        print(f"⚠️ Failed to pop oauth_state: {e}")
+        logger.warning("Failed to pop oauth_state: %s", e)
     return False
 
 
 @app.route('/debug/oauth-states')
 def debug_oauth_states():
-    """Return the persisted oauth states file contents for debugging"""
-    states = _read_states()
-    return jsonify({'states_file': STATES_FILE, 'states': states})
+    """Return the outstanding oauth states for debugging"""
+    return jsonify({
+        'backend': oauth_states.backend,
+        'ttl': oauth_states.ttl,
+        'count': len(oauth_states),
+        'states': oauth_states.items()
+    })
 
 @app.route('/')
 def index():
@@ -104,17 +284,15 @@ def index():
 
 @app.route('/login')
 def login():
-    print("🚀 Login route accessed")
     state = secrets.token_urlsafe(16)
-    # store state in both session (if possible) and server-side file for robustness
+    # store state in both session (if possible) and server-side store for robustness
     session['oauth_state'] = state
     try:
         save_oauth_state(state)
     except Exception:
-        print("⚠️  Could not persist oauth_state to file; continuing")
+        logger.warning("Could not persist oauth_state server-side; continuing")
     
-    print(f"🔑 OAuth state set: {state}")
-    print(f"🔗 Redirect URI: {REDIRECT_URI}")
+    logger.debug("Login: oauth state %s, redirect URI %s", state, REDIRECT_URI)
     
     params = {
         'client_id': SPOTIFY_CLIENT_ID,
@@ -126,19 +304,11 @@ def login():
     }
     
     auth_url = f"{SPOTIFY_AUTH_URL}?{urlencode(params)}"
-    print(f"🌐 Redirecting to: {auth_url[:100]}...")
     return redirect(auth_url)
 
 @app.route('/callback')
 def callback():
-    print("=" * 50)
-    print("🚀 OAUTH CALLBACK RECEIVED!")
-    print("=" * 50)
-    print(f"📥 Callback received with args: {dict(request.args)}")
-    print(f"📋 Session state: {session.get('oauth_state')}")
-    print(f"🌐 Request URL: {request.url}")
-    print(f"🔗 Request referrer: {request.referrer}")
-    print("=" * 50)
+    logger.debug("OAuth callback with args %s (referrer %s)", request.args.to_dict(), request.referrer)
     
     received_state = request.args.get('state')
     session_state = session.get('oauth_state')
@@ -149,90 +319,113 @@ def callback():
     except Exception:
         persisted_ok = False
     
-    print(f"🔍 State comparison:")
-    print(f"   Received: {received_state}")
-    print(f"   Session:  {session_state}")
+    logger.debug("OAuth state received %s, session %s, persisted %s", received_state, session_state, persisted_ok)
     
     # More flexible state validation - allow if either matches session OR if state was persisted server-side
     if received_state and session_state and received_state != session_state and not persisted_ok:
-        print("❌ State mismatch and not found in persisted states")
-        # In development we'll still warn but return explicit error to surface the issue
-        print("⚠️  WARNING: State mismatch detected and no persisted state found")
+        logger.warning("OAuth state mismatch and no persisted state found")
         return jsonify({'error': 'Invalid state parameter'}), 400
-    else:
-        if persisted_ok:
-            print("✅ State validated via persisted server-side store")
     
     auth_code = request.args.get('code')
     if not auth_code:
         error = request.args.get('error')
-        print(f"❌ No auth code: {error}")
+        logger.warning("OAuth callback without an auth code: %s", error)
         return jsonify({'error': f'Authorization failed: {error}'}), 400
     
     try:
-        print("🔄 Exchanging code for token...")
         token_data = exchange_code_for_token(auth_code)
         
-        # Store tokens in session
-        session['access_token'] = token_data['access_token']
+        # Fresh session id at login, so an id planted before the login can't ride on it
+        session.regenerate()
+        # Store tokens in session (with absolute expiry so they can be refreshed ahead of time)
         session['refresh_token'] = token_data.get('refresh_token')
-        session['token_expires_in'] = token_data.get('expires_in', 3600)
-        
-        print(f"✅ Token stored: {token_data['access_token'][:20]}...")
+        store_token(session, token_data)
         
         # Get user info
         user_info = get_user_profile(token_data['access_token'])
         session['user_id'] = user_info.get('id')
         session['display_name'] = user_info.get('display_name')
         
-        print(f"✅ User authenticated: {user_info.get('display_name')} ({user_info.get('id')})")
-        print(f"📋 Final session: {dict(session)}")
+        logger.info("User authenticated: %s", user_info.get('id'))
         
         # Redirect to mood input page (we'll create this later)
         return redirect('/mood')
         
     except Exception as e:
-        print(f"❌ Token exchange error: {str(e)}")
+        logger.error("Token exchange failed: %s", e)
         return jsonify({'error': f'Token exchange failed: {str(e)}'}), 500
 
+@stage_seconds.timed('token_exchange')
 def exchange_code_for_token(auth_code):
-    auth_string = f"{SPOTIFY_CLIENT_ID}:{SPOTIFY_CLIENT_SECRET}"
-    auth_bytes = auth_string.encode('utf-8')
-    auth_b64 = base64.b64encode(auth_bytes).decode('utf-8')
-    
-    headers = {
-        'Authorization': f'Basic {auth_b64}',
-        'Content-Type': 'application/x-www-form-urlencoded'
-    }
-    auth_string = f"{SPOTIFY_CLIENT_ID}:{SPOTIFY_CLIENT_SECRET}"
-    auth_bytes = auth_string.encode('utf-8')
-    auth_b64 = base64.b64encode(auth_bytes).decode('utf-8')
-    
-    # Prepare request
-    headers = {
-        'Authorization': f'Basic {auth_b64}',
-        'Content-Type': 'application/x-www-form-urlencoded'
-    }
-    
     data = {
         'grant_type': 'authorization_code',
         'code': auth_code,
         'redirect_uri': REDIRECT_URI
     }
     
-    response = requests.post(SPOTIFY_TOKEN_URL, headers=headers, data=data)
+    response = spotify.post(SPOTIFY_TOKEN_URL, headers=client_auth_headers(), data=data)
+    
+    if response.status_code != 200:
+        raise SpotifyAPIError(f'Token request failed: {response.text}', response.status_code)
+    
+    return response.json()
+
+@stage_seconds.timed('token_refresh')
+def refresh_access_token(refresh_token):
+    data = {
+        'grant_type': 'refresh_token',
+        'refresh_token': refresh_token
+    }
+    
+    response = spotify.post(SPOTIFY_TOKEN_URL, headers=client_auth_headers(), data=data)
+    
+    if response.status_code != 200:
+        raise SpotifyAPIError(f'Token refresh failed: {response.text}', response.status_code)
+    
+    return response.json()
+
+@stage_seconds.timed('app_token')
+def fetch_client_credentials_token():
+    response = spotify.post(SPOTIFY_TOKEN_URL, headers=client_auth_headers(),
+                            data={'grant_type': 'client_credentials'})
     
     if response.status_code != 200:
-        raise Exception(f'Token request failed: {response.text}')
+        raise SpotifyAPIError(f'Client credentials request failed: {response.text}', response.status_code)
     
     return response.json()
 
+def spotify_app_get(path, params=None):
+    """GET a Web API path with the cached app token, retrying once if it was revoked"""
+    for attempt in range(2):
+        token = app_tokens.token()
+        response = spotify.get(f'{SPOTIFY_API_BASE}{path}', headers={'Authorization': f'Bearer {token}'},
+                               params=params)
+        if response.status_code != 401:
+            break
+        app_tokens.invalidate(token)
+    
+    if response.status_code != 200:
+        raise spotify_api_error(response)
+    
+    return response.json()
+
+def client_auth_headers():
+    auth_string = f"{SPOTIFY_CLIENT_ID}:{SPOTIFY_CLIENT_SECRET}"
+    auth_bytes = auth_string.encode('utf-8')
+    auth_b64 = base64.b64encode(auth_bytes).decode('utf-8')
+    
+    return {
+        'Authorization': f'Basic {auth_b64}',
+        'Content-Type': 'application/x-www-form-urlencoded'
+    }
+
+@stage_seconds.timed('profile_fetch')
 def get_user_profile(access_token):
     headers = {'Authorization': f'Bearer {access_token}'}
-    response = requests.get(f'{SPOTIFY_API_BASE}/me', headers=headers)
+    response = spotify.get(f'{SPOTIFY_API_BASE}/me', headers=headers)
     
     if response.status_code != 200:
-        raise Exception(f'Failed to get user profile: {response.text}')
+        raise SpotifyAPIError(f'Failed to get user profile: {response.text}', response.status_code)
     
     return response.json()
 
@@ -267,9 +460,8 @@ def simple_test():
     
     # Test 1: Get user profile (should always work)
     try:
-        print("🧪 Testing /me endpoint...")
-        response = requests.get('https://api.spotify.com/v1/me', headers=headers)
-        print(f"📊 /me status: {response.status_code}")
+        response = spotify.get(f'{SPOTIFY_API_BASE}/me', headers=headers)
+        logger.debug("Simple test /me status: %s", response.status_code)
         
         if response.status_code == 200:
             user_data = response.json()
@@ -290,11 +482,9 @@ def simple_test():
     
     # Test 2: Try recommendations API
     try:
-        print("🧪 Testing recommendations endpoint...")
         params = {'limit': 5, 'seed_genres': 'pop'}
-        response = requests.get('https://api.spotify.com/v1/recommendations', headers=headers, params=params)
-        print(f"📊 Recommendations status: {response.status_code}")
-        print(f"📄 Response: {response.text[:300]}...")
+        response = spotify.get(f'{SPOTIFY_API_BASE}/recommendations', headers=headers, params=params)
+        logger.debug("Simple test /recommendations status: %s", response.status_code)
         
         if response.status_code == 200:
             data = response.json()
@@ -313,37 +503,256 @@ def simple_test():
     
     return jsonify(results)
 
+def login_required_response():
+    return jsonify({
+        'error': 'Please log in with Spotify first',
+        'redirect': '/login'
+    }), 401
+
 @app.route('/api/recommendations')
 def get_recommendations():
-    print(f"Session contents: {dict(session)}")  # Debug session
-    
     if 'access_token' not in session:
-        return jsonify({
-            'error': 'Please log in with Spotify first',
-            'redirect': '/login'
-        }), 401
+        return login_required_response()
     
     mood = request.args.get('mood')
     if not mood:
         return jsonify({'error': 'Mood parameter required'}), 400
     
-    print(f"Getting recommendations for mood: {mood}")  # Debug
+    logger.debug("Getting recommendations for mood: %s", mood)
+    trending_moods.record(mood)
     
     try:
-        tracks = get_spotify_recommendations(session['access_token'], mood)
+        tracks, served_by = token_manager.call(session, lambda token: recommend_for_mood(token, mood))
         return jsonify({
             'mood': mood,
-            'tracks': tracks
+            'tracks': tracks,
+            'served_by': served_by
         })
+    except SpotifyAPIError as e:
+        logger.error("Error getting recommendations: %s", e)
+        if e.status_code == 401:
+            # Still unauthorized after a refresh (or nothing to refresh with)
+            return login_required_response()
+        return jsonify({'error': str(e)}), 500
     except Exception as e:
-        print(f"Error getting recommendations: {str(e)}")  # Debug
+        logger.error("Error getting recommendations: %s", e)
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/recommendations/stream')
+def stream_recommendations():
+    """Server-sent events: the mood analysis, each track, then an AI-refined batch if Gemini answers later"""
+    if 'access_token' not in session:
+        return login_required_response()
+    
+    mood = request.args.get('mood')
+    if not mood:
+        return jsonify({'error': 'Mood parameter required'}), 400
+    
+    trending_moods.record(mood)
+    # The session is saved before the body streams, so any token refresh has to happen now
+    try:
+        access_token = token_manager.access_token(session)
+    except SpotifyAPIError as e:
+        logger.error("Error refreshing token for recommendation stream: %s", e)
+        # Spotify answers a revoked refresh token with 400 invalid_grant
+        if e.status_code in (400, 401):
+            return login_required_response()
+        return jsonify({'error': str(e)}), 500
+    except Exception as e:
+        logger.error("Error refreshing token for recommendation stream: %s", e)
+        return jsonify({'error': str(e)}), 500
+    return Response(stream_with_context(recommendation_events(access_token, mood)),
+                    content_type='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def recommendation_events(access_token, mood):
+    """Yield SSE messages as each piece is ready: mood, track (one per track), refined, done or failure.
+    
+    A mood without a cached or classifier analysis is served from the keyword
+    analysis first while Gemini runs; if Gemini answers within
+    MOOD_REFINE_TIMEOUT_MS its recommendations follow as one refined batch.
+    """
+    started = time.perf_counter()
+    try:
+        ai_future = None
+        known = local_mood_analysis(mood)
+        if known is not None:
+            mood_params, served_by = known
+        else:
+            if GEMINI_API_KEY:
+                ai_future = submit_ai_mood_analysis(mood)
+            mood_params, served_by = keyword_mood_params(mood), 'keyword'
+        record_mood_path(served_by)
+        yield sse_event('mood', {'mood': mood, 'params': mood_params, 'served_by': served_by,
+                                 'refining': ai_future is not None})
+        
+        tracks = recommendations_for_params(access_token, mood_params)
+        if tracks:
+            stage_seconds.observe(time.perf_counter() - started, 'stream_first_track')
+        for track in tracks:
+            yield sse_event('track', track)
+        
+        if ai_future is not None:
+            try:
+                ai_params = ai_future.result(timeout=MOOD_REFINE_TIMEOUT_MS / 1000)
+            except FutureTimeoutError:
+                logger.debug("Gemini missed the %dms refine window for %r", MOOD_REFINE_TIMEOUT_MS, mood)
+                ai_params = None
+            if ai_params:
+                yield sse_event('refined', {'params': ai_params,
+                                            'tracks': recommendations_for_params(access_token, ai_params)})
+                served_by = 'ai'
+        
+        yield sse_event('done', {'served_by': served_by})
+    except Exception as e:
+        # Named "failure" because EventSource reserves "error" for connection errors
+        logger.error("Error streaming recommendations: %s", e)
+        yield sse_event('failure', {'error': str(e)})
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {app.json.dumps(data)}\n\n"
+
 def get_spotify_recommendations(access_token, mood):
-    headers = {'Authorization': f'Bearer {access_token}'}
+    return recommend_for_mood(access_token, mood)[0]
+
+def recommend_for_mood(access_token, mood):
+    """Return (tracks, served_by) where served_by names the mood analysis path used"""
+    if MOOD_ANALYSIS_MODE == 'hedged' and GEMINI_API_KEY:
+        known = local_mood_analysis(mood)
+        if known is None:
+            tracks, served_by = hedged_recommendations(access_token, mood)
+            record_mood_path(served_by)
+            return tracks, served_by
+        mood_params, served_by = known
+    else:
+        mood_params, served_by = analyze_mood(mood)
+    
+    record_mood_path(served_by)
+    return recommendations_for_params(access_token, mood_params), served_by
+
+def recommendations_for_params(access_token, mood_params):
+    if track_catalog is not None:
+        tracks = local_recommendations(mood_params)
+        if tracks:
+            return tracks
+    
+    params = build_recommendation_params(mood_params)
     
-    mood_params = parse_mood_to_spotify_params(mood)
+    # Responses are shared across users: identical params are served from cache
+    return recommendation_cache.get(params, lambda p: fetch_spotify_recommendations(access_token, p))
+
+def warm_mood(mood):
+    """Cache a mood's analysis and recommendations using the app token, refreshing ones already cached"""
+    mood_params, _ = analyze_mood(mood)
+    if track_catalog is not None and local_recommendations(mood_params):
+        return
     
+    params = build_recommendation_params(mood_params)
+    token = app_tokens.token()
+    try:
+        tracks = fetch_spotify_recommendations(token, params)
+    except SpotifyAPIError as e:
+        if e.status_code == 401:
+            app_tokens.invalidate(token)
+        raise
+    recommendation_cache.put(params, tracks)
+
+@stage_seconds.timed('local_recommendations')
+def local_recommendations(mood_params):
+    """Rank the local catalog against the mood; returns [] so callers can fall back to Spotify"""
+    track_ids = track_catalog.search(mood_params.get('audio_features', {}), mood_params.get('genres'),
+                                     k=RECOMMENDATION_LIMIT)
+    if not track_ids:
+        return []
+    try:
+        return fetch_track_metadata(track_ids)
+    except (SpotifyAPIError, requests.RequestException) as e:
+        logger.warning("Track metadata lookup failed, falling back to Spotify recommendations: %s", e)
+        return []
+
+def fetch_track_metadata(track_ids):
+    """Display metadata for track ids, served from the track cache where possible"""
+    return track_metadata_cache.get_many(track_ids, fetch_track_batch)
+
+@stage_seconds.timed('track_metadata_fetch')
+def fetch_track_batch(track_ids):
+    """Fetch up to 50 tracks with one /tracks call; returns {track_id: track}"""
+    data = spotify_app_get('/tracks', {'ids': ','.join(track_ids), 'market': 'US'})
+    # Unknown or unavailable ids come back as null
+    tracks = extract_tracks({'tracks': [track for track in data.get('tracks', []) if track]})
+    return {track.id: track for track in tracks}
+
+def hedged_recommendations(access_token, mood):
+    """Race Gemini against the keyword analysis, giving Gemini MOOD_ANALYSIS_BUDGET_MS to answer.
+    
+    The keyword result is fetched on the request thread while Gemini runs, so it
+    never waits behind slow Gemini calls for a pool slot; when every slot is
+    taken the hedge is skipped and the keyword result served straight away.
+    """
+    deadline = time.monotonic() + MOOD_ANALYSIS_BUDGET_MS / 1000
+    ai_future = submit_ai_mood_analysis(mood)
+    fallback_error = None
+    try:
+        fallback_tracks = recommendations_for_params(access_token, keyword_mood_params(mood))
+    except Exception as e:
+        fallback_tracks, fallback_error = None, e
+    
+    if ai_future is None:
+        logger.debug("All %d Gemini slots are busy, serving keyword result", MOOD_HEDGE_WORKERS)
+        ai_params = None
+        served_by = 'keyword-busy'
+    else:
+        try:
+            ai_params = ai_future.result(timeout=max(0.0, deadline - time.monotonic()))
+            served_by = 'keyword'
+        except FutureTimeoutError:
+            logger.debug("Gemini missed the %dms budget, serving keyword result", MOOD_ANALYSIS_BUDGET_MS)
+            ai_params = None
+            served_by = 'keyword-timeout'
+    
+    if ai_params:
+        logger.debug("AI analysis: %s", ai_params)
+        return recommendations_for_params(access_token, ai_params), 'ai'
+    if fallback_error is not None:
+        raise fallback_error
+    return fallback_tracks, served_by
+
+def submit_ai_mood_analysis(mood):
+    """Start a Gemini analysis on the hedge executor; None if MOOD_HEDGE_WORKERS are already in flight"""
+    executor = get_hedge_executor()
+    slots = _hedge_slots
+    # Calls that missed their budget keep running, so a new one must never queue behind them
+    if not slots.acquire(blocking=False):
+        return None
+    try:
+        future = executor.submit(get_ai_mood_analysis, mood)
+    except BaseException:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    # A late Gemini answer still lands in the cache so the next request for this mood is fast
+    future.add_done_callback(lambda future: _remember_late_analysis(mood, future))
+    return future
+
+def _remember_late_analysis(mood, future):
+    if not future.cancelled() and future.exception() is None and future.result():
+        remember_mood_analysis(mood, future.result())
+
+def get_hedge_executor():
+    global _hedge_executor, _hedge_executor_pid, _hedge_slots
+    with _hedge_lock:
+        # Executor threads don't survive a fork; each worker process starts its own (and its own slots)
+        if _hedge_executor is None or _hedge_executor_pid != os.getpid():
+            _hedge_executor = ThreadPoolExecutor(max_workers=MOOD_HEDGE_WORKERS, thread_name_prefix='mood-hedge')
+            _hedge_slots = threading.BoundedSemaphore(MOOD_HEDGE_WORKERS)
+            _hedge_executor_pid = os.getpid()
+        return _hedge_executor
+
+def record_mood_path(served_by):
+    with _hedge_lock:
+        mood_analysis_paths[served_by] += 1
+
+def build_recommendation_params(mood_params):
     # Spotify API requires seed parameters - use only validated genres
     valid_spotify_genres = [
         'acoustic', 'afrobeat', 'alt-rock', 'alternative', 'ambient', 'blues', 'bossanova', 
@@ -366,7 +775,7 @@ def get_spotify_recommendations(access_token, mood):
     
     # Build parameters with market (required for some regions)
     params = {
-        'limit': 10,  # Reduced for reliability
+        'limit': RECOMMENDATION_LIMIT,  # Reduced for reliability
         'seed_genres': ','.join(genres[:3]),  # Reduced to 3 genres max
         'market': 'US'  # Add market parameter to prevent 404
     }
@@ -375,106 +784,149 @@ def get_spotify_recommendations(access_token, mood):
     if 'energy' in audio_features:
         params['target_energy'] = round(audio_features['energy'], 1)  # Round to 1 decimal
     
-    print(f"🎵 Spotify API Request: {SPOTIFY_API_BASE}/recommendations")
-    print(f"📋 Params: {params}")
-    print(f"🔑 Headers: Authorization Bearer {access_token[:20]}...")
-    
-    response = requests.get(f'{SPOTIFY_API_BASE}/recommendations', headers=headers, params=params)
+    return params
+
+@stage_seconds.timed('spotify_recommendations')
+def fetch_spotify_recommendations(access_token, params):
+    headers = {'Authorization': f'Bearer {access_token}'}
     
-    print(f"📊 Spotify API Response: {response.status_code}")
+    response = spotify.get(f'{SPOTIFY_API_BASE}/recommendations', headers=headers, params=params)
+    logger.debug("Spotify /recommendations %s: %s", params, response.status_code)
     
     # If primary request fails, try with ultra-minimal params
     if response.status_code == 404:
-        print("🔄 Retrying with minimal parameters...")
+        logger.debug("Retrying /recommendations with minimal parameters")
         minimal_params = {
             'limit': 5,
             'seed_genres': 'pop',
             'market': 'US'
         }
-        response = requests.get(f'{SPOTIFY_API_BASE}/recommendations', headers=headers, params=minimal_params)
-        print(f"📊 Retry Response: {response.status_code}")
+        response = spotify.get(f'{SPOTIFY_API_BASE}/recommendations', headers=headers, params=minimal_params)
+        logger.debug("Spotify /recommendations retry: %s", response.status_code)
     
     if response.status_code != 200:
-        error_details = response.text
-        try:
-            error_json = response.json()
-            error_details = f"Status: {response.status_code}, Error: {error_json}"
-        except:
-            pass
-        print(f"❌ Spotify API Error: {error_details}")
-        raise Exception(f'Spotify API Error ({response.status_code}): {error_details}')
-    
-    data = response.json()
-    tracks = []
-    
-    for track in data.get('tracks', []):
-        tracks.append({
-            'id': track['id'],
-            'name': track['name'],
-            'artist': ', '.join([artist['name'] for artist in track['artists']]),
-            'album': track['album']['name'],
-            'image': track['album']['images'][0]['url'] if track['album']['images'] else None,
-            'preview_url': track.get('preview_url'),
-            'external_url': track['external_urls']['spotify']
-        })
+        raise spotify_api_error(response)
     
+    tracks = extract_tracks(loads_json(response.content))
+    track_metadata_cache.put_many(tracks)
     return tracks
 
+def spotify_api_error(response):
+    error_details = response.text
+    try:
+        error_json = response.json()
+        error_details = f"Status: {response.status_code}, Error: {error_json}"
+    except:
+        pass
+    logger.warning("Spotify API error: %s", error_details)
+    return SpotifyAPIError(f'Spotify API Error ({response.status_code}): {error_details}', response.status_code)
+
+def extract_tracks(data):
+    return [Track.from_spotify(track) for track in data.get('tracks', [])]
+
 def parse_mood_to_spotify_params(mood):
-    print(f"🧠 Parsing mood: {mood}")
+    return analyze_mood(mood)[0]
+
+def analyze_mood(mood):
+    """Return (mood_params, source) where source is cache, classifier, ai or keyword"""
+    logger.debug("Parsing mood: %s", mood)
+    
+    known = local_mood_analysis(mood)
+    if known is not None:
+        return known
     
     try:
         ai_params = get_ai_mood_analysis(mood)
         if ai_params:
-            print(f"✅ AI analysis successful: {ai_params}")
-            return ai_params
+            logger.debug("AI analysis: %s", ai_params)
+            remember_mood_analysis(mood, ai_params)
+            return ai_params, 'ai'
         else:
-            print("⚠️ AI analysis returned None")
+            logger.debug("AI analysis returned nothing, using keywords")
     except Exception as e:
-        print(f"❌ AI analysis failed: {str(e)}")
-        pass
+        logger.warning("AI analysis failed: %s", e)
     
-    mood_lower = mood.lower()
+    return keyword_mood_params(mood), 'keyword'
+
+@stage_seconds.timed('local_analysis')
+def local_mood_analysis(mood):
+    """Return (mood_params, source) from the caches or a confident classifier, or None"""
+    cached = lookup_mood_analysis(mood)
+    if cached is not None:
+        return cached, 'cache'
     
-    if any(word in mood_lower for word in ['chill', 'calm', 'relax', 'peaceful']):
-        return {
-            'genres': ['ambient', 'chill', 'new-age'],
-            'audio_features': {'valence': 0.3, 'energy': 0.2, 'danceability': 0.3}
-        }
-    elif any(word in mood_lower for word in ['happy', 'upbeat', 'energetic', 'party']):
-        return {
-            'genres': ['pop', 'dance', 'disco'],
-            'audio_features': {'valence': 0.8, 'energy': 0.8, 'danceability': 0.7}
-        }
-    elif any(word in mood_lower for word in ['sad', 'melancholy', 'depressed', 'blue']):
-        return {
-            'genres': ['indie', 'alternative', 'blues'],
-            'audio_features': {'valence': 0.2, 'energy': 0.3, 'danceability': 0.2}
-        }
-    elif any(word in mood_lower for word in ['workout', 'gym', 'exercise', 'run']):
-        return {
-            'genres': ['hip-hop', 'electronic', 'techno'],
-            'audio_features': {'valence': 0.7, 'energy': 0.9, 'danceability': 0.8}
-        }
-    elif any(word in mood_lower for word in ['focus', 'study', 'concentration']):
-        return {
-            'genres': ['ambient', 'classical', 'electronic'],
-            'audio_features': {'valence': 0.4, 'energy': 0.3, 'danceability': 0.2}
-        }
-    else:
-        return {
-            'genres': ['pop'],
-            'audio_features': {'valence': 0.5, 'energy': 0.5, 'danceability': 0.5}
-        }
+    if mood_classifier is not None:
+        params, confidence = mood_classifier.predict(mood)
+        if params and confidence >= MOOD_CLASSIFIER_THRESHOLD:
+            logger.debug("Local classifier analysis (confidence %.2f): %s", confidence, params)
+            return params, 'classifier'
+    
+    return None
+
+def lookup_mood_analysis(mood):
+    """Return a cached AI analysis for this mood (or a near-duplicate of it), or None"""
+    cached = mood_cache.get(mood)
+    if cached is not None:
+        logger.debug("Mood analysis cache hit: %s", cached)
+        return cached
+    
+    similar = mood_index.lookup(mood)
+    if similar:
+        score, matched_mood, params = similar
+        logger.debug("Reusing analysis of similar mood %r (similarity %.2f)", matched_mood, score)
+        mood_cache.put(mood, params)
+        return params
+    
+    return None
+
+def remember_mood_analysis(mood, ai_params):
+    mood_cache.put(mood, ai_params)
+    mood_index.add(mood, ai_params)
+    if training_log is not None:
+        try:
+            training_log.record(mood, ai_params)
+        except OSError as e:
+            logger.warning("Failed to log mood analysis for training: %s", e)
+
+@stage_seconds.timed('keyword_analysis')
+def keyword_mood_params(mood):
+    return keyword_lexicon.analyze(mood)
+
+def get_gemini_model():
+    """Return the process-wide Gemini model, importing and configuring the SDK on first use"""
+    global _gemini_model
+    model = _gemini_model
+    if model is None:
+        with _gemini_lock:
+            if _gemini_model is None:
+                import google.generativeai as genai
+                if GEMINI_API_ENDPOINT:
+                    genai.configure(api_key=GEMINI_API_KEY, transport='rest',
+                                    client_options={'api_endpoint': GEMINI_API_ENDPOINT})
+                else:
+                    genai.configure(api_key=GEMINI_API_KEY)
+                _gemini_model = genai.GenerativeModel(GEMINI_MODEL)
+            model = _gemini_model
+    return model
 
 def get_ai_mood_analysis(mood):
     if not GEMINI_API_KEY:
         return None
     
     try:
-        model = genai.GenerativeModel('gemini-1.5-flash')
+        with stage_seconds.time('gemini_analysis'):
+            response = get_gemini_model().generate_content(build_mood_prompt(mood))
+            params = parse_ai_mood_response(response.text)
+        upstream_responses.inc('gemini', 'generate_content', 'ok')
+        return params
         
-        prompt = f"""
+    except Exception as e:
+        upstream_responses.inc('gemini', 'generate_content', 'error')
+        logger.warning("AI mood analysis failed: %s", e)
+        return None
+
+def build_mood_prompt(mood):
+    return f"""
         Analyze this mood description and return ONLY a JSON object with Spotify audio features and genres.
         
         Mood: "{mood}"
@@ -495,22 +947,17 @@ def get_ai_mood_analysis(mood):
         Energy: 0.0 = calm/peaceful, 1.0 = energetic/intense  
         Danceability: 0.0 = not danceable, 1.0 = very danceable
         """
-        
-        response = model.generate_content(prompt)
-        text = response.text.strip()
-        
-        if text.startswith('```json'):
-            text = text[7:]
-        if text.endswith('```'):
-            text = text[:-3]
-        text = text.strip()
-        
-        parsed = json.loads(text)
-        return parsed
-        
-    except Exception as e:
-        print(f"AI mood analysis failed: {e}")
-        return None
+
+def parse_ai_mood_response(text):
+    text = text.strip()
+    
+    if text.startswith('```json'):
+        text = text[7:]
+    if text.endswith('```'):
+        text = text[:-3]
+    text = text.strip()
+    
+    return json.loads(text)
 
 @app.route('/api/create_playlist', methods=['POST'])
 def create_playlist():
@@ -524,15 +971,29 @@ def create_playlist():
     if not mood or not track_ids:
         return jsonify({'error': 'Mood and track_ids required'}), 400
     
+    def report_progress(chunks_done, chunks_total, tracks_added):
+        logger.debug("Playlist chunk %d/%d added (%d/%d tracks)", chunks_done, chunks_total, tracks_added,
+                     len(track_ids))
+    
+    # Chunks may go out on pool threads, which can't resolve the request-bound session proxy
+    user_session = session._get_current_object()
+    
     try:
-        playlist = create_spotify_playlist(session['access_token'], session['user_id'], mood, track_ids)
+        playlist = create_spotify_playlist(
+            lambda fn: token_manager.call(user_session, fn), user_session['user_id'], mood, track_ids,
+            preserve_order=data.get('preserve_order', True),
+            on_progress=report_progress)
         return jsonify(playlist)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-def create_spotify_playlist(access_token, user_id, mood, track_ids):
-    headers = {'Authorization': f'Bearer {access_token}', 'Content-Type': 'application/json'}
+def create_spotify_playlist(with_token, user_id, mood, track_ids, preserve_order=True, on_progress=None):
+    """Create a playlist and fill it with track_ids.
     
+    with_token(fn) runs fn(access_token) for a single Spotify request (e.g.
+    TokenManager.call), so a 401 refreshes the token and retries only that
+    request: creating the playlist is not idempotent and must never be repeated.
+    """
     playlist_name = f"{mood.title()} Vibes"
     
     playlist_data = {
@@ -541,31 +1002,155 @@ def create_spotify_playlist(access_token, user_id, mood, track_ids):
         'public': False
     }
     
-    response = requests.post(f'{SPOTIFY_API_BASE}/users/{user_id}/playlists', 
-                           headers=headers, json=playlist_data)
-    
-    if response.status_code != 201:
-        raise Exception(f'Failed to create playlist: {response.text}')
-    
-    playlist = response.json()
+    with stage_seconds.time('playlist_create'):
+        playlist = with_token(lambda token: post_new_playlist(token, user_id, playlist_data))
     playlist_id = playlist['id']
     
     track_uris = [f'spotify:track:{track_id}' for track_id in track_ids]
-    tracks_data = {'uris': track_uris}
-    
-    response = requests.post(f'{SPOTIFY_API_BASE}/playlists/{playlist_id}/tracks',
-                           headers=headers, json=tracks_data)
-    
-    if response.status_code != 201:
-        raise Exception(f'Failed to add tracks to playlist: {response.text}')
+    tracks_added = add_tracks_to_playlist(with_token, playlist_id, track_uris,
+                                          preserve_order=preserve_order, on_progress=on_progress)
     
     return {
         'id': playlist_id,
         'name': playlist_name,
         'url': playlist['external_urls']['spotify'],
-        'tracks_added': len(track_ids)
+        'tracks_added': tracks_added,
+        'chunks': -(-len(track_uris) // PLAYLIST_CHUNK_SIZE)
     }
 
+def playlist_headers(access_token):
+    return {'Authorization': f'Bearer {access_token}', 'Content-Type': 'application/json'}
+
+def post_new_playlist(access_token, user_id, playlist_data):
+    response = spotify.post(f'{SPOTIFY_API_BASE}/users/{user_id}/playlists',
+                            headers=playlist_headers(access_token), json=playlist_data, priority=BULK)
+    
+    if response.status_code != 201:
+        raise SpotifyAPIError(f'Failed to create playlist: {response.text}', response.status_code)
+    
+    return response.json()
+
+@stage_seconds.timed('playlist_add_tracks')
+def add_tracks_to_playlist(with_token, playlist_id, track_uris, preserve_order=True,
+                           max_in_flight=None, on_progress=None):
+    """Add any number of tracks in chunks of PLAYLIST_CHUNK_SIZE, retrying each chunk.
+    
+    Spotify appends concurrent inserts into one playlist in whatever order they
+    arrive, so chunks only go out concurrently (up to max_in_flight) when
+    preserve_order is False. Ordered writes are sent back to back over the pooled
+    keep-alive connection. on_progress(chunks_done, chunks_total, tracks_added) is
+    called after every chunk. Each chunk goes through with_token (see
+    create_spotify_playlist), so a 401 retries that chunk alone.
+    """
+    chunks = [track_uris[i:i + PLAYLIST_CHUNK_SIZE] for i in range(0, len(track_uris), PLAYLIST_CHUNK_SIZE)]
+    progress = {'chunks': 0, 'tracks': 0}
+    progress_lock = threading.Lock()
+    
+    def send(chunk):
+        try:
+            with_token(lambda token: post_playlist_chunk(token, playlist_id, chunk))
+        except SpotifyAPIError as e:
+            raise SpotifyAPIError(f"{e} ({progress['tracks']} of {len(track_uris)} tracks were added)", e.status_code)
+        with progress_lock:
+            progress['chunks'] += 1
+            progress['tracks'] += len(chunk)
+            if on_progress:
+                on_progress(progress['chunks'], len(chunks), progress['tracks'])
+    
+    workers = 1 if preserve_order else min(max_in_flight or PLAYLIST_ADD_CONCURRENCY, len(chunks))
+    if workers <= 1:
+        for chunk in chunks:
+            send(chunk)
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='playlist-add') as pool:
+            list(pool.map(send, chunks))
+    
+    return progress['tracks']
+
+def post_playlist_chunk(access_token, playlist_id, uris):
+    headers = playlist_headers(access_token)
+    # 429s are held and requeued by the upstream scheduler; only server errors are retried here
+    for attempt in range(PLAYLIST_CHUNK_RETRIES + 1):
+        response = spotify.post(f'{SPOTIFY_API_BASE}/playlists/{playlist_id}/tracks',
+                                headers=headers, json={'uris': uris}, priority=BULK)
+        
+        if response.status_code == 201:
+            return response.json()
+        if response.status_code not in (500, 502, 503, 504) or attempt == PLAYLIST_CHUNK_RETRIES:
+            break
+        
+        delay = 0.5 * 2 ** attempt
+        logger.info("Retrying playlist chunk in %.1fs (status %s)", delay, response.status_code)
+        time.sleep(delay)
+    
+    raise SpotifyAPIError(f'Failed to add tracks to playlist: {response.text}', response.status_code)
+
+@app.route('/debug/cache-stats')
+def cache_stats():
+    """Return hit/miss counters for the in-process caches"""
+    return jsonify({
+        'mood_cache': mood_cache.stats(),
+        'mood_index': mood_index.stats(),
+        'recommendation_cache': recommendation_cache.stats(),
+        'track_metadata_cache': track_metadata_cache.stats(),
+        'mood_analysis_paths': dict(mood_analysis_paths),
+        'token_manager': token_manager.stats(),
+        'app_token': app_tokens.stats(),
+        'upstream': upstream_scheduler.stats(),
+        'sessions': session_store.stats(),
+        'mood_warmer': mood_warmer.stats()
+    })
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape endpoint for this process"""
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+@metrics.collector
+def collect_component_metrics():
+    """Counters the caches and token managers already keep, read at scrape time"""
+    caches = {
+        'mood': mood_cache.stats(),
+        'recommendation': recommendation_cache.stats(),
+        'track_metadata': track_metadata_cache.stats(),
+        'session': session_store.stats(),
+    }
+    index = mood_index.stats()
+    yield ('moodify_cache_hits_total', 'counter', 'Cache lookups served from the cache',
+           [({'cache': name}, stats['hits']) for name, stats in caches.items()]
+           + [({'cache': 'recommendation_stale'}, caches['recommendation']['stale_hits']),
+              ({'cache': 'mood_index'}, index['matches'])])
+    yield ('moodify_cache_misses_total', 'counter', 'Cache lookups that fell through',
+           [({'cache': name}, stats['misses']) for name, stats in caches.items()]
+           + [({'cache': 'mood_index'}, index['lookups'] - index['matches'])])
+    yield ('moodify_cache_entries', 'gauge', 'Entries currently held',
+           [({'cache': name}, stats['entries']) for name, stats in caches.items()]
+           + [({'cache': 'mood_index'}, index['entries'])])
+    with _hedge_lock:
+        paths = dict(mood_analysis_paths)
+    yield ('moodify_mood_analysis_total', 'counter', 'Recommendation requests by mood analysis path',
+           [({'path': path}, count) for path, count in paths.items()])
+    tokens = token_manager.stats()
+    yield ('moodify_mood_warms_total', 'counter', 'Hot mood warm-ups by outcome',
+           [({'outcome': 'ok'}, mood_warmer.warmed), ({'outcome': 'error'}, mood_warmer.failures)])
+    yield ('moodify_token_refreshes_total', 'counter', 'User access token refreshes sent to Spotify',
+           [({}, tokens['refreshes'])])
+    yield ('moodify_token_refresh_waits_total', 'counter', 'Requests that waited on a refresh already in flight',
+           [({}, tokens['shared_refreshes'])])
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.endpoint or 'unmatched'
+    started = g.get('request_started')
+    if started is not None:
+        request_seconds.observe(time.perf_counter() - started, endpoint)
+    http_responses.inc(endpoint, response.status_code)
+    return response
+
 @app.route('/debug/simulate-login')
 def simulate_login():
     """Simulate login for testing purposes - DO NOT USE IN PRODUCTION"""
@@ -605,8 +1190,43 @@ def force_oauth():
         'user_id': session['user_id']
     })
 
+def reinit_after_fork():
+    """Replace process-local state a forked worker must not share with its parent"""
+    # Pooled sockets inherited from the parent would be shared by two processes
+    spotify.reset()
+    # The log listener thread did not survive the fork
+    configure_logging()
+    # gRPC channels are not fork-safe; the worker builds its own model
+    global _gemini_model
+    _gemini_model = None
+
+def warm_worker():
+    """Get a worker ready before it accepts traffic: upstream connections, app token, Gemini model, catalog pages"""
+    started = time.perf_counter()
+    opened = spotify.warm()
+    if GEMINI_API_KEY:
+        get_gemini_model()
+    if SPOTIFY_CLIENT_ID and SPOTIFY_CLIENT_SECRET:
+        try:
+            app_tokens.token()
+        except (SpotifyAPIError, requests.RequestException) as e:
+            logger.warning("Could not fetch the app token while warming: %s", e)
+    if track_catalog is not None:
+        # An unfiltered search reads every feature row, paging in the memory-mapped catalog
+        track_catalog.search({'energy': 0.5}, k=1)
+    logger.info("Worker %d warmed in %.0fms (%d Spotify connections)", os.getpid(),
+                (time.perf_counter() - started) * 1000, opened)
+
+def start_mood_warmer():
+    """Start warming hot moods in this process, if there are credentials for an app token"""
+    if SPOTIFY_CLIENT_ID and SPOTIFY_CLIENT_SECRET and (mood_warmer.moods or mood_warmer.trending_count):
+        mood_warmer.start()
+
 if __name__ == '__main__':
-    print("Starting Moodify server...")
-    print(f"Spotify Client ID: {SPOTIFY_CLIENT_ID[:8]}...")
-    print(f"Redirect URI: {REDIRECT_URI}")
+    logger.info("Starting Moodify server (redirect URI %s)", REDIRECT_URI)
+    if SPOTIFY_PREWARM:
+        logger.info("Pre-warmed %d Spotify connections", spotify.warm())
+    # The reloader runs this module twice; only its child process serves requests
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_mood_warmer()
     app.run(debug=True, port=5000, host='127.0.0.1')
\ No newline at end of file
@@ -0,0 +1,121 @@
+"""
+ASGI entry point for Moodify.
+
+/api/recommendations is served natively on the event loop by async_pipeline;
+every other route is handed to the Flask app through asgiref's WSGI adapter.
+Run it with:
+
+    uvicorn asgi:application --app-dir backend --port 5000
+
+Set ASYNC_RECOMMENDATIONS=false to route everything through the sync Flask
+views instead (the same code path as ``python backend/app.py``).
+"""
+import asyncio
+import logging
+import os
+import time
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.wrappers import Request
+
+import async_pipeline
+from app import (app as flask_app, CORS_ORIGINS, http_responses, request_seconds, start_mood_warmer, token_manager,
+                 trending_moods)
+from spotify_client import SpotifyAPIError
+
+ASYNC_RECOMMENDATIONS = os.getenv('ASYNC_RECOMMENDATIONS', 'true').lower() == 'true'
+
+flask_asgi = WsgiToAsgi(flask_app)
+logger = logging.getLogger(__name__)
+
+
+def load_session(scope):
+    """Open the Flask session for an ASGI request using the app's session interface"""
+    headers = {name.decode('latin-1'): value.decode('latin-1') for name, value in scope['headers']}
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': (scope.get('server') or ('localhost', 80))[0],
+        'SERVER_PORT': str((scope.get('server') or ('localhost', 80))[1]),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'HTTP_COOKIE': headers.get('cookie', ''),
+    }
+    return flask_app.session_interface.open_session(flask_app, Request(environ)) or {}
+
+
+async def send_json(scope, send, payload, status=200):
+    body = flask_app.json.dumps(payload).encode('utf-8')
+    headers = [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+    origin = dict(scope['headers']).get(b'origin', b'').decode('latin-1')
+    if origin in CORS_ORIGINS:
+        headers += [(b'access-control-allow-origin', origin.encode('latin-1')), (b'vary', b'Origin')]
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def recommendations(scope, receive, send):
+    started = time.perf_counter()
+
+    async def respond(payload, status=200):
+        await send_json(scope, send, payload, status)
+        # Requests handed to flask_asgi are recorded by the Flask app itself
+        request_seconds.observe(time.perf_counter() - started, 'get_recommendations')
+        http_responses.inc('get_recommendations', status)
+
+    # The session tier may read SQLite
+    session = await asyncio.to_thread(load_session, scope)
+    if 'access_token' not in session:
+        return await respond({
+            'error': 'Please log in with Spotify first',
+            'redirect': '/login'
+        }, 401)
+
+    mood = parse_qs(scope['query_string'].decode('latin-1')).get('mood', [None])[0]
+    if not mood:
+        return await respond({'error': 'Mood parameter required'}, 400)
+
+    # Token refreshes write the session back, which the Flask view knows how to do
+    if token_manager.needs_refresh(session):
+        return await flask_asgi(scope, receive, send)
+
+    logger.debug("Getting recommendations for mood: %s", mood)
+    trending_moods.record(mood)
+    try:
+        tracks, served_by = await async_pipeline.recommend_for_mood_async(session['access_token'], mood)
+        await respond({'mood': mood, 'tracks': tracks, 'served_by': served_by})
+    except SpotifyAPIError as e:
+        if e.status_code == 401 and session.get('refresh_token'):
+            return await flask_asgi(scope, receive, send)
+        logger.error("Error getting recommendations: %s", e)
+        if e.status_code == 401:
+            return await respond({
+                'error': 'Please log in with Spotify first',
+                'redirect': '/login'
+            }, 401)
+        await respond({'error': str(e)}, 500)
+    except Exception as e:
+        logger.error("Error getting recommendations: %s", e)
+        await respond({'error': str(e)}, 500)
+
+
+async def lifespan(scope, receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            start_mood_warmer()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await async_pipeline.close_async_client()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(scope, receive, send)
+    if (ASYNC_RECOMMENDATIONS and scope['type'] == 'http' and scope['method'] == 'GET'
+            and scope['path'] == '/api/recommendations'):
+        return await recommendations(scope, receive, send)
+    return await flask_asgi(scope, receive, send)
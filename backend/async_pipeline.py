@@ -0,0 +1,257 @@
+"""
+Asyncio implementation of the recommendation pipeline.
+
+Mirrors recommend_for_mood (including the hedged mode) from app.py with
+non-blocking HTTP (httpx) and Gemini's async API, so a single process can keep
+hundreds of upstream calls in flight. Caches, prompt building and response
+shaping are shared with the sync path.
+"""
+import asyncio
+import logging
+import os
+
+import httpx
+
+import app as moodify
+from recommendation_cache import canonical_key
+from upstream_scheduler import INTERACTIVE, RateLimited
+
+ASYNC_MAX_CONNECTIONS = int(os.getenv('ASYNC_MAX_CONNECTIONS', '200'))
+ASYNC_MAX_KEEPALIVE = int(os.getenv('ASYNC_MAX_KEEPALIVE', '50'))
+
+_client = None
+_client_loop = None
+_inflight = {}
+_background = set()
+logger = logging.getLogger(__name__)
+
+
+def get_async_client():
+    """Return the httpx.AsyncClient bound to the running event loop"""
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client_loop is not loop:
+        connect_timeout, read_timeout = moodify.spotify.timeout
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=ASYNC_MAX_CONNECTIONS,
+                                max_keepalive_connections=ASYNC_MAX_KEEPALIVE),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        )
+        _client_loop = loop
+    return _client
+
+
+async def close_async_client():
+    global _client, _client_loop
+    if _client is not None:
+        await _client.aclose()
+    _client = _client_loop = None
+
+
+async def get_ai_mood_analysis_async(mood):
+    if not moodify.GEMINI_API_KEY:
+        return None
+
+    try:
+        with moodify.stage_seconds.time('gemini_analysis'):
+            model = moodify.get_gemini_model()
+            response = await model.generate_content_async(moodify.build_mood_prompt(mood))
+            params = moodify.parse_ai_mood_response(response.text)
+        moodify.upstream_responses.inc('gemini', 'generate_content', 'ok')
+        return params
+    except Exception as e:
+        moodify.upstream_responses.inc('gemini', 'generate_content', 'error')
+        logger.warning("AI mood analysis failed: %s", e)
+        return None
+
+
+async def parse_mood_to_spotify_params_async(mood):
+    return (await analyze_mood_async(mood))[0]
+
+
+async def analyze_mood_async(mood):
+    logger.debug("Parsing mood: %s", mood)
+
+    known = moodify.local_mood_analysis(mood)
+    if known is not None:
+        return known
+
+    ai_params = await get_ai_mood_analysis_async(mood)
+    if ai_params:
+        logger.debug("AI analysis: %s", ai_params)
+        # The mood cache may save its file and the training log appends to one; neither belongs on the loop
+        await asyncio.to_thread(moodify.remember_mood_analysis, mood, ai_params)
+        return ai_params, 'ai'
+
+    logger.debug("AI analysis returned nothing, using keywords")
+    return moodify.keyword_mood_params(mood), 'keyword'
+
+
+async def spotify_get_async(client, url, priority=INTERACTIVE, **kwargs):
+    """GET through the same upstream scheduler as the sync client"""
+    scheduler = moodify.spotify.scheduler
+    if scheduler is None:
+        return await _send_async(client, url, kwargs)
+    try:
+        return await scheduler.run_async(url, lambda: _send_async(client, url, kwargs), priority)
+    except RateLimited as e:
+        raise moodify.SpotifyAPIError(str(e), e.status_code) from e
+
+
+async def _send_async(client, url, kwargs):
+    try:
+        response = await client.get(url, **kwargs)
+    except httpx.HTTPError:
+        moodify.record_spotify_response(url, None)
+        raise
+    moodify.record_spotify_response(url, response.status_code)
+    return response
+
+
+async def fetch_spotify_recommendations_async(access_token, params):
+    with moodify.stage_seconds.time('spotify_recommendations'):
+        return await _fetch_spotify_recommendations_async(access_token, params)
+
+
+async def _fetch_spotify_recommendations_async(access_token, params):
+    client = get_async_client()
+    headers = {'Authorization': f'Bearer {access_token}'}
+    url = f'{moodify.SPOTIFY_API_BASE}/recommendations'
+
+    response = await spotify_get_async(client, url, headers=headers, params=params)
+    logger.debug("Spotify /recommendations %s: %s", params, response.status_code)
+
+    # If primary request fails, try with ultra-minimal params
+    if response.status_code == 404:
+        logger.debug("Retrying /recommendations with minimal parameters")
+        minimal_params = {'limit': 5, 'seed_genres': 'pop', 'market': 'US'}
+        response = await spotify_get_async(client, url, headers=headers, params=minimal_params)
+        logger.debug("Spotify /recommendations retry: %s", response.status_code)
+
+    if response.status_code != 200:
+        raise moodify.spotify_api_error(response)
+
+    tracks = moodify.extract_tracks(moodify.loads_json(response.content))
+    moodify.track_metadata_cache.put_many(tracks)
+    return tracks
+
+
+async def get_spotify_recommendations_async(access_token, mood):
+    return (await recommend_for_mood_async(access_token, mood))[0]
+
+
+async def recommend_for_mood_async(access_token, mood):
+    """Return (tracks, served_by), mirroring app.recommend_for_mood"""
+    if moodify.MOOD_ANALYSIS_MODE == 'hedged' and moodify.GEMINI_API_KEY:
+        known = moodify.local_mood_analysis(mood)
+        if known is None:
+            tracks, served_by = await hedged_recommendations_async(access_token, mood)
+            moodify.record_mood_path(served_by)
+            return tracks, served_by
+        mood_params, served_by = known
+    else:
+        mood_params, served_by = await analyze_mood_async(mood)
+
+    moodify.record_mood_path(served_by)
+    return await recommendations_for_params_async(access_token, mood_params), served_by
+
+
+async def hedged_recommendations_async(access_token, mood):
+    """Race Gemini against the keyword analysis, giving Gemini MOOD_ANALYSIS_BUDGET_MS to answer"""
+    ai_task = _background_task(get_ai_mood_analysis_async(mood))
+    ai_task.add_done_callback(lambda task: _remember_late_analysis(mood, task))
+    fallback_task = _background_task(
+        recommendations_for_params_async(access_token, moodify.keyword_mood_params(mood)))
+
+    try:
+        ai_params = await asyncio.wait_for(asyncio.shield(ai_task), moodify.MOOD_ANALYSIS_BUDGET_MS / 1000)
+        served_by = 'keyword'
+    except asyncio.TimeoutError:
+        logger.debug("Gemini missed the %dms budget, serving keyword result", moodify.MOOD_ANALYSIS_BUDGET_MS)
+        ai_params = None
+        served_by = 'keyword-timeout'
+
+    if ai_params:
+        logger.debug("AI analysis: %s", ai_params)
+        return await recommendations_for_params_async(access_token, ai_params), 'ai'
+    return await fallback_task, served_by
+
+
+def _remember_late_analysis(mood, task):
+    if not task.cancelled() and task.exception() is None and task.result():
+        _background_task(asyncio.to_thread(moodify.remember_mood_analysis, mood, task.result()))
+
+
+def _background_task(coro):
+    task = asyncio.ensure_future(coro)
+    _background.add(task)
+    task.add_done_callback(_discard_task)
+    return task
+
+
+def _discard_task(task):
+    _background.discard(task)
+    if not task.cancelled():
+        task.exception()  # a losing hedge may fail unobserved
+
+
+async def recommendations_for_params_async(access_token, mood_params):
+    if moodify.track_catalog is not None:
+        # The catalog search is sub-millisecond; only the metadata lookup blocks
+        tracks = await asyncio.to_thread(moodify.local_recommendations, mood_params)
+        if tracks:
+            return tracks
+
+    params = moodify.build_recommendation_params(mood_params)
+    cache = moodify.recommendation_cache
+
+    cached = cache.lookup(params)
+    if cached is not None:
+        tracks, stale = cached
+        if stale:
+            _refresh_in_background(access_token, params)
+        return tracks
+
+    # Concurrent misses for the same params share one upstream call
+    key = canonical_key(params)
+    pending = _inflight.get(key)
+    if pending is not None:
+        tracks = await asyncio.shield(pending)
+        if tracks is not None:
+            return cache.serve(params, tracks)
+
+    pending = _inflight[key] = asyncio.get_running_loop().create_future()
+    try:
+        tracks = await fetch_spotify_recommendations_async(access_token, params)
+        cache.put(params, tracks)
+        pending.set_result(tracks)
+    except Exception as e:
+        pending.set_exception(e)
+        pending.exception()  # mark retrieved when nobody else was waiting
+        raise
+    finally:
+        _inflight.pop(key, None)
+        # Cancelled, e.g. because our client went away: the waiters fetch for themselves
+        if not pending.done():
+            pending.set_result(None)
+    # Rotate like a hit so the first requests for these params don't all get the same order
+    return cache.serve(params, tracks)
+
+
+def _refresh_in_background(access_token, params):
+    key = canonical_key(params)
+    if key in _inflight:
+        return
+
+    async def _refresh():
+        try:
+            tracks = await fetch_spotify_recommendations_async(access_token, params)
+            moodify.recommendation_cache.put(params, tracks)
+            return tracks
+        except Exception as e:
+            logger.warning("Background recommendation refresh failed: %s", e)
+            return None
+        finally:
+            _inflight.pop(key, None)
+
+    _inflight[key] = _background_task(_refresh())
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Bulk mood-playlist generation.
+
+Reads one job per line from a JSONL file and runs the same pipeline as
+/api/recommendations followed by /api/create_playlist, without going through
+HTTP:
+
+    {"access_token": "...", "refresh_token": "...", "mood": "focus", "user_id": "..."}
+
+``refresh_token``, ``user_id`` and ``id`` are optional. Jobs run on a bounded
+thread pool and start at most --rate per second. Spotify calls are also admitted
+by the app's upstream scheduler, so a 429 pauses the server's workers and this
+run alike. Results and failures are written as JSONL, followed by a summary of
+throughput and per-stage timings:
+
+    python backend/bulk_generate.py jobs.jsonl --workers 8 --rate 4 \\
+        --out results.jsonl --failures failures.jsonl
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import app as moodify
+from spotify_client import SpotifyAPIError
+from upstream_scheduler import LocalRateState
+
+STAGES = ('profile', 'analysis', 'recommendations', 'playlist')
+
+
+class StageFailed(Exception):
+    def __init__(self, stage, error):
+        super().__init__(str(error))
+        self.stage = stage
+        self.error = error
+
+
+def read_jobs(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if line.strip():
+                yield line_number, line
+
+
+def run_job(job):
+    """Run one job through the pipeline; returns (result, timings)"""
+    timings = {}
+    session = {'access_token': job['access_token']}
+    if job.get('refresh_token'):
+        session['refresh_token'] = job['refresh_token']
+    if job.get('token_expires_at'):
+        session['token_expires_at'] = job['token_expires_at']
+    mood = job['mood']
+
+    def stage(name, fn):
+        start = time.perf_counter()
+        try:
+            return fn()
+        except Exception as e:
+            raise StageFailed(name, e)
+        finally:
+            timings[name] = time.perf_counter() - start
+
+    # A profile without an id fails inside the stage, so it is reported as a profile failure
+    user_id = job.get('user_id') or stage(
+        'profile', lambda: moodify.token_manager.call(session, moodify.get_user_profile)['id'])
+    mood_params, served_by = stage('analysis', lambda: moodify.analyze_mood(mood))
+    tracks = stage('recommendations', lambda: moodify.token_manager.call(
+        session, lambda token: moodify.recommendations_for_params(token, mood_params)))
+    if not tracks:
+        raise StageFailed('recommendations', ValueError('Spotify returned no tracks'))
+    # Refresh-and-retry per Spotify request, so a 401 mid-way never creates a second playlist
+    playlist = stage('playlist', lambda: moodify.create_spotify_playlist(
+        lambda fn: moodify.token_manager.call(session, fn), user_id, mood, [track.id for track in tracks]))
+
+    return {'user_id': user_id, 'mood': mood, 'served_by': served_by, 'playlist': playlist}, timings
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def print_summary(succeeded, failed, elapsed, stage_timings, file=sys.stdout):
+    total = succeeded + failed
+    print(f"\n📊 {total} jobs in {elapsed:.1f}s ({total / elapsed if elapsed else 0:.2f} jobs/s): "
+          f"{succeeded} succeeded, {failed} failed", file=file)
+    print(f"{'stage':<16}{'count':>7}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}", file=file)
+    for name in STAGES:
+        values = stage_timings.get(name)
+        if not values:
+            continue
+        print(f"{name:<16}{len(values):>7}{sum(values) / len(values) * 1000:>10.1f}"
+              f"{percentile(values, 50) * 1000:>10.1f}{percentile(values, 95) * 1000:>10.1f}"
+              f"{max(values) * 1000:>10.1f}", file=file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate mood playlists in bulk from a JSONL job file')
+    parser.add_argument('jobs', help='JSONL file of {access_token, mood, ...} jobs')
+    parser.add_argument('--out', default='bulk_results.jsonl', help='JSONL results file')
+    parser.add_argument('--failures', default='bulk_failures.jsonl', help='JSONL file for failed jobs')
+    parser.add_argument('--workers', type=int, default=4, help='jobs running at once')
+    parser.add_argument('--rate', type=float, default=2.0, help='maximum jobs started per second')
+    parser.add_argument('--burst', type=float, default=None, help='jobs that may start back to back')
+    args = parser.parse_args()
+
+    out = open(args.out, 'w', encoding='utf-8')
+    failures = open(args.failures, 'w', encoding='utf-8')
+    write_lock = threading.Lock()
+    limiter = LocalRateState()
+    burst = args.burst or max(1.0, args.rate)
+    stage_timings = {}
+    counts = {'succeeded': 0, 'failed': 0}
+
+    def write(f, record):
+        with write_lock:
+            f.write(json.dumps(record) + '\n')
+            f.flush()
+
+    def fail(line_number, job_id, stage, error):
+        with write_lock:
+            counts['failed'] += 1
+        write(failures, {
+            'line': line_number,
+            'id': job_id,
+            'stage': stage,
+            'error': str(error),
+            'status_code': error.status_code if isinstance(error, SpotifyAPIError) else None,
+        })
+
+    def process(numbered):
+        line_number, line = numbered
+        try:
+            job = json.loads(line)
+            job_id = job.get('id', line_number)
+            if not job.get('access_token') or not job.get('mood'):
+                raise ValueError('job needs access_token and mood')
+        except (ValueError, AttributeError) as e:
+            return fail(line_number, line_number, 'parse', e)
+
+        delay = limiter.reserve('jobs', args.rate, burst, time.time())
+        if delay:
+            time.sleep(delay)
+        try:
+            result, timings = run_job(job)
+        except StageFailed as e:
+            return fail(line_number, job_id, e.stage, e.error)
+
+        with write_lock:
+            counts['succeeded'] += 1
+            for name, seconds in timings.items():
+                stage_timings.setdefault(name, []).append(seconds)
+        write(out, {'id': job_id, **result,
+                    'timings_ms': {name: round(seconds * 1000, 1) for name, seconds in timings.items()}})
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix='bulk') as pool:
+        # map() would queue every job up front; bound the backlog to keep memory flat
+        pending = set()
+        for numbered in read_jobs(args.jobs):
+            if len(pending) >= args.workers * 4:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            pending.add(pool.submit(process, numbered))
+        for future in pending:
+            future.result()
+    elapsed = time.perf_counter() - start
+
+    out.close()
+    failures.close()
+    print_summary(counts['succeeded'], counts['failed'], elapsed, stage_timings)
+    return 1 if counts['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
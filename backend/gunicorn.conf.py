@@ -0,0 +1,70 @@
+"""
+Production launcher for Moodify: pre-forked gunicorn workers with threads.
+
+    gunicorn -c backend/gunicorn.conf.py    # from the project root, like python backend/app.py
+
+The app is imported once in the master (``preload_app``), so the mood lexicon,
+classifier, caches and catalog mappings are shared copy-on-write by every
+worker; so is the Gemini SDK when GEMINI_API_KEY is set. Each forked worker
+then drops state it must not share (pooled sockets, the log writer thread) and
+warms up (Spotify connections, app token, Gemini model, catalog pages) before
+it accepts traffic.
+
+Reloading:
+- ``kill -HUP <master>`` replaces workers gracefully, but with a preloaded app
+  it does not pick up code changes.
+- To deploy new code, send USR2 (starts a new master next to the old one), then
+  TERM to the old master. Either way, workers finish their in-flight requests
+  within ``graceful_timeout`` before exiting.
+"""
+import multiprocessing
+import os
+
+wsgi_app = 'app:app'
+# Import the backend modules without changing directory: relative paths in .env (SESSION_DB=backend/...)
+# are relative to where gunicorn is started, i.e. the project root
+pythonpath = os.path.dirname(os.path.abspath(__file__))
+
+bind = os.getenv('MOODIFY_BIND', '127.0.0.1:5000')
+workers = int(os.getenv('WEB_CONCURRENCY', str(multiprocessing.cpu_count() * 2 + 1)))
+# Requests mostly wait on Gemini and Spotify, so each worker serves several at once on threads
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+preload_app = True
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+# Recycle workers now and then so slow leaks can't build up; jitter keeps them from restarting together
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '0'))
+max_requests_jitter = max(1, max_requests // 10) if max_requests else 0
+
+WARM_WORKERS = os.getenv('WARM_WORKERS', 'true').lower() == 'true'
+
+
+def when_ready(server):
+    # Import the Gemini SDK once in the master so workers share it; each builds its own client
+    if os.getenv('GEMINI_API_KEY'):
+        import google.generativeai  # noqa: F401
+
+
+def post_fork(server, worker):
+    import app as moodify
+
+    moodify.reinit_after_fork()
+
+
+def post_worker_init(worker):
+    # Runs in the worker before it starts accepting connections
+    import app as moodify
+
+    if WARM_WORKERS:
+        moodify.warm_worker()
+    # Caches are per process, so every worker keeps its own hot moods warm
+    moodify.start_mood_warmer()
+
+
+def worker_exit(server, worker):
+    import log_config
+
+    log_config.shutdown_logging()
@@ -0,0 +1,135 @@
+"""
+Leveled, asynchronous logging for Moodify.
+
+Modules log through ``logging.getLogger(__name__)`` with %-style arguments, so
+a message below the configured level costs one level check and is never
+formatted. Records that pass have their message merged with its arguments on
+the calling thread (QueueHandler.prepare) and are handed to a queue; a
+QueueListener thread applies the output format and does the writing, so
+request threads never block on stderr.
+
+The HTTP client libraries log every request at INFO/DEBUG; they are held at
+WARNING unless LOG_LEVEL is DEBUG.
+
+Output is text or one JSON object per line (LOG_FORMAT). Bearer tokens, OAuth
+codes, secrets and access/refresh tokens are redacted from every message.
+DEBUG records can be sampled (LOG_DEBUG_SAMPLE_RATE) when debugging under load.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv('LOG_DEBUG_SAMPLE_RATE', '1.0'))
+
+TEXT_FORMAT = '%(asctime)s %(levelname)-7s [%(process)d] %(name)s: %(message)s'
+REDACTED = '[REDACTED]'
+# Per-request chatter from the HTTP clients under Spotify, Gemini and the async pipeline
+NOISY_LOGGERS = ('httpx', 'httpcore', 'urllib3')
+
+_BEARER = re.compile(r'(Bearer\s+)[A-Za-z0-9._~+/=-]+')
+_SECRET_FIELDS = re.compile(
+    r'''\b(access_token|refresh_token|client_secret|code|token)(['"]?\s*[:=]\s*['"]?)([^'"\s,&}]+)''')
+# Standard LogRecord attributes; anything else was passed through ``extra``
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener = None
+_listener_pid = None
+
+
+def redact(text):
+    """Mask credentials in a formatted log line"""
+    text = _BEARER.sub(rf'\1{REDACTED}', text)
+    return _SECRET_FIELDS.sub(rf'\1\2{REDACTED}', text)
+
+
+class RedactingFormatter(logging.Formatter):
+    def format(self, record):
+        return redact(super().format(record))
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record; ``extra`` fields are included as keys"""
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'pid': record.process,
+            'message': redact(record.getMessage()),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = redact(self.formatException(record.exc_info))
+        return json.dumps(entry, default=str)
+
+    def formatTime(self, record, datefmt=None):
+        return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created))
+
+
+class DebugSampler(logging.Filter):
+    """Let through only a ``rate`` fraction of DEBUG records; other levels always pass"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or self.rate >= 1.0 or random.random() < self.rate
+
+
+def configure_logging(level=None, fmt=None, sample_rate=None, stream=None):
+    """Route the root logger through a queue to a background writer.
+
+    Safe to call again, e.g. in a freshly forked worker whose listener thread
+    did not survive the fork; the previous handler is replaced.
+    """
+    global _listener, _listener_pid
+    level = (level or LOG_LEVEL).upper()
+    fmt = fmt or LOG_FORMAT
+    sample_rate = LOG_DEBUG_SAMPLE_RATE if sample_rate is None else sample_rate
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JSONFormatter() if fmt == 'json' else RedactingFormatter(TEXT_FORMAT))
+
+    records = queue.SimpleQueue()
+    handler = QueueHandler(records)
+    handler.addFilter(DebugSampler(sample_rate))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        if isinstance(existing, QueueHandler):
+            root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+    for name in NOISY_LOGGERS:
+        logging.getLogger(name).setLevel(logging.NOTSET if level == 'DEBUG' else logging.WARNING)
+
+    # A listener inherited through fork has no thread behind it; only stop our own
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+    _listener = QueueListener(records, output)
+    _listener.start()
+    _listener_pid = os.getpid()
+
+
+def shutdown_logging():
+    """Flush queued records; registered to run at exit"""
+    global _listener
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+    _listener = None
+
+
+atexit.register(shutdown_logging)
@@ -0,0 +1,151 @@
+"""
+Bounded TTL + LRU caches.
+
+TTLCache is the generic store; entries can optionally be persisted to a JSON
+file so a restarted worker starts warm. MoodCache holds AI mood analysis
+results keyed on normalized mood strings, so "Chill!!", "  chill " and "CHILL"
+share one entry.
+"""
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+_PUNCTUATION_RE = re.compile(r'[^\w\s]+')
+_WHITESPACE_RE = re.compile(r'[\s_]+')
+logger = logging.getLogger(__name__)
+
+
+def normalize_mood(mood):
+    """Fold case, punctuation and whitespace so equivalent moods share a key"""
+    text = _PUNCTUATION_RE.sub(' ', (mood or '').casefold())
+    return _WHITESPACE_RE.sub(' ', text).strip()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after ``ttl`` seconds"""
+
+    name = 'cache'
+
+    def __init__(self, max_entries=2048, ttl=86400, path=None, save_interval=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.save_interval = save_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_save = time.time()
+        if path:
+            self.load()
+            atexit.register(self.save)
+
+    def _key(self, key):
+        return key
+
+    def _encode(self, value):
+        """Convert a value to something json can store (see save/load)"""
+        return value
+
+    def _decode(self, value):
+        return value
+
+    def get(self, key):
+        key = self._key(key)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        key = self._key(key)
+        if not key:
+            return
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._dirty = True
+            due = self.path and time.time() - self._last_save >= self.save_interval
+        if due:
+            self.save()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._dirty = True
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def load(self):
+        """Load unexpired entries from ``path``; a missing or corrupt file is ignored"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        now = time.time()
+        with self._lock:
+            for key, (expires_at, value) in stored.items():
+                if expires_at > now:
+                    self._entries[key] = (expires_at, self._decode(value))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return len(self._entries)
+
+    def save(self):
+        """Atomically write the cache to ``path`` (oldest entries first)"""
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            snapshot = {key: [expires_at, self._encode(value)] for key, (expires_at, value) in self._entries.items()}
+            self._dirty = False
+            self._last_save = time.time()
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            self._dirty = True
+            logger.warning("Failed to persist %s: %s", self.name, e)
+
+
+class MoodCache(TTLCache):
+    """TTLCache keyed on normalized mood text"""
+
+    name = 'mood cache'
+
+    def _key(self, mood):
+        return normalize_mood(mood)
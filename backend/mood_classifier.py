@@ -0,0 +1,207 @@
+"""
+Offline mood classifier.
+
+Maps mood text to the same ``{genres, audio_features}`` schema that Gemini
+returns, so confident predictions can skip the Gemini round trip entirely.
+Moods are embedded with the hashed features from mood_index and a linear
+(ridge regression) model predicts one score per genre plus the three audio
+features. A prediction is one matrix-vector product.
+
+Raw ridge outputs are not calibrated: hashed n-grams give any word some score,
+so "banana" can come out as confidently as "sad". The confidence is therefore
+the top genre's score scaled by the share of the mood's words that appeared in
+training, which is 0 for moods the model has no evidence about. Use --holdout
+to see accuracy and acceptance per threshold on examples held out of training.
+
+Training data comes from the JSONL log of Gemini analyses (TrainingLog) and can
+be seeded from the keyword lexicon when there is little history yet:
+
+    python backend/mood_classifier.py --log backend/.mood_training.jsonl \\
+        --lexicon backend/mood_lexicon.json --out backend/.mood_classifier.npz
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+
+import numpy as np
+
+from mood_index import DEFAULT_DIM, embed_mood, mood_tokens
+
+FEATURES = ('valence', 'energy', 'danceability')
+
+
+class TrainingLog:
+    """Append-only JSONL log of mood analyses, used as classifier training data"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def record(self, mood, params):
+        line = json.dumps({'mood': mood, 'params': params, 'ts': int(time.time())})
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+    def read(self):
+        """Yield (mood, params) pairs, skipping malformed lines"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    yield entry['mood'], entry['params']
+                except (ValueError, KeyError, TypeError):
+                    continue
+
+
+class MoodClassifier:
+    """Ridge-regression model from hashed mood embeddings to genre scores and audio features"""
+
+    def __init__(self, genres, weights, vocabulary, dim=DEFAULT_DIM, max_genres=3):
+        self.genres = list(genres)
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.vocabulary = frozenset(vocabulary)
+        self.dim = dim
+        self.max_genres = max_genres
+
+    @classmethod
+    def train(cls, examples, dim=DEFAULT_DIM, l2=0.1):
+        """Fit from (mood, params) pairs with a closed-form ridge solve"""
+        rows = []
+        for mood, params in examples:
+            genres = params.get('genres') or []
+            features = params.get('audio_features') or {}
+            if genres and all(name in features for name in FEATURES):
+                rows.append((mood, genres, [float(features[name]) for name in FEATURES]))
+        if not rows:
+            raise ValueError('No usable training examples for the mood classifier')
+
+        genres = sorted({genre for _, row_genres, _ in rows for genre in row_genres})
+        column = {genre: i for i, genre in enumerate(genres)}
+        x = np.ones((len(rows), dim + 1))  # the last column is the bias
+        y = np.zeros((len(rows), len(genres) + len(FEATURES)))
+        for r, (mood, row_genres, features) in enumerate(rows):
+            x[r, :dim] = embed_mood(mood, dim)
+            y[r, [column[genre] for genre in row_genres]] = 1.0
+            y[r, len(genres):] = features
+
+        penalty = l2 * np.eye(dim + 1)
+        penalty[dim, dim] = 0.0  # don't shrink the bias
+        weights = np.linalg.solve(x.T @ x + penalty, x.T @ y)
+        vocabulary = {token for mood, _, _ in rows for token in mood_tokens(mood)}
+        return cls(genres, weights, vocabulary, dim=dim)
+
+    def coverage(self, mood):
+        """Share of the mood's words that appeared (or whose stem appeared) in the training data"""
+        tokens = mood_tokens(mood)
+        if not tokens:
+            return 0.0
+        return sum(self._known(token) for token in tokens) / len(tokens)
+
+    def _known(self, token):
+        # Lexicon seeds include stems ("meditat" for "meditat*"), so a seen prefix counts too
+        return token in self.vocabulary or any(token[:n] in self.vocabulary for n in range(4, len(token)))
+
+    def predict(self, mood):
+        """Return (params, confidence); confidence is the top genre's score times the word coverage"""
+        vector = embed_mood(mood, self.dim)
+        coverage = self.coverage(mood)
+        if not vector.any() or not coverage:
+            return None, 0.0
+        output = vector @ self.weights[:self.dim] + self.weights[self.dim]
+        scores = output[:len(self.genres)]
+        top = np.argsort(scores)[::-1][:self.max_genres]
+        features = np.clip(output[len(self.genres):], 0.0, 1.0)
+        params = {
+            'genres': [self.genres[i] for i in top if scores[i] > 0] or [self.genres[top[0]]],
+            'audio_features': {name: round(float(value), 2) for name, value in zip(FEATURES, features)},
+        }
+        return params, coverage * float(min(1.0, max(0.0, scores[top[0]])))
+
+    def save(self, path):
+        np.savez(path, genres=np.array(self.genres), weights=self.weights,
+                 vocabulary=np.array(sorted(self.vocabulary)), dim=self.dim)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            if 'vocabulary' not in data:
+                raise ValueError('model predates confidence calibration; retrain it')
+            return cls(data['genres'].tolist(), data['weights'], data['vocabulary'].tolist(), dim=int(data['dim']))
+
+
+def evaluate(classifier, examples, thresholds=(0.3, 0.4, 0.5, 0.6, 0.7, 0.8)):
+    """Yield (threshold, accepted, accuracy) on held-out examples.
+
+    A prediction counts as accurate when its top genre is one of the example's
+    genres; accepted is the share of examples served without Gemini.
+    """
+    scored = []
+    for mood, params in examples:
+        predicted, confidence = classifier.predict(mood)
+        correct = bool(predicted) and predicted['genres'][0] in (params.get('genres') or [])
+        scored.append((confidence, correct))
+    for threshold in thresholds:
+        accepted = [correct for confidence, correct in scored if confidence >= threshold]
+        yield threshold, len(accepted) / len(scored), (sum(accepted) / len(accepted) if accepted else None)
+
+
+def lexicon_examples(path):
+    """Seed examples: every plain lexicon term labelled with the lexicon's own analysis"""
+    from mood_lexicon import MoodLexicon
+
+    lexicon = MoodLexicon.load(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        terms = json.load(f)['terms']
+    for term in terms:
+        term = term.rstrip('*')
+        yield term, lexicon.analyze(term)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train the offline mood classifier')
+    parser.add_argument('--log', help='JSONL log of Gemini analyses')
+    parser.add_argument('--lexicon', help='seed with the terms of this keyword lexicon')
+    parser.add_argument('--out', required=True, help='where to write the .npz model')
+    parser.add_argument('--dim', type=int, default=DEFAULT_DIM)
+    parser.add_argument('--l2', type=float, default=0.1, help='ridge regularization strength')
+    parser.add_argument('--holdout', type=float, default=0.0,
+                        help='fraction of logged examples to hold out and report accuracy per threshold on')
+    args = parser.parse_args()
+
+    examples = []
+    if args.log:
+        examples.extend(TrainingLog(args.log).read())
+    logged = len(examples)
+    if args.lexicon:
+        examples.extend(lexicon_examples(args.lexicon))
+    if not examples:
+        parser.error('no training examples: pass --log and/or --lexicon')
+
+    held_out = []
+    if args.holdout:
+        # Only logged analyses are held out: they are what the classifier will see in production
+        history = examples[:logged]
+        random.Random(0).shuffle(history)
+        held_out = history[:int(logged * args.holdout)]
+        examples = history[len(held_out):] + examples[logged:]
+        logged -= len(held_out)
+
+    classifier = MoodClassifier.train(examples, dim=args.dim, l2=args.l2)
+    classifier.save(args.out)
+    print(f"✅ Trained on {logged} logged and {len(examples) - logged} seed examples; "
+          f"{len(classifier.genres)} genres -> {args.out}")
+    if held_out:
+        print(f"{len(held_out)} held-out examples:")
+        for threshold, accepted, accuracy in evaluate(classifier, held_out):
+            shown = f'{accuracy:.2f}' if accuracy is not None else '-'
+            print(f"  threshold {threshold:.1f}: {accepted:6.1%} served locally, top genre right {shown}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+"""
+Near-duplicate lookup over previously analyzed mood strings.
+
+Each mood is embedded as a signed, hashed bag of word tokens (lightly stemmed,
+so "relaxing" and "relaxed" share one) and character n-grams, L2-normalized and stored as a row of a NumPy matrix, so a lookup is one
+matrix-vector product. When the best cosine similarity clears the threshold the
+stored analysis is reused instead of asking Gemini again, unless the two moods
+differ in polarity: a negation ("not sad", "unhappy") or an opposite-valence
+word ("sad" vs "upbeat") changes little of the vector but flips the mood.
+"""
+import threading
+import zlib
+
+import numpy as np
+
+from mood_cache import normalize_mood
+
+DEFAULT_DIM = 1024
+NGRAM_SIZES = (3, 4)
+# Filler words that appear in many mood descriptions but say nothing about the mood
+STOPWORDS = frozenset({
+    'a', 'an', 'and', 'am', 'for', 'i', 'im', 'in', 'is', 'it', 'me', 'my', 'of', 'on',
+    'some', 'the', 'to', 'with', 'feeling', 'feel', 'feels', 'mood', 'music', 'vibe',
+    'vibes', 'songs', 'playlist', 'kind', 'kinda', 'really', 'very', 'so', 'just',
+})
+
+# Negation cues; "don't" normalizes to "don t", so the bare "t" marks an n't contraction
+NEGATORS = frozenset({
+    'not', 'no', 'never', 'nothing', 'nor', 'without', 'dont', 'cant', 'wont', 'isnt', 'aint', 'nt', 't',
+})
+# Mood words whose valence a near-duplicate must share
+POSITIVE_WORDS = frozenset({
+    'happy', 'happier', 'upbeat', 'cheerful', 'joyful', 'joy', 'uplifting', 'excited', 'euphoric',
+    'positive', 'good', 'great', 'bright', 'sunny', 'hopeful', 'fun', 'glad', 'optimistic', 'hype',
+})
+NEGATIVE_WORDS = frozenset({
+    'sad', 'sadder', 'depressed', 'depressing', 'blue', 'gloomy', 'melancholy', 'melancholic',
+    'miserable', 'heartbroken', 'lonely', 'upset', 'angry', 'bad', 'grief', 'crying', 'negative',
+})
+# Words that start with "un" without negating anything
+NOT_UN_NEGATED = frozenset({
+    'under', 'underground', 'underwater', 'unwind', 'unwinding', 'unplugged', 'unique', 'united',
+    'universe', 'universal', 'until', 'unity',
+})
+NEGATED, POSITIVE, NEGATIVE = 1, 2, 4
+# Spellings that mean the same thing in a mood
+TOKEN_ALIASES = {'tonight': 'night', 'tonite': 'night', 'nite': 'night'}
+
+
+def mood_polarity(mood):
+    """Bit mask of NEGATED, POSITIVE and NEGATIVE; near-duplicates must have the same mask"""
+    polarity = 0
+    for token in normalize_mood(mood).split():
+        if token in NEGATORS:
+            polarity |= NEGATED
+            continue
+        # un- words ("unhappy", "uninspired") negate their stem
+        if token.startswith('un') and len(token) > 4 and token not in NOT_UN_NEGATED:
+            polarity |= NEGATED
+            token = token[2:]
+        if token in POSITIVE_WORDS:
+            polarity |= POSITIVE
+        elif token in NEGATIVE_WORDS:
+            polarity |= NEGATIVE
+    return polarity
+
+
+def mood_tokens(mood):
+    """The normalized words of a mood that carry meaning (stopwords dropped)"""
+    return [t for t in normalize_mood(mood).split() if t not in STOPWORDS]
+
+
+def stem_token(token):
+    """Strip common suffixes so "driving", "drive" and "drives" share a word feature"""
+    token = TOKEN_ALIASES.get(token, token)
+    if len(token) > 5 and token.endswith('ing'):
+        token = token[:-3]
+    elif len(token) > 4 and token.endswith('ed'):
+        token = token[:-2]
+    elif len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        token = token[:-1]
+    if len(token) > 3 and token.endswith('e'):
+        token = token[:-1]
+    return token
+
+
+def mood_features(mood, stem=False):
+    """Return the (token, weight) features used to embed a mood string"""
+    tokens = mood_tokens(mood)
+    features = [(f'w:{stem_token(token) if stem else token}', 1.0) for token in tokens]
+    for token in tokens:
+        padded = f' {token} '
+        for n in NGRAM_SIZES:
+            features.extend((f'c:{padded[i:i + n]}', 0.5) for i in range(len(padded) - n + 1))
+    return features
+
+
+def embed_mood(mood, dim=DEFAULT_DIM, stem=False):
+    """Hash a mood string into a unit-length float32 vector of size ``dim``.
+
+    Saved classifiers were trained on unstemmed features, so stemming is opt-in.
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature, weight in mood_features(mood, stem):
+        h = zlib.crc32(feature.encode('utf-8'))
+        vector[h % dim] += weight if h & 0x80000000 else -weight
+    norm = np.linalg.norm(vector)
+    if norm:
+        vector /= norm
+    return vector
+
+
+class MoodSimilarityIndex:
+    """Bounded cosine-similarity index mapping mood strings to their analyses"""
+
+    def __init__(self, threshold=0.8, max_entries=4096, dim=DEFAULT_DIM):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.dim = dim
+        self.lookups = 0
+        self.matches = 0
+        self._matrix = np.zeros((min(64, max_entries), dim), dtype=np.float32)
+        self._polarity = np.zeros(len(self._matrix), dtype=np.int8)
+        self._moods = []
+        self._values = []
+        self._keys = {}
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._moods)
+
+    def add(self, mood, value):
+        key = normalize_mood(mood)
+        vector = embed_mood(key, self.dim, stem=True)
+        if not vector.any():
+            return
+        with self._lock:
+            row = self._keys.get(key)
+            if row is None:
+                row = self._allocate_row()
+                if row < len(self._moods):
+                    del self._keys[self._moods[row]]
+                    self._moods[row] = key
+                    self._values[row] = value
+                else:
+                    self._moods.append(key)
+                    self._values.append(value)
+                self._keys[key] = row
+            else:
+                self._values[row] = value
+            self._matrix[row] = vector
+            self._polarity[row] = mood_polarity(key)
+
+    def _allocate_row(self):
+        size = len(self._moods)
+        if size < self.max_entries:
+            if size == len(self._matrix):
+                grown = np.zeros((min(size * 2, self.max_entries), self.dim), dtype=np.float32)
+                grown[:size] = self._matrix
+                self._matrix = grown
+                self._polarity = np.resize(self._polarity, len(grown))
+            return size
+        # Full: overwrite the oldest insertion (ring buffer)
+        row = self._next
+        self._next = (self._next + 1) % self.max_entries
+        return row
+
+    def search(self, mood):
+        """Return (similarity, matched_mood, value) for the closest entry of the same polarity, or None"""
+        vector = embed_mood(mood, self.dim, stem=True)
+        polarity = mood_polarity(mood)
+        with self._lock:
+            size = len(self._moods)
+            if not size or not vector.any():
+                return None
+            scores = self._matrix[:size] @ vector
+            # "not sad" sits right next to "sad"; only moods of the same polarity may match
+            scores[self._polarity[:size] != polarity] = -np.inf
+            row = int(np.argmax(scores))
+            if scores[row] == -np.inf:
+                return None
+            return float(scores[row]), self._moods[row], self._values[row]
+
+    def lookup(self, mood):
+        """Return (similarity, matched_mood, value) if a stored mood is close enough"""
+        result = self.search(mood)
+        with self._lock:
+            self.lookups += 1
+            if result is None or result[0] < self.threshold:
+                return None
+            self.matches += 1
+        return result
+
+    def stats(self):
+        return {
+            'entries': len(self._moods),
+            'max_entries': self.max_entries,
+            'threshold': self.threshold,
+            'lookups': self.lookups,
+            'matches': self.matches,
+            'llm_calls_avoided': self.matches,
+            'match_rate': round(self.matches / self.lookups, 4) if self.lookups else 0.0,
+        }
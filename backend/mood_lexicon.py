@@ -0,0 +1,141 @@
+"""
+Weighted keyword mood engine used when Gemini is disabled or unavailable.
+
+The lexicon (mood_lexicon.json) maps mood terms to weighted profiles, and each
+profile carries genre weights and target audio features. Terms may be
+multi-word ("road trip") and a trailing ``*`` makes a prefix term ("relax*"
+matches relaxing, relaxed). Explicit genre mentions ("jazz", "hip hop") map
+straight to a seed genre.
+
+All terms are compiled into one Aho-Corasick automaton with a full transition
+table, so a mood is scanned in a single pass at constant cost per character
+however large the lexicon grows. Word boundaries are handled by padding the
+normalized text and the terms with spaces. Every matched profile contributes to
+a weighted blend of audio features and genre scores.
+"""
+import json
+from collections import deque
+
+from mood_cache import normalize_mood
+
+FEATURES = ('valence', 'energy', 'danceability')
+
+
+def compile_automaton(patterns):
+    """Build an Aho-Corasick DFA; returns (transitions, outputs) indexed by state.
+
+    ``patterns`` maps pattern strings to payloads; outputs[state] lists
+    (pattern length, payload) for every pattern ending at that state.
+    """
+    goto = [{}]
+    outputs = [[]]
+    for pattern, payload in patterns.items():
+        state = 0
+        for ch in pattern:
+            nxt = goto[state].get(ch)
+            if nxt is None:
+                nxt = goto[state][ch] = len(goto)
+                goto.append({})
+                outputs.append([])
+            state = nxt
+        outputs[state].append((len(pattern), payload))
+
+    # Breadth-first, so a state's failure target (always shallower) already has its
+    # finished transition table; copying it makes every lookup a single dict.get
+    transitions = [dict(goto[0])] + [None] * (len(goto) - 1)
+    fail = [0] * len(goto)
+    queue = deque(goto[0].values())
+    while queue:
+        state = queue.popleft()
+        transitions[state] = dict(transitions[fail[state]])
+        transitions[state].update(goto[state])
+        outputs[state] = outputs[state] + outputs[fail[state]]
+        for ch, nxt in goto[state].items():
+            fail[nxt] = transitions[fail[state]].get(ch, 0)
+            queue.append(nxt)
+    return transitions, [tuple(out) for out in outputs]
+
+
+class MoodLexicon:
+    """Compiled lexicon that turns free-text moods into blended Spotify params"""
+
+    def __init__(self, lexicon):
+        self.default = lexicon['default']
+        self.genre_weight = lexicon.get('genre_weight', 2.0)
+        self.profiles = lexicon['profiles']
+        self.term_count = len(lexicon['terms']) + len(lexicon.get('genre_terms', {}))
+
+        patterns = {}
+        for term, mix in lexicon['terms'].items():
+            unknown = set(mix) - set(self.profiles)
+            if unknown:
+                raise ValueError(f'Lexicon term {term!r} uses unknown profiles: {sorted(unknown)}')
+            patterns[self._pattern(term)] = ('profiles', term, tuple(mix.items()))
+        for term, genre in lexicon.get('genre_terms', {}).items():
+            patterns.setdefault(self._pattern(term), ('genre', term, genre))
+        self._transitions, self._outputs = compile_automaton(patterns)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    @staticmethod
+    def _pattern(term):
+        term = term.strip()
+        if term.endswith('*'):
+            return ' ' + normalize_mood(term[:-1])
+        return ' ' + normalize_mood(term) + ' '
+
+    def match(self, mood):
+        """Return the payload of every term found in ``mood``, in order of appearance.
+
+        A term inside a longer matched phrase ("night" in "late night drive") is dropped.
+        """
+        transitions, outputs = self._transitions, self._outputs
+        state = 0
+        found = []
+        for end, ch in enumerate(f' {normalize_mood(mood)} '):
+            state = transitions[state].get(ch, 0)
+            if outputs[state]:
+                found.extend((end - length, end, payload) for length, payload in outputs[state])
+        if len(found) < 2:
+            return [payload for _, _, payload in found]
+
+        found.sort(key=lambda match: (match[0], -match[1]))
+        matches = []
+        reach = -1
+        for start, end, payload in found:
+            if end > reach:
+                matches.append(payload)
+                reach = end
+        return matches
+
+    def analyze(self, mood):
+        """Blend every matched term into {'genres': [...], 'audio_features': {...}}"""
+        matches = self.match(mood)
+        if not matches:
+            return {'genres': list(self.default['genres']),
+                    'audio_features': dict(self.default['audio_features'])}
+
+        genre_scores = {}
+        totals = dict.fromkeys(FEATURES, 0.0)
+        weight_sum = 0.0
+        for kind, _, value in matches:
+            if kind == 'genre':
+                genre_scores[value] = genre_scores.get(value, 0.0) + self.genre_weight
+                continue
+            for name, weight in value:
+                profile = self.profiles[name]
+                weight_sum += weight
+                for feature in FEATURES:
+                    totals[feature] += weight * profile['audio_features'][feature]
+                for genre, genre_weight in profile['genres'].items():
+                    genre_scores[genre] = genre_scores.get(genre, 0.0) + weight * genre_weight
+
+        if weight_sum:
+            features = {feature: round(totals[feature] / weight_sum, 2) for feature in FEATURES}
+        else:
+            features = dict(self.default['audio_features'])
+        genres = sorted(genre_scores, key=lambda genre: (-genre_scores[genre], genre))[:3]
+        return {'genres': genres, 'audio_features': features}
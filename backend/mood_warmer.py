@@ -0,0 +1,138 @@
+"""
+Background warming for popular moods.
+
+Most requests ask for one of a handful of moods. MoodWarmer analyses each hot
+mood and fetches its recommendations ahead of time, at startup and then every
+``interval`` seconds, so those requests are answered from the mood and
+recommendation caches without any upstream call. The hot list is the
+configured moods plus whichever moods TrendingMoods has seen most often lately.
+
+Warming runs on a daemon thread per process: caches are per process, so every
+worker warms its own.
+"""
+import logging
+import os
+import threading
+import time
+
+from mood_cache import normalize_mood
+
+logger = logging.getLogger(__name__)
+
+
+class TrendingMoods:
+    """Request counts per normalized mood that halve every ``half_life`` seconds"""
+
+    def __init__(self, half_life=3600, max_entries=1000):
+        self.half_life = half_life
+        self.max_entries = max_entries
+        self._scores = {}  # mood -> (score, as of)
+        self._lock = threading.Lock()
+
+    def _decayed(self, score, since, now):
+        return score * 0.5 ** ((now - since) / self.half_life)
+
+    def record(self, mood):
+        key = normalize_mood(mood)
+        if not key:
+            return
+        now = time.time()
+        with self._lock:
+            score, since = self._scores.get(key, (0.0, now))
+            self._scores[key] = (self._decayed(score, since, now) + 1, now)
+            if len(self._scores) > self.max_entries:
+                self._prune(now)
+
+    def _prune(self, now):
+        # Keep the top half; a new mood can only displace ones that have gone quiet
+        ranked = sorted(self._scores.items(), key=lambda item: self._decayed(*item[1], now), reverse=True)
+        self._scores = dict(ranked[:self.max_entries // 2])
+
+    def top(self, n, min_score=1.0):
+        """The ``n`` moods with the highest current score, at least ``min_score``"""
+        now = time.time()
+        with self._lock:
+            scored = [(self._decayed(score, since, now), mood) for mood, (score, since) in self._scores.items()]
+        scored.sort(reverse=True)
+        return [mood for score, mood in scored[:n] if score >= min_score]
+
+    def __len__(self):
+        return len(self._scores)
+
+
+class MoodWarmer:
+    """Keep the hot moods' analysis and recommendations cached ahead of requests"""
+
+    def __init__(self, warm, moods, trending=None, trending_count=5, min_trending_score=3.0, interval=240):
+        self._warm = warm
+        self.moods = [normalize_mood(mood) for mood in moods if normalize_mood(mood)]
+        self.trending = trending
+        self.trending_count = trending_count
+        self.min_trending_score = min_trending_score
+        self.interval = interval
+        self.runs = 0
+        self.warmed = 0
+        self.failures = 0
+        self.last_run_seconds = None
+        self.last_hot_list = []
+        self._thread = None
+        self._thread_pid = None
+        self._lock = threading.Lock()
+
+    def hot_moods(self):
+        """Configured moods first, then trending ones not already listed"""
+        moods = list(self.moods)
+        if self.trending is not None and self.trending_count:
+            trending = self.trending.top(self.trending_count + len(moods), self.min_trending_score)
+            moods += [mood for mood in trending if mood not in self.moods][:self.trending_count]
+        return moods
+
+    def warm_all(self):
+        """Warm every hot mood once; returns how many succeeded"""
+        started = time.perf_counter()
+        moods = self.hot_moods()
+        warmed = 0
+        for mood in moods:
+            try:
+                self._warm(mood)
+                warmed += 1
+            except Exception as e:
+                self.failures += 1
+                logger.warning("Could not warm mood %r: %s", mood, e)
+        self.runs += 1
+        self.warmed += warmed
+        self.last_hot_list = moods
+        self.last_run_seconds = time.perf_counter() - started
+        logger.info("Warmed %d/%d hot moods in %.0fms", warmed, len(moods), self.last_run_seconds * 1000)
+        return warmed
+
+    def start(self):
+        """Warm now and then every ``interval`` seconds on a background thread (once per process)"""
+        with self._lock:
+            if self._thread_pid == os.getpid() and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='mood-warmer', daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.warm_all()
+            except Exception as e:
+                logger.warning("Mood warming failed: %s", e)
+            if not self.interval:
+                return
+            time.sleep(self.interval)
+
+    def stats(self):
+        return {
+            'moods': self.moods,
+            'hot_moods': self.last_hot_list,
+            'trending_tracked': len(self.trending) if self.trending is not None else 0,
+            'interval': self.interval,
+            'runs': self.runs,
+            'warmed': self.warmed,
+            'failures': self.failures,
+            'last_run_seconds': round(self.last_run_seconds, 3) if self.last_run_seconds is not None else None,
+        }
@@ -0,0 +1,148 @@
+"""
+Expiring stores for pending OAuth ``state`` values.
+
+``MemoryStateStore`` is a dict guarded by a lock and is enough for a single
+process. ``SQLiteStateStore`` keeps states in a WAL-mode SQLite file so several
+worker processes share them; a state is consumed with a single DELETE, so only
+one worker can ever accept a given callback. Both give O(1) insert/pop, expire
+entries after ``ttl`` seconds and purge leftovers from a background sweeper.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class StateStore:
+    """Common TTL and background sweeper handling for state store backends"""
+
+    def __init__(self, ttl=600, sweep_interval=60):
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._sweeper = None
+        self._sweeper_pid = None
+        self._sweeper_lock = threading.Lock()
+
+    def save(self, state):
+        """Record ``state`` as outstanding until it is popped or expires"""
+        self._ensure_sweeper()
+        self._save(state, time.time() + self.ttl)
+
+    def pop(self, state):
+        """Consume ``state``; True only if it was outstanding and unexpired"""
+        return self._pop(state, time.time())
+
+    def sweep(self):
+        """Drop expired states and return how many were removed"""
+        return self._sweep(time.time())
+
+    def _ensure_sweeper(self):
+        if not self.sweep_interval or (self._sweeper_pid == os.getpid() and self._sweeper.is_alive()):
+            return
+        with self._sweeper_lock:
+            if self._sweeper_pid == os.getpid() and self._sweeper.is_alive():
+                return
+            self._sweeper = threading.Thread(target=self._sweep_forever, name='oauth-state-sweeper', daemon=True)
+            self._sweeper_pid = os.getpid()
+            self._sweeper.start()
+
+    def _sweep_forever(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.warning("OAuth state sweep failed: %s", e)
+
+
+class MemoryStateStore(StateStore):
+    """Process-local store; states are not shared between workers"""
+
+    backend = 'memory'
+
+    def __init__(self, ttl=600, sweep_interval=60):
+        super().__init__(ttl, sweep_interval)
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def _save(self, state, expires_at):
+        with self._lock:
+            self._states[state] = expires_at
+
+    def _pop(self, state, now):
+        with self._lock:
+            expires_at = self._states.pop(state, None)
+        return expires_at is not None and expires_at > now
+
+    def _sweep(self, now):
+        with self._lock:
+            expired = [state for state, expires_at in self._states.items() if expires_at <= now]
+            for state in expired:
+                del self._states[state]
+        return len(expired)
+
+    def __len__(self):
+        return len(self._states)
+
+    def items(self, limit=100):
+        with self._lock:
+            return dict(list(self._states.items())[:limit])
+
+
+class SQLiteStateStore(StateStore):
+    """SQLite-backed store that is safe to share between worker processes"""
+
+    backend = 'sqlite'
+
+    def __init__(self, path, ttl=600, sweep_interval=60):
+        super().__init__(ttl, sweep_interval)
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS oauth_states (state TEXT PRIMARY KEY, expires_at REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS oauth_states_expires_at ON oauth_states (expires_at)')
+
+    def _connect(self):
+        # One connection per thread, reopened in forked children
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _save(self, state, expires_at):
+        self._connect().execute('INSERT OR REPLACE INTO oauth_states (state, expires_at) VALUES (?, ?)',
+                                (state, expires_at))
+
+    def _pop(self, state, now):
+        cursor = self._connect().execute('DELETE FROM oauth_states WHERE state = ? AND expires_at > ?', (state, now))
+        if cursor.rowcount:
+            return True
+        # Drop an expired row too, so it can't linger until the next sweep
+        self._connect().execute('DELETE FROM oauth_states WHERE state = ?', (state,))
+        return False
+
+    def _sweep(self, now):
+        return self._connect().execute('DELETE FROM oauth_states WHERE expires_at <= ?', (now,)).rowcount
+
+    def __len__(self):
+        return self._connect().execute('SELECT COUNT(*) FROM oauth_states').fetchone()[0]
+
+    def items(self, limit=100):
+        rows = self._connect().execute('SELECT state, expires_at FROM oauth_states LIMIT ?', (limit,))
+        return dict(rows.fetchall())
+
+
+def create_state_store(backend, path=None, ttl=600, sweep_interval=60):
+    """Build the state store named by ``backend`` ("sqlite" or "memory")"""
+    if backend == 'memory':
+        return MemoryStateStore(ttl=ttl, sweep_interval=sweep_interval)
+    if backend == 'sqlite':
+        return SQLiteStateStore(path, ttl=ttl, sweep_interval=sweep_interval)
+    raise ValueError(f'Unknown OAuth state store backend: {backend}')
@@ -0,0 +1,182 @@
+"""
+Cross-user cache for Spotify /recommendations responses.
+
+Requests are built from a small, discrete parameter space, so many users issue
+identical calls. Responses are cached on the canonical parameter tuple with
+stale-while-revalidate semantics: a fresh entry is served directly, a stale one
+is served immediately while a background refresh runs, and concurrent misses for
+the same key share a single upstream call. Each serve rotates the cached track
+list so users hitting the same key still see variety.
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+def canonical_key(params):
+    """Order-independent key for a /recommendations parameter dict"""
+    items = []
+    for name, value in params.items():
+        if name.startswith('seed_') and isinstance(value, str):
+            value = ','.join(sorted(value.split(',')))
+        items.append((name, value))
+    return tuple(sorted(items))
+
+
+class _Entry:
+    __slots__ = ('tracks', 'fetched_at', 'serves')
+
+    def __init__(self, tracks, fetched_at):
+        self.tracks = tracks
+        self.fetched_at = fetched_at
+        self.serves = 0
+
+
+class RecommendationCache:
+    """Bounded LRU of track lists with fresh/stale lifetimes per entry"""
+
+    def __init__(self, max_entries=1024, ttl=300, stale_ttl=3600, refresh_workers=2):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.refresh_workers = refresh_workers
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+
+    def get(self, params, fetch):
+        """Return tracks for ``params``, calling ``fetch(params)`` only when needed"""
+        key = canonical_key(params)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            age = now - entry.fetched_at if entry else None
+            if entry and age < self.ttl:
+                self.hits += 1
+                return self._serve(key, entry)
+            if entry and age < self.stale_ttl:
+                self.stale_hits += 1
+                if key not in self._inflight:
+                    self._inflight[key] = future = Future()
+                    self._refresh_executor().submit(self._refresh, key, params, fetch, future)
+                return self._serve(key, entry)
+            self.misses += 1
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                self._inflight[key] = future = Future()
+        tracks = self._fetch(key, params, fetch, future) if leader else future.result()
+        with self._lock:
+            entry = self._entries.get(key)
+            return self._serve(key, entry) if entry else list(tracks)
+
+    def lookup(self, params):
+        """Non-blocking read for callers that fetch on their own (e.g. asyncio).
+
+        Returns (tracks, is_stale) for a servable entry, or None on a miss.
+        """
+        key = canonical_key(params)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or now - entry.fetched_at >= self.stale_ttl:
+                self.misses += 1
+                return None
+            stale = now - entry.fetched_at >= self.ttl
+            if stale:
+                self.stale_hits += 1
+            else:
+                self.hits += 1
+            return self._serve(key, entry), stale
+
+    def put(self, params, tracks):
+        self._store(canonical_key(params), tracks)
+
+    def serve(self, params, tracks):
+        """Return freshly fetched ``tracks`` in the order a hit would get (the rotation starts here)"""
+        key = canonical_key(params)
+        with self._lock:
+            entry = self._entries.get(key)
+            return self._serve(key, entry) if entry else list(tracks)
+
+    def _serve(self, key, entry):
+        self._entries.move_to_end(key)
+        tracks = entry.tracks
+        if not tracks:
+            return []
+        offset = entry.serves % len(tracks)
+        entry.serves += 1
+        return tracks[offset:] + tracks[:offset]
+
+    def _fetch(self, key, params, fetch, future):
+        try:
+            tracks = fetch(params)
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+        self._store(key, tracks)
+        future.set_result(tracks)
+        return tracks
+
+    def _refresh(self, key, params, fetch, future):
+        try:
+            self._fetch(key, params, fetch, future)
+            self.refreshes += 1
+        except Exception as e:
+            self.refresh_failures += 1
+            logger.warning("Background recommendation refresh failed: %s", e)
+
+    def _store(self, key, tracks):
+        with self._lock:
+            self._inflight.pop(key, None)
+            self._entries[key] = _Entry(tracks, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _refresh_executor(self):
+        # Executor threads don't survive a fork; each worker process starts its own
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.refresh_workers,
+                                                thread_name_prefix='recommendation-refresh')
+            self._executor_pid = os.getpid()
+        return self._executor
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'ttl': self.ttl,
+            'stale_ttl': self.stale_ttl,
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'refreshes': self.refreshes,
+            'refresh_failures': self.refresh_failures,
+            'evictions': self.evictions,
+            'hit_rate': round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0,
+        }
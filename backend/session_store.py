@@ -0,0 +1,297 @@
+"""
+Server-side Flask sessions.
+
+The session cookie carries only an opaque random id; tokens and profile data
+stay on the server. Lookups go through an in-process LRU tier first and fall
+back to a durable SQLite tier shared by every worker process, so most requests
+never touch SQLite or decode anything.
+
+Every durable row carries a version that changes on each write. A cached
+session is trusted for ``validate_interval`` seconds after it was loaded or last
+checked; after that the worker reads just that session's version (a
+primary-key lookup, no decoding) and reloads the row only if another process
+rewrote it, so a write to one session never costs other sessions their cached
+copies. Each thread has its own SQLite connection, so lookups don't queue
+behind one another.
+
+Sessions expire ``ttl`` seconds after their last write; expired rows are purged
+by a background sweeper.
+"""
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+logger = logging.getLogger(__name__)
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """Session dict that remembers its id and whether it changed"""
+
+    def __init__(self, initial=None, sid=None, expires_at=None):
+        def on_update(session):
+            session.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.new = sid is None
+        self.modified = False
+        self.previous_sid = None
+
+    def regenerate(self):
+        """Move the data to a fresh id, e.g. after login, so a planted id is useless"""
+        if self.sid is not None:
+            self.previous_sid = self.sid
+        self.sid = None
+        self.modified = True
+
+
+class SQLiteSessionTier:
+    """Durable session rows in a WAL-mode SQLite file, shared by worker processes"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute('CREATE TABLE IF NOT EXISTS sessions '
+                     '(sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL, version INTEGER NOT NULL)')
+        conn.execute('CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)')
+        # Files created before rows were versioned
+        if 'version' not in {column[1] for column in conn.execute('PRAGMA table_info(sessions)')}:
+            conn.execute('ALTER TABLE sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+
+    def _connect(self):
+        # One connection per thread (and per process: connections don't survive a fork)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def version(self, sid, now):
+        """The current version of a live session, or None if it is gone or expired"""
+        row = self._connect().execute('SELECT version FROM sessions WHERE sid = ? AND expires_at > ?',
+                                      (sid, now)).fetchone()
+        return row[0] if row is not None else None
+
+    def load(self, sid, now):
+        """Return (expires_at, data, version) for a live session, or None"""
+        row = self._connect().execute(
+            'SELECT data, expires_at, version FROM sessions WHERE sid = ? AND expires_at > ?', (sid, now)).fetchone()
+        if row is None:
+            return None
+        return row[1], json.loads(row[0]), row[2]
+
+    def save(self, sid, data, expires_at):
+        """Write a session and return its new version"""
+        encoded = json.dumps(data)
+        # Nanosecond timestamps plus random low bits: unique across processes without a read-modify-write
+        version = time.time_ns() ^ secrets.randbits(16)
+        self._connect().execute('INSERT OR REPLACE INTO sessions (sid, data, expires_at, version) VALUES (?, ?, ?, ?)',
+                                (sid, encoded, expires_at, version))
+        return version
+
+    def delete(self, sid):
+        self._connect().execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+
+    def sweep(self, now):
+        return self._connect().execute('DELETE FROM sessions WHERE expires_at <= ?', (now,)).rowcount
+
+    def __len__(self):
+        return self._connect().execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+
+
+class SessionStore:
+    """Bounded LRU of sessions in front of an optional durable tier"""
+
+    def __init__(self, durable=None, ttl=3600, max_entries=10000, sweep_interval=60, validate_interval=1.0):
+        self.durable = durable
+        self.ttl = ttl
+        self.validate_interval = validate_interval
+        self.max_entries = max_entries
+        self.sweep_interval = sweep_interval
+        self.backend = 'sqlite' if durable is not None else 'memory'
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._sweeper = None
+        self._sweeper_pid = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, sid):
+        """Return (expires_at, data) for a live session, or None"""
+        self._ensure_sweeper()
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(sid)
+            if entry is not None and entry[0] <= now:
+                del self._entries[sid]
+                entry = None
+
+        if entry is not None and self._still_current(sid, entry, now):
+            with self._lock:
+                if sid in self._entries:
+                    self._entries.move_to_end(sid)
+                self.hits += 1
+            return entry[0], dict(entry[1])
+        with self._lock:
+            self.misses += 1
+            if entry is not None:
+                self.invalidations += 1
+
+        if self.durable is None:
+            return None
+        entry = self.durable.load(sid, now)
+        if entry is None:
+            with self._lock:
+                self._entries.pop(sid, None)
+            return None
+        self._remember(sid, *entry)
+        return entry[0], dict(entry[1])
+
+    def _still_current(self, sid, entry, now):
+        expires_at, data, version, checked_at = entry
+        if self.durable is None or now - checked_at < self.validate_interval:
+            return True
+        # Another worker may have rewritten or deleted the session since it was cached here
+        if self.durable.version(sid, now) != version:
+            return False
+        with self._lock:
+            if self._entries.get(sid) is entry:
+                self._entries[sid] = (expires_at, data, version, now)
+        return True
+
+    def save(self, sid, data):
+        """Store ``data`` under ``sid`` for another ``ttl`` seconds; returns the new expiry"""
+        expires_at = time.time() + self.ttl
+        version = self.durable.save(sid, data, expires_at) if self.durable is not None else None
+        self._remember(sid, expires_at, dict(data), version)
+        return expires_at
+
+    def delete(self, sid):
+        with self._lock:
+            self._entries.pop(sid, None)
+        if self.durable is not None:
+            self.durable.delete(sid)
+
+    def sweep(self):
+        """Drop expired sessions from both tiers and return how many durable rows went"""
+        now = time.time()
+        with self._lock:
+            for sid in [sid for sid, (expires_at, _, _, _) in self._entries.items() if expires_at <= now]:
+                del self._entries[sid]
+        return self.durable.sweep(now) if self.durable is not None else 0
+
+    def _remember(self, sid, expires_at, data, version=None):
+        # A stale row cached here by a racing load is caught by the version check on the next hit
+        with self._lock:
+            self._entries[sid] = (expires_at, data, version, time.time())
+            self._entries.move_to_end(sid)
+            # Without a durable tier an evicted session is gone, i.e. the user is logged out
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _ensure_sweeper(self):
+        if not self.sweep_interval or (self._sweeper_pid == os.getpid() and self._sweeper.is_alive()):
+            return
+        with self._lock:
+            if self._sweeper_pid == os.getpid() and self._sweeper.is_alive():
+                return
+            self._sweeper = threading.Thread(target=self._sweep_forever, name='session-sweeper', daemon=True)
+            self._sweeper_pid = os.getpid()
+            self._sweeper.start()
+
+    def _sweep_forever(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.warning("Session sweep failed: %s", e)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'backend': self.backend,
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """Flask session interface that keeps session data in a SessionStore"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            entry = self.store.get(sid)
+            if entry is not None:
+                expires_at, data = entry
+                return ServerSideSession(data, sid=sid, expires_at=expires_at)
+        return ServerSideSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+        if session.previous_sid:
+            self.store.delete(session.previous_sid)
+
+        if not session:
+            if session.modified and (session.sid or session.previous_sid):
+                if session.sid:
+                    self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path, secure=secure,
+                                       samesite=samesite, httponly=httponly)
+                response.vary.add('Cookie')
+            return
+
+        # Unchanged sessions are only rewritten once they are halfway to expiry
+        halfway = session.expires_at is not None and session.expires_at - time.time() < self.store.ttl / 2
+        if not (session.modified or halfway or session.sid is None):
+            return
+
+        set_cookie = session.sid is None
+        if set_cookie:
+            session.sid = secrets.token_urlsafe(32)
+        session.expires_at = self.store.save(session.sid, dict(session))
+        if set_cookie or session.permanent:
+            response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session),
+                                httponly=httponly, domain=domain, path=path, secure=secure, samesite=samesite)
+            response.vary.add('Cookie')
+
+
+def create_session_store(backend, path=None, ttl=3600, max_entries=10000, sweep_interval=60, validate_interval=1.0):
+    """Build the session store named by ``backend`` ("sqlite" or "memory")"""
+    if backend == 'memory':
+        return SessionStore(ttl=ttl, max_entries=max_entries, sweep_interval=sweep_interval)
+    if backend == 'sqlite':
+        return SessionStore(SQLiteSessionTier(path), ttl=ttl, max_entries=max_entries, sweep_interval=sweep_interval,
+                            validate_interval=validate_interval)
+    raise ValueError(f'Unknown session store backend: {backend}')
@@ -0,0 +1,130 @@
+"""
+Process-wide pooled HTTP client for Spotify's accounts service and Web API.
+
+Every outbound Spotify call goes through a single requests.Session so TCP/TLS
+connections are kept alive and reused instead of being re-established per call.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from upstream_scheduler import INTERACTIVE, RateLimited
+
+DEFAULT_TIMEOUT = (3.05, 10)
+DEFAULT_POOL_SIZE = 10
+
+
+class SpotifyAPIError(Exception):
+    """A non-success response from Spotify; ``status_code`` is the HTTP status"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _origin(url):
+    parts = urlsplit(url)
+    return f'{parts.scheme}://{parts.netloc}'
+
+
+def parse_pool_sizes(value):
+    """Parse "host=size,host=size" into a {host: size} dict"""
+    sizes = {}
+    for item in (value or '').split(','):
+        host, sep, size = item.strip().partition('=')
+        if sep and host and size.strip().isdigit():
+            sizes[host.strip()] = int(size)
+    return sizes
+
+
+class SpotifyClient:
+    """Keep-alive HTTP client shared by every request handler in the process"""
+
+    def __init__(self, token_url, api_base, pool_sizes=None, timeout=DEFAULT_TIMEOUT,
+                 default_pool_size=DEFAULT_POOL_SIZE, scheduler=None, on_response=None):
+        self.token_url = token_url
+        self.scheduler = scheduler
+        # on_response(url, status_code) sees every attempt; status_code is None when the request failed
+        self.on_response = on_response
+        self.api_base = api_base.rstrip('/')
+        self.timeout = timeout
+        self.default_pool_size = default_pool_size
+        self.pool_sizes = dict(pool_sizes or {})
+        self._lock = threading.Lock()
+        self.session = self._build_session()
+
+    def _build_session(self):
+        session = requests.Session()
+        # The session is shared across users and threads, so never let a response
+        # cookie leak into somebody else's request.
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        for origin in {_origin(self.token_url), _origin(self.api_base)}:
+            host = urlsplit(origin).hostname
+            size = self.pool_sizes.get(host, self.default_pool_size)
+            session.mount(origin, HTTPAdapter(pool_connections=1, pool_maxsize=size))
+        return session
+
+    def request(self, method, url, priority=INTERACTIVE, **kwargs):
+        """Send a request, admitted by the upstream scheduler when one is attached"""
+        kwargs.setdefault('timeout', self.timeout)
+        if self.scheduler is None:
+            return self._send(method, url, kwargs)
+        try:
+            return self.scheduler.run(url, lambda: self._send(method, url, kwargs), priority)
+        except RateLimited as e:
+            raise SpotifyAPIError(str(e), e.status_code) from e
+
+    def _send(self, method, url, kwargs):
+        if self.on_response is None:
+            return self.session.request(method, url, **kwargs)
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            self.on_response(url, None)
+            raise
+        self.on_response(url, response.status_code)
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def warm(self, connections=None):
+        """Open keep-alive connections to each Spotify host ahead of the first request.
+
+        Returns the number of connections that were established.
+        """
+        targets = []
+        for origin in {_origin(self.token_url), _origin(self.api_base)}:
+            host = urlsplit(origin).hostname
+            count = connections or self.pool_sizes.get(host, self.default_pool_size)
+            targets.extend([origin + '/'] * max(1, count))
+
+        def _open(url):
+            try:
+                self.session.head(url, timeout=self.timeout, allow_redirects=False)
+                return True
+            except requests.RequestException:
+                return False
+
+        # Requests must overlap, otherwise they would all reuse the same socket.
+        with ThreadPoolExecutor(max_workers=len(targets)) as pool:
+            return sum(pool.map(_open, targets))
+
+    def reset(self):
+        """Drop every pooled connection, e.g. after forking a worker process"""
+        with self._lock:
+            old, self.session = self.session, self._build_session()
+        old.close()
+
+    def close(self):
+        self.session.close()
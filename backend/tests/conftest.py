@@ -0,0 +1,12 @@
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Importing app must not touch the shared SQLite files or a real training log
+os.environ.setdefault('SESSION_BACKEND', 'memory')
+os.environ.setdefault('OAUTH_STATE_BACKEND', 'memory')
+os.environ.setdefault('UPSTREAM_STATE_BACKEND', 'memory')
+os.environ.setdefault('MOOD_TRAINING_LOG', '')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+MOOD_PARAMS = {'genres': ['pop', 'dance'], 'audio_features': {'valence': 0.8, 'energy': 0.7, 'danceability': 0.7}}
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    import async_pipeline
+
+    monkeypatch.setattr(async_pipeline.moodify, 'track_catalog', None)
+    async_pipeline.moodify.recommendation_cache.clear()
+    yield async_pipeline
+    async_pipeline.moodify.recommendation_cache.clear()
+
+
+def fake_fetch(hang_for=()):
+    """fetch_spotify_recommendations_async stand-in; tokens in ``hang_for`` never return"""
+    async def fetch(access_token, params):
+        fetch.calls.append(access_token)
+        if access_token in hang_for:
+            await asyncio.Event().wait()
+        await asyncio.sleep(0)
+        return ['a', 'b', 'c']
+
+    fetch.calls = []
+    return fetch
+
+
+def test_concurrent_misses_share_one_fetch(pipeline, monkeypatch):
+    fetch = fake_fetch()
+    monkeypatch.setattr(pipeline, 'fetch_spotify_recommendations_async', fetch)
+
+    async def scenario():
+        return await asyncio.gather(*[pipeline.recommendations_for_params_async(f'token-{i}', MOOD_PARAMS)
+                                      for i in range(5)])
+
+    results = asyncio.run(scenario())
+    assert len(fetch.calls) == 1
+    assert all(sorted(tracks) == ['a', 'b', 'c'] for tracks in results)
+
+
+def test_cancelled_leader_does_not_strand_waiters(pipeline, monkeypatch):
+    fetch = fake_fetch(hang_for={'leader'})
+    monkeypatch.setattr(pipeline, 'fetch_spotify_recommendations_async', fetch)
+
+    async def scenario():
+        leader = asyncio.create_task(pipeline.recommendations_for_params_async('leader', MOOD_PARAMS))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(pipeline.recommendations_for_params_async('waiter', MOOD_PARAMS))
+        await asyncio.sleep(0)
+        leader.cancel()
+        tracks = await asyncio.wait_for(waiter, timeout=1)
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return tracks
+
+    assert sorted(asyncio.run(scenario())) == ['a', 'b', 'c']
+    assert fetch.calls == ['leader', 'waiter']
+    assert not pipeline._inflight
+
+
+def test_leader_failure_reaches_waiters(pipeline, monkeypatch):
+    async def fetch(access_token, params):
+        await asyncio.sleep(0.01)
+        raise pipeline.moodify.SpotifyAPIError('boom', 502)
+
+    monkeypatch.setattr(pipeline, 'fetch_spotify_recommendations_async', fetch)
+
+    async def scenario():
+        return await asyncio.gather(*[pipeline.recommendations_for_params_async('token', MOOD_PARAMS)
+                                      for _ in range(3)], return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, pipeline.moodify.SpotifyAPIError) for result in results)
+    assert not pipeline._inflight
+
+
+def test_miss_and_waiters_are_served_rotated(pipeline, monkeypatch):
+    monkeypatch.setattr(pipeline, 'fetch_spotify_recommendations_async', fake_fetch())
+
+    async def scenario():
+        first = await asyncio.gather(*[pipeline.recommendations_for_params_async('token', MOOD_PARAMS)
+                                       for _ in range(3)])
+        return first + [await pipeline.recommendations_for_params_async('token', MOOD_PARAMS)]
+
+    orders = asyncio.run(scenario())
+    assert [tracks[0] for tracks in orders] == ['a', 'b', 'c', 'a']
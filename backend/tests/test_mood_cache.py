@@ -0,0 +1,46 @@
+import time
+
+from mood_cache import MoodCache, TTLCache, normalize_mood
+
+
+def test_normalize_mood():
+    assert normalize_mood('  Chill,   NIGHT vibes!! ') == 'chill night vibes'
+
+
+def test_mood_cache_keys_on_normalized_text():
+    cache = MoodCache()
+    cache.put('Feeling CHILL!', {'genres': ['chill']})
+    assert cache.get('feeling chill') == {'genres': ['chill']}
+
+
+def test_entries_expire():
+    cache = TTLCache(ttl=0.05)
+    cache.put('a', 1)
+    assert cache.get('a') == 1
+    time.sleep(0.06)
+    assert cache.get('a') is None
+
+
+def test_least_recently_used_is_evicted():
+    cache = TTLCache(max_entries=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    assert cache.stats()['evictions'] == 1
+
+
+def test_saved_entries_survive_a_restart(tmp_path):
+    path = str(tmp_path / 'moods.json')
+    cache = MoodCache(path=path)
+    cache.put('sad', {'genres': ['blues']})
+    cache.save()
+    assert MoodCache(path=path).get('sad') == {'genres': ['blues']}
+
+
+def test_corrupt_file_is_ignored(tmp_path):
+    path = tmp_path / 'moods.json'
+    path.write_text('{not json')
+    assert len(MoodCache(path=str(path))) == 0
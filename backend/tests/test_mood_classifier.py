@@ -0,0 +1,63 @@
+import os
+
+import numpy as np
+import pytest
+
+from mood_classifier import MoodClassifier, TrainingLog, evaluate, lexicon_examples
+
+LEXICON_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'mood_lexicon.json')
+# MOOD_CLASSIFIER_THRESHOLD's default in app.py
+THRESHOLD = 0.7
+
+
+@pytest.fixture(scope='module')
+def classifier():
+    return MoodClassifier.train(lexicon_examples(LEXICON_FILE))
+
+
+@pytest.mark.parametrize('mood, genre', [('sad', 'blues'), ('happy', 'pop'), ('gym', 'hip-hop')])
+def test_known_moods_are_confident(classifier, mood, genre):
+    params, confidence = classifier.predict(mood)
+    assert genre in params['genres']
+    assert confidence >= THRESHOLD
+
+
+def test_unknown_words_have_no_confidence(classifier):
+    assert classifier.predict('banana') == (None, 0.0)
+    assert classifier.coverage('qwxz sad') == 0.5
+    assert classifier.predict('qwxz sad')[1] < THRESHOLD
+
+
+def test_seen_stem_counts_as_known(classifier):
+    # "meditat*" is seeded as "meditat"
+    assert classifier.coverage('meditation') == 1.0
+
+
+def test_save_and_load(classifier, tmp_path):
+    path = str(tmp_path / 'model.npz')
+    classifier.save(path)
+    loaded = MoodClassifier.load(path)
+    assert loaded.predict('sad') == classifier.predict('sad')
+
+
+def test_load_rejects_uncalibrated_model(classifier, tmp_path):
+    path = str(tmp_path / 'old.npz')
+    np.savez(path, genres=np.array(classifier.genres), weights=classifier.weights, dim=classifier.dim)
+    with pytest.raises(ValueError):
+        MoodClassifier.load(path)
+
+
+def test_evaluate_reports_acceptance(classifier):
+    examples = [('sad', {'genres': ['indie', 'blues']}), ('banana', {'genres': ['pop']})]
+    results = dict((threshold, (accepted, accuracy)) for threshold, accepted, accuracy in
+                   evaluate(classifier, examples, thresholds=(THRESHOLD,)))
+    assert results[THRESHOLD] == (0.5, 1.0)
+
+
+def test_training_log_skips_malformed_lines(tmp_path):
+    log = TrainingLog(str(tmp_path / 'log.jsonl'))
+    log.record('sad', {'genres': ['blues']})
+    with open(log.path, 'a', encoding='utf-8') as f:
+        f.write('not json\n')
+    log.record('happy', {'genres': ['pop']})
+    assert [mood for mood, _ in log.read()] == ['sad', 'happy']
@@ -0,0 +1,73 @@
+import pytest
+
+from mood_index import NEGATED, NEGATIVE, POSITIVE, MoodSimilarityIndex, embed_mood, mood_polarity
+
+# The index default and MOOD_SIMILARITY_THRESHOLD's default in app.py
+THRESHOLD = 0.8
+
+
+@pytest.fixture
+def index():
+    return MoodSimilarityIndex(threshold=THRESHOLD)
+
+
+@pytest.mark.parametrize('stored, query', [
+    ('feeling chill tonight', 'chill night vibes'),
+    ('relaxed evening', 'relaxing evening'),
+    ('late night driving', 'late night drive'),
+    ('rainy days blues', 'rainy day blues'),
+    ('motivation for workout', 'workout motivation'),
+])
+def test_near_duplicates_match(index, stored, query):
+    index.add(stored, {'mood': stored})
+    score, matched, value = index.lookup(query)
+    assert matched == stored and value == {'mood': stored}
+    assert score >= THRESHOLD
+
+
+@pytest.mark.parametrize('stored, query', [
+    ('rock workout', 'jazz workout'),
+    ('chill study', 'chill party'),
+    ('late night drive', 'late night study'),
+    ('rainy day', 'sunny day'),
+])
+def test_different_moods_do_not_match(index, stored, query):
+    index.add(stored, {})
+    assert index.lookup(query) is None
+
+
+@pytest.mark.parametrize('stored, query', [
+    ('sad', 'i am not sad'),
+    ('happy', 'unhappy'),
+    ('happy vibes', "don't feel happy"),
+    ('upbeat rock workout', 'sad rock workout'),
+    ('sad', 'never sad'),
+])
+def test_negation_and_opposite_valence_never_match(index, stored, query):
+    index.add(stored, {})
+    assert index.search(query) is None
+    index.add(query, {})
+    assert index.lookup(stored)[1] == stored
+
+
+def test_polarity_mask():
+    assert mood_polarity('chill night') == 0
+    assert mood_polarity('not sad') == NEGATED | NEGATIVE
+    assert mood_polarity('upbeat') == POSITIVE
+    assert mood_polarity('unwind after work') == 0
+
+
+def test_full_index_overwrites_oldest():
+    small = MoodSimilarityIndex(threshold=THRESHOLD, max_entries=2)
+    for mood in ('rock workout', 'jazz evening', 'acoustic morning'):
+        small.add(mood, mood)
+    assert len(small) == 2
+    assert small.lookup('rock workout') is None
+    assert small.lookup('acoustic morning')[1] == 'acoustic morning'
+
+
+def test_classifier_features_are_unstemmed():
+    # Saved classifiers were trained on these vectors
+    unstemmed = embed_mood('relaxing evening') @ embed_mood('relaxed evening')
+    stemmed = embed_mood('relaxing evening', stem=True) @ embed_mood('relaxed evening', stem=True)
+    assert unstemmed < THRESHOLD <= stemmed
@@ -0,0 +1,48 @@
+import os
+
+import pytest
+
+from mood_lexicon import MoodLexicon
+
+LEXICON_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'mood_lexicon.json')
+
+# The keyword branches app.py had before the lexicon: words, genres, (valence, energy, danceability)
+LEGACY_BRANCHES = [
+    (['chill', 'calm', 'relax', 'peaceful'], {'ambient', 'chill', 'new-age'}, (0.3, 0.2, 0.3)),
+    (['happy', 'upbeat', 'energetic'], {'pop', 'dance', 'disco'}, (0.8, 0.8, 0.7)),
+    (['sad', 'melancholy', 'depressed', 'blue'], {'indie', 'alternative', 'blues'}, (0.2, 0.3, 0.2)),
+    (['workout', 'gym', 'exercise', 'run'], {'hip-hop', 'electronic', 'techno'}, (0.7, 0.9, 0.8)),
+    (['focus', 'study', 'concentration'], {'ambient', 'classical', 'electronic'}, (0.4, 0.3, 0.2)),
+    # "party" shared the happy branch; it has its own, more danceable profile now
+    (['party'], {'dance', 'house', 'pop'}, (0.8, 0.9, 0.9)),
+]
+
+
+@pytest.fixture(scope='module')
+def lexicon():
+    return MoodLexicon.load(LEXICON_FILE)
+
+
+@pytest.mark.parametrize('words, genres, features', LEGACY_BRANCHES)
+def test_legacy_keywords_keep_their_profile(lexicon, words, genres, features):
+    for word in words:
+        for mood in (word, f'feeling {word}'):
+            params = lexicon.analyze(mood)
+            assert set(params['genres'][:3]) == genres, mood
+            for name, expected in zip(('valence', 'energy', 'danceability'), features):
+                assert params['audio_features'][name] == pytest.approx(expected, abs=0.1), (mood, name)
+
+
+def test_unknown_mood_gets_default(lexicon):
+    assert lexicon.analyze('qwxz') == {'genres': ['pop'],
+                                       'audio_features': {'valence': 0.5, 'energy': 0.5, 'danceability': 0.5}}
+
+
+def test_longer_phrase_wins(lexicon):
+    assert lexicon.analyze('low energy')['audio_features']['energy'] < 0.3
+    assert lexicon.analyze('energetic')['audio_features']['energy'] > 0.7
+
+
+def test_unknown_profile_rejected():
+    with pytest.raises(ValueError):
+        MoodLexicon({'default': {}, 'profiles': {}, 'terms': {'x': {'missing': 1.0}}})
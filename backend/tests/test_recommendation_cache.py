@@ -0,0 +1,28 @@
+from recommendation_cache import RecommendationCache, canonical_key
+
+PARAMS = {'seed_genres': 'pop,dance', 'limit': 3}
+
+
+def test_canonical_key_ignores_order():
+    assert canonical_key({'a': 1, 'b': 2}) == canonical_key({'b': 2, 'a': 1})
+
+
+def test_get_rotates_from_the_first_serve():
+    cache = RecommendationCache()
+    fetches = []
+
+    def fetch(params):
+        fetches.append(params)
+        return ['a', 'b', 'c']
+
+    assert [cache.get(PARAMS, fetch)[0] for _ in range(4)] == ['a', 'b', 'c', 'a']
+    assert len(fetches) == 1
+
+
+def test_serve_matches_get_for_callers_that_fetch_themselves():
+    cache = RecommendationCache()
+    cache.put(PARAMS, ['a', 'b', 'c'])
+    assert cache.serve(PARAMS, ['a', 'b', 'c']) == ['a', 'b', 'c']
+    tracks, stale = cache.lookup(PARAMS)
+    assert tracks == ['b', 'c', 'a'] and not stale
+    assert RecommendationCache().serve(PARAMS, ['x']) == ['x']
@@ -0,0 +1,73 @@
+import time
+
+import pytest
+
+from spotify_client import SpotifyAPIError
+
+
+@pytest.fixture
+def moodify():
+    import app
+
+    app.app.config['TESTING'] = True
+    return app
+
+
+@pytest.fixture
+def client(moodify):
+    return moodify.app.test_client()
+
+
+def log_in(client, **tokens):
+    with client.session_transaction() as sess:
+        sess.update(tokens)
+
+
+LOGIN_REQUIRED = {'error': 'Please log in with Spotify first', 'redirect': '/login'}
+
+
+@pytest.mark.parametrize('path', ['/api/recommendations?mood=happy', '/api/recommendations/stream?mood=happy'])
+def test_logged_out_gets_json_401(client, path):
+    response = client.get(path)
+    assert response.status_code == 401
+    assert response.get_json() == LOGIN_REQUIRED
+
+
+def test_stream_with_unrefreshable_token_gets_json_401(client):
+    log_in(client, access_token='expired', token_expires_at=time.time() - 60)
+    response = client.get('/api/recommendations/stream?mood=happy')
+    assert response.status_code == 401
+    assert response.get_json() == LOGIN_REQUIRED
+
+
+def test_stream_with_revoked_refresh_token_gets_json_401(client, moodify, monkeypatch):
+    def refresh(session):
+        raise SpotifyAPIError('Token refresh failed: invalid_grant', 400)
+
+    monkeypatch.setattr(moodify.token_manager, 'refresh', refresh)
+    log_in(client, access_token='expired', refresh_token='revoked', token_expires_at=time.time() - 60)
+    response = client.get('/api/recommendations/stream?mood=happy')
+    assert response.status_code == 401
+    assert response.get_json() == LOGIN_REQUIRED
+
+
+def test_recommendations_with_unrefreshable_token_gets_json_401(client, moodify, monkeypatch):
+    def recommend_for_mood(access_token, mood):
+        raise SpotifyAPIError('The access token expired', 401)
+
+    monkeypatch.setattr(moodify, 'recommend_for_mood', recommend_for_mood)
+    log_in(client, access_token='expired')
+    response = client.get('/api/recommendations?mood=happy')
+    assert response.status_code == 401
+    assert response.get_json() == LOGIN_REQUIRED
+
+
+def test_other_stream_failures_are_json_500(client, moodify, monkeypatch):
+    def refresh(session):
+        raise SpotifyAPIError('Token refresh failed: server error', 503)
+
+    monkeypatch.setattr(moodify.token_manager, 'refresh', refresh)
+    log_in(client, access_token='expired', refresh_token='ok', token_expires_at=time.time() - 60)
+    response = client.get('/api/recommendations/stream?mood=happy')
+    assert response.status_code == 500
+    assert 'server error' in response.get_json()['error']
@@ -0,0 +1,101 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from session_store import SQLiteSessionTier, SessionStore, create_session_store
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def write_in_other_process(path, sid, data):
+    """Save a session the way another gunicorn worker would"""
+    code = ('import sys; from session_store import create_session_store; '
+            'create_session_store("sqlite", sys.argv[1], sweep_interval=0).save(sys.argv[2], eval(sys.argv[3]))')
+    subprocess.run([sys.executable, '-c', code, path, sid, repr(data)], cwd=BACKEND_DIR, check=True)
+
+
+class CountingTier(SQLiteSessionTier):
+    def __init__(self, path):
+        super().__init__(path)
+        self.version_checks = 0
+
+    def version(self, sid, now):
+        self.version_checks += 1
+        return super().version(sid, now)
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'sessions.db')
+
+
+def test_rewrite_in_other_process_invalidates_cached_copy(path):
+    store = create_session_store('sqlite', path, sweep_interval=0, validate_interval=0)
+    store.save('alice', {'access_token': 'old'})
+    store.save('bob', {'access_token': 'bob'})
+    assert store.get('alice')[1] == {'access_token': 'old'}
+
+    write_in_other_process(path, 'alice', {'access_token': 'new'})
+
+    assert store.get('alice')[1] == {'access_token': 'new'}
+    assert store.get('bob')[1] == {'access_token': 'bob'}
+    assert store.stats()['invalidations'] == 1
+
+
+def test_delete_in_other_process_logs_out(path):
+    store = create_session_store('sqlite', path, sweep_interval=0, validate_interval=0)
+    store.save('alice', {'access_token': 'token'})
+    create_session_store('sqlite', path, sweep_interval=0).delete('alice')
+    assert store.get('alice') is None
+
+
+def test_hits_within_validate_interval_skip_sqlite(path):
+    tier = CountingTier(path)
+    store = SessionStore(tier, sweep_interval=0, validate_interval=60)
+    store.save('alice', {'access_token': 'old'})
+    write_in_other_process(path, 'alice', {'access_token': 'new'})
+
+    for _ in range(50):
+        assert store.get('alice')[1] == {'access_token': 'old'}
+    assert tier.version_checks == 0
+
+    store.validate_interval = 0  # the interval has passed
+    assert store.get('alice')[1] == {'access_token': 'new'}
+    assert tier.version_checks == 1
+
+
+def test_memory_store_has_no_durable_checks():
+    store = create_session_store('memory', sweep_interval=0)
+    store.save('alice', {'x': 1})
+    assert store.get('alice')[1] == {'x': 1}
+    assert store.get('nobody') is None
+
+
+def test_threads_use_their_own_connections(path):
+    tier = SQLiteSessionTier(path)
+    connections = []
+
+    def connect():
+        connections.append(tier._connect())
+
+    threads = [threading.Thread(target=connect) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(conn) for conn in connections}) == 3
+
+
+def test_unversioned_file_is_migrated(path):
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE sessions (sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)')
+    conn.execute("INSERT INTO sessions VALUES ('alice', '{\"a\": 1}', ?)", (time.time() + 60,))
+    conn.commit()
+    conn.close()
+    store = create_session_store('sqlite', path, sweep_interval=0)
+    assert store.get('alice')[1] == {'a': 1}
@@ -0,0 +1,87 @@
+import threading
+import time
+
+import pytest
+
+from spotify_client import SpotifyAPIError
+from token_manager import ClientCredentialsProvider, TokenManager
+
+
+def expiring_session(**extra):
+    return {'access_token': 'old', 'refresh_token': 'refresh', 'token_expires_at': time.time() + 5, **extra}
+
+
+def test_concurrent_refreshes_share_one_call():
+    calls = []
+    release = threading.Event()
+
+    def refresh(refresh_token):
+        calls.append(refresh_token)
+        release.wait(1)
+        return {'access_token': 'new', 'expires_in': 3600}
+
+    manager = TokenManager(refresh)
+    sessions = [expiring_session() for _ in range(5)]
+    tokens = []
+    threads = [threading.Thread(target=lambda s=s: tokens.append(manager.access_token(s))) for s in sessions]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert calls == ['refresh']
+    assert tokens == ['new'] * 5
+    assert all(session['token_expires_at'] > time.time() + 3000 for session in sessions)
+
+
+def test_call_refreshes_once_on_401():
+    manager = TokenManager(lambda refresh_token: {'access_token': 'new', 'expires_in': 3600})
+    seen = []
+
+    def fn(token):
+        seen.append(token)
+        if token == 'old':
+            raise SpotifyAPIError('expired', 401)
+        return 'ok'
+
+    session = {'access_token': 'old', 'refresh_token': 'refresh'}
+    assert manager.call(session, fn) == 'ok'
+    assert seen == ['old', 'new']
+
+
+def test_other_errors_are_not_retried():
+    manager = TokenManager(lambda refresh_token: pytest.fail('should not refresh'))
+
+    def fn(token):
+        raise SpotifyAPIError('bad request', 400)
+
+    with pytest.raises(SpotifyAPIError):
+        manager.call({'access_token': 'old', 'refresh_token': 'refresh'}, fn)
+
+
+def test_expired_token_without_refresh_token_is_401():
+    manager = TokenManager(lambda refresh_token: pytest.fail('should not refresh'))
+    with pytest.raises(SpotifyAPIError) as raised:
+        manager.access_token({'access_token': 'old', 'token_expires_at': time.time() - 1})
+    assert raised.value.status_code == 401
+
+
+def test_client_credentials_are_cached_and_invalidated():
+    fetched = []
+
+    def fetch():
+        fetched.append(1)
+        return {'access_token': f'app-{len(fetched)}', 'expires_in': 3600}
+
+    provider = ClientCredentialsProvider(fetch)
+    try:
+        assert provider.token() == provider.token() == 'app-1'
+        provider.invalidate('stale')  # already replaced: keep the current one
+        assert provider.token() == 'app-1'
+        provider.invalidate('app-1')
+        assert provider.token() == 'app-2'
+    finally:
+        if provider._timer is not None:
+            provider._timer.cancel()
@@ -0,0 +1,143 @@
+import asyncio
+import time
+
+import pytest
+
+from upstream_scheduler import (BULK, INTERACTIVE, AsyncPrioritySemaphore, LocalRateState, RateLimited,
+                                SQLiteRateState, UpstreamScheduler, endpoint_for, retry_after_seconds)
+
+URL = 'https://api.spotify.com/v1/recommendations'
+
+
+class Response:
+    def __init__(self, status_code, retry_after=None):
+        self.status_code = status_code
+        self.headers = {'Retry-After': retry_after} if retry_after is not None else {}
+
+
+def replay(*responses):
+    """send() stand-in returning the given responses in turn; .calls counts them"""
+    queue = list(responses)
+
+    def send():
+        send.calls += 1
+        return queue.pop(0)
+
+    send.calls = 0
+    return send
+
+
+def test_endpoint_for():
+    assert endpoint_for(URL) == 'recommendations'
+    assert endpoint_for('https://api.spotify.com/v1/playlists/abc/tracks') == 'playlists-tracks'
+
+
+def test_retry_after_seconds():
+    assert retry_after_seconds('3') == 3.0
+    assert retry_after_seconds(None) == 1.0
+    assert retry_after_seconds('soon') == 1.0
+
+
+def test_429_is_requeued_after_retry_after():
+    scheduler = UpstreamScheduler(max_wait=5)
+    send = replay(Response(429, '0.05'), Response(200))
+    started = time.monotonic()
+    assert scheduler.run(URL, send).status_code == 200
+    assert send.calls == 2
+    assert time.monotonic() - started >= 0.04
+    assert scheduler.stats()['throttled'] == 1
+    assert scheduler.stats()['requeued'] == 1
+
+
+def test_429_beyond_budget_gives_up_with_the_response():
+    scheduler = UpstreamScheduler(max_wait=1)
+    send = replay(Response(429, '30'))
+    assert scheduler.run(URL, send).status_code == 429
+    assert send.calls == 1
+    assert scheduler.stats()['gave_up'] == 1
+
+
+def test_held_endpoint_fails_fast_instead_of_sleeping_out_the_budget():
+    scheduler = UpstreamScheduler(max_wait=2)
+    scheduler.state.hold('recommendations', time.time() + 30)
+    send = replay(Response(200))
+    started = time.monotonic()
+    with pytest.raises(RateLimited) as raised:
+        scheduler.run(URL, send)
+    assert time.monotonic() - started < 0.5
+    assert send.calls == 0
+    assert raised.value.status_code == 429
+    assert scheduler.stats()['gave_up'] == 1
+
+
+def test_failed_reservation_is_refunded():
+    state = LocalRateState()
+    scheduler = UpstreamScheduler(state=state, rate=1, burst=1, max_wait=0.5)
+    assert scheduler.run(URL, replay(Response(200))).status_code == 200
+    for _ in range(5):
+        with pytest.raises(RateLimited):
+            scheduler.run(URL, replay(Response(200)))
+    # Five rejected calls must not have borrowed five more seconds of tokens
+    assert state.reserve('recommendations', 1, 1, time.time()) < 1.5
+
+
+def test_sqlite_state_shares_holds_and_refunds(tmp_path):
+    path = str(tmp_path / 'rate.db')
+    first, second = SQLiteRateState(path), SQLiteRateState(path)
+    now = time.time()
+    first.hold('me', now + 10)
+    assert second.reserve('me', 10, 10, now) == pytest.approx(10, abs=0.01)
+    assert second.reserve('playlists', 1, 1, now) == 0
+    assert second.reserve('playlists', 1, 1, now) == pytest.approx(1)
+    first.refund('playlists', 1)
+    assert second.reserve('playlists', 1, 1, now) == pytest.approx(1)
+
+
+def test_run_async_requeues_and_fails_fast():
+    scheduler = UpstreamScheduler(max_wait=2)
+
+    async def scenario():
+        responses = [Response(429, '0.05'), Response(200)]
+
+        async def send():
+            return responses.pop(0)
+
+        assert (await scheduler.run_async(URL, send, BULK)).status_code == 200
+        scheduler.state.hold('recommendations', time.time() + 30)
+        with pytest.raises(RateLimited):
+            await scheduler.run_async(URL, send)
+
+    asyncio.run(scenario())
+    assert scheduler.stats()['requeued'] == 1
+    assert scheduler.stats()['gave_up'] == 1
+
+
+def test_async_slots_wake_interactive_before_bulk():
+    async def scenario():
+        slots = AsyncPrioritySemaphore(1)
+        order = []
+        release = asyncio.Event()
+
+        async def holder():
+            async with slots.slot():
+                await release.wait()
+
+        async def waiter(name, priority):
+            async with slots.slot(priority):
+                order.append(name)
+
+        tasks = [asyncio.create_task(holder())]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(waiter('bulk', BULK)))
+        cancelled = asyncio.create_task(waiter('cancelled', INTERACTIVE))
+        tasks.append(asyncio.create_task(waiter('interactive', INTERACTIVE)))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(*tasks)
+        return order, slots
+
+    order, slots = asyncio.run(scenario())
+    assert order == ['interactive', 'bulk']
+    assert slots.waiting == 0
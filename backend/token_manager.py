@@ -0,0 +1,189 @@
+"""
+Spotify access token management.
+
+TokenManager refreshes per-user tokens shortly before their absolute expiry.
+Concurrent requests from the same user (keyed on the refresh token) share one
+refresh call, and a result is reused for a short window so requests still
+carrying the old cookie don't refresh again. An unexpected 401 triggers one
+refresh and a single retry.
+
+ClientCredentialsProvider caches the app-level (client credentials) token for
+calls that don't act on behalf of a user, refreshing it in the background
+before it expires.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+from spotify_client import SpotifyAPIError
+
+logger = logging.getLogger(__name__)
+
+
+def store_token(session, token_data, obtained_at=None):
+    """Write a token response into the session, tracking absolute expiry"""
+    expires_in = token_data.get('expires_in', 3600)
+    session['access_token'] = token_data['access_token']
+    session['token_expires_in'] = expires_in
+    session['token_expires_at'] = (obtained_at or time.time()) + expires_in
+    # Spotify only sometimes rotates the refresh token
+    if token_data.get('refresh_token'):
+        session['refresh_token'] = token_data['refresh_token']
+
+
+class TokenManager:
+    """Single-flight access-token refresher shared by all request threads"""
+
+    def __init__(self, refresh, margin=60, reuse_window=30):
+        self._refresh_fn = refresh
+        self.margin = margin
+        self.reuse_window = reuse_window
+        self.refreshes = 0
+        self.shared_refreshes = 0
+        self._inflight = {}
+        self._recent = {}
+        self._lock = threading.Lock()
+
+    def needs_refresh(self, session):
+        expires_at = session.get('token_expires_at')
+        return bool(session.get('refresh_token')) and expires_at is not None \
+            and expires_at - time.time() < self.margin
+
+    def access_token(self, session):
+        """Return a usable access token, refreshing it first if it is about to expire"""
+        if self.needs_refresh(session):
+            return self.refresh(session)
+        expires_at = session.get('token_expires_at')
+        if expires_at is not None and expires_at <= time.time():
+            # Nothing to refresh with; Spotify would only answer 401
+            raise SpotifyAPIError('Access token expired and there is no refresh token; please log in again', 401)
+        return session['access_token']
+
+    def refresh(self, session):
+        """Refresh the session's token, sharing the call with concurrent requests"""
+        refresh_token = session.get('refresh_token')
+        if not refresh_token:
+            raise SpotifyAPIError('Session has no refresh token; please log in again', 401)
+
+        now = time.time()
+        with self._lock:
+            for key, (token_data, obtained_at) in list(self._recent.items()):
+                if now - obtained_at > self.reuse_window:
+                    del self._recent[key]
+            recent = self._recent.get(refresh_token)
+            if recent and recent[0]['access_token'] != session.get('access_token'):
+                self.shared_refreshes += 1
+                store_token(session, *recent)
+                return session['access_token']
+            future = self._inflight.get(refresh_token)
+            leader = future is None
+            if leader:
+                future = self._inflight[refresh_token] = Future()
+            else:
+                self.shared_refreshes += 1
+
+        if leader:
+            try:
+                token_data = self._refresh_fn(refresh_token)
+                obtained_at = time.time()
+                self.refreshes += 1
+                with self._lock:
+                    self._recent[refresh_token] = (token_data, obtained_at)
+                future.set_result((token_data, obtained_at))
+            except BaseException as e:
+                future.set_exception(e)
+                raise
+            finally:
+                with self._lock:
+                    self._inflight.pop(refresh_token, None)
+
+        store_token(session, *future.result())
+        return session['access_token']
+
+    def call(self, session, fn):
+        """Run fn(access_token); on a 401, refresh once and retry"""
+        token = self.access_token(session)
+        try:
+            return fn(token)
+        except SpotifyAPIError as e:
+            if e.status_code != 401 or not session.get('refresh_token'):
+                raise
+            logger.info("Spotify returned 401, refreshing access token and retrying")
+            return fn(self.refresh(session))
+
+    def stats(self):
+        return {
+            'refreshes': self.refreshes,
+            'shared_refreshes': self.shared_refreshes,
+            'in_flight': len(self._inflight),
+        }
+
+
+class ClientCredentialsProvider:
+    """Process-wide cache of the client-credentials token, safe to share across threads"""
+
+    def __init__(self, fetch, margin=60):
+        self._fetch = fetch
+        self.margin = margin
+        self.fetches = 0
+        self.background_refreshes = 0
+        self._token = None
+        self._expires_at = 0
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def token(self):
+        """Return a valid app token, fetching one only when none is cached"""
+        token, expires_at = self._token, self._expires_at
+        if token and expires_at - time.time() > 0:
+            return token
+        with self._lock:
+            # Another thread may have fetched while we waited for the lock
+            if self._token and self._expires_at - time.time() > 0:
+                return self._token
+            return self._refresh_locked()
+
+    def invalidate(self, token=None):
+        """Forget the cached token (e.g. after a 401), unless it was already replaced"""
+        with self._lock:
+            if token is None or token == self._token:
+                self._token = None
+                self._expires_at = 0
+
+    def _refresh_locked(self):
+        token_data = self._fetch()
+        expires_in = token_data.get('expires_in', 3600)
+        self._token = token_data['access_token']
+        self._expires_at = time.time() + expires_in
+        self.fetches += 1
+        self._schedule(max(1, expires_in - self.margin))
+        return self._token
+
+    def _schedule(self, delay):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(delay, self._refresh_in_background)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _refresh_in_background(self):
+        try:
+            with self._lock:
+                self._refresh_locked()
+                self.background_refreshes += 1
+        except Exception as e:
+            logger.warning("Background client-credentials refresh failed: %s", e)
+            # Retry soon; requests keep using the current token until it expires, after
+            # which the next token() call fetches synchronously
+            remaining = self._expires_at - time.time()
+            if remaining > 1:
+                self._schedule(min(30, remaining - 1))
+
+    def stats(self):
+        return {
+            'has_token': self._token is not None,
+            'expires_in': max(0, round(self._expires_at - time.time())) if self._token else 0,
+            'fetches': self.fetches,
+            'background_refreshes': self.background_refreshes,
+        }
@@ -0,0 +1,106 @@
+"""
+Per-track metadata cache.
+
+Display metadata (name, artist, album, image, preview and Spotify URL) is keyed
+by track id in a bounded TTL + LRU cache, optionally persisted to disk. Misses
+are fetched in batches through Spotify's multi-id endpoints, and a track that
+is already being fetched for another request is waited on rather than fetched
+again.
+"""
+import threading
+from concurrent.futures import Future
+
+from mood_cache import TTLCache
+from track_record import Track
+
+
+class TrackMetadataCache(TTLCache):
+    """TTLCache of track metadata with batched, coalesced fills"""
+
+    name = 'track metadata cache'
+
+    def __init__(self, max_entries=10000, ttl=86400, path=None, save_interval=60, batch_size=50):
+        super().__init__(max_entries=max_entries, ttl=ttl, path=path, save_interval=save_interval)
+        self.batch_size = batch_size
+        self.batches = 0
+        self.coalesced = 0
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+
+    def _encode(self, track):
+        return track.to_dict()
+
+    def _decode(self, data):
+        return Track.from_dict(data)
+
+    def put_many(self, tracks):
+        """Cache already-fetched Track records (e.g. from a /recommendations response)"""
+        for track in tracks:
+            self.put(track.id, track)
+
+    def get_many(self, track_ids, fetch):
+        """Return metadata for ``track_ids`` in order, skipping ids Spotify doesn't know.
+
+        ``fetch(ids)`` is called with at most ``batch_size`` ids and returns a
+        {track_id: track} dict.
+        """
+        found = {}
+        missing = []
+        for track_id in dict.fromkeys(track_ids):
+            track = self.get(track_id)
+            if track is None:
+                missing.append(track_id)
+            else:
+                found[track_id] = track
+
+        if missing:
+            waiting = {}
+            mine = []
+            with self._inflight_lock:
+                for track_id in missing:
+                    future = self._inflight.get(track_id)
+                    if future is None:
+                        future = self._inflight[track_id] = Future()
+                        mine.append(track_id)
+                    else:
+                        self.coalesced += 1
+                    waiting[track_id] = future
+            if mine:
+                self._fill(mine, fetch)
+            for track_id, future in waiting.items():
+                track = future.result()
+                if track is not None:
+                    found[track_id] = track
+
+        return [found[track_id] for track_id in track_ids if track_id in found]
+
+    def _fill(self, track_ids, fetch):
+        try:
+            for i in range(0, len(track_ids), self.batch_size):
+                batch = track_ids[i:i + self.batch_size]
+                tracks = fetch(batch)
+                self.batches += 1
+                for track_id in batch:
+                    track = tracks.get(track_id)
+                    if track is not None:
+                        self.put(track_id, track)
+                    self._resolve(track_id, result=track)
+        except BaseException as e:
+            for track_id in track_ids:
+                self._resolve(track_id, error=e)
+            raise
+
+    def _resolve(self, track_id, result=None, error=None):
+        with self._inflight_lock:
+            future = self._inflight.pop(track_id, None)
+        if future is None:
+            return
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+
+    def stats(self):
+        stats = super().stats()
+        stats.update({'batches': self.batches, 'coalesced': self.coalesced, 'in_flight': len(self._inflight)})
+        return stats
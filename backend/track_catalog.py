@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Local audio-feature catalog for recommendations without Spotify's /recommendations.
+
+A catalog is a directory of NumPy arrays that every worker memory-maps:
+
+    ids.npy            S22     Spotify track ids, one row per track
+    features.npy       float32 (rows, 3) valence, energy, danceability
+    genre_rows.npy     int32   row numbers grouped by genre
+    genre_features.npy float32 features.npy reordered to match genre_rows
+    genre_offsets.npy  int64   genre i owns genre_rows[offsets[i]:offsets[i + 1]]
+    genres.json                genre names in index order
+
+Each genre's features are a contiguous slice, so a search reads only the
+requested genres and ranks them by squared distance to the target audio
+features with one vectorized pass per genre.
+
+Build a catalog from JSONL or CSV rows of id, genres, valence, energy and
+danceability (genres as a list, or "|"-separated in CSV):
+
+    python backend/track_catalog.py ingest tracks.jsonl --out backend/catalog
+    python backend/track_catalog.py search backend/catalog --genres chill,ambient --energy 0.2
+"""
+import argparse
+import csv
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+FEATURES = ('valence', 'energy', 'danceability')
+ID_DTYPE = 'S22'
+
+
+class TrackCatalog:
+    """Memory-mapped columnar track store with genre-filtered nearest-neighbor search"""
+
+    def __init__(self, ids, features, genres, genre_offsets, genre_rows, genre_features):
+        self.ids = ids
+        self.features = features
+        self.genres = list(genres)
+        self.genre_offsets = genre_offsets
+        self.genre_rows = genre_rows
+        self.genre_features = genre_features
+        self._genre_index = {genre: i for i, genre in enumerate(self.genres)}
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        mode = 'r' if mmap else None
+        with open(os.path.join(path, 'genres.json'), 'r', encoding='utf-8') as f:
+            genres = json.load(f)
+        return cls(
+            np.load(os.path.join(path, 'ids.npy'), mmap_mode=mode),
+            np.load(os.path.join(path, 'features.npy'), mmap_mode=mode),
+            genres,
+            np.load(os.path.join(path, 'genre_offsets.npy')),
+            np.load(os.path.join(path, 'genre_rows.npy'), mmap_mode=mode),
+            np.load(os.path.join(path, 'genre_features.npy'), mmap_mode=mode),
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _blocks(self, genres):
+        """(rows, features) for each requested genre, or the whole catalog when none is known"""
+        blocks = []
+        for genre in dict.fromkeys(genres or ()):
+            i = self._genre_index.get(genre)
+            if i is not None:
+                start, end = self.genre_offsets[i], self.genre_offsets[i + 1]
+                blocks.append((self.genre_rows[start:end], self.genre_features[start:end]))
+        return blocks or [(None, self.features)]
+
+    def search(self, audio_features, genres=None, k=10, exclude=None):
+        """Return up to ``k`` track ids closest to the target features, preferring ``genres``"""
+        target = np.array([audio_features.get(name, 0.0) for name in FEATURES], dtype=np.float32)
+        weights = np.array([1.0 if name in audio_features else 0.0 for name in FEATURES], dtype=np.float32)
+        want = k + len(exclude or ())
+
+        # Best ``want`` of every genre, merged: a track in two genres may show up twice
+        found_rows, found_distances = [], []
+        for rows, features in self._blocks(genres):
+            if not len(features):
+                continue
+            diff = features - target
+            distances = (diff * diff) @ weights
+            nearest = np.argpartition(distances, min(want, len(distances)) - 1)[:want]
+            found_rows.append(nearest if rows is None else rows[nearest])
+            found_distances.append(distances[nearest])
+        if not found_rows:
+            return []
+        rows = np.concatenate(found_rows)
+        order = np.argsort(np.concatenate(found_distances), kind='stable')
+
+        ids = []
+        seen = set(exclude or ())
+        for track_id in self.ids[rows[order]]:
+            track_id = track_id.decode('ascii')
+            if track_id not in seen:
+                seen.add(track_id)
+                ids.append(track_id)
+                if len(ids) == k:
+                    break
+        return ids
+
+
+def write_catalog(path, tracks):
+    """Write (id, genres, features) tuples as a catalog directory, replacing any existing one"""
+    ids, features, genre_lists = [], [], []
+    for track_id, genres, values in tracks:
+        ids.append(track_id)
+        features.append(values)
+        genre_lists.append(genres)
+
+    genre_names = sorted({genre for genres in genre_lists for genre in genres})
+    genre_index = {genre: i for i, genre in enumerate(genre_names)}
+    members = [[] for _ in genre_names]
+    for row, genres in enumerate(genre_lists):
+        for genre in set(genres):
+            members[genre_index[genre]].append(row)
+    offsets = np.zeros(len(genre_names) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(rows) for rows in members])
+    genre_rows = np.array([row for rows in members for row in rows], dtype=np.int32)
+    features = np.array(features, dtype=np.float32).reshape(-1, len(FEATURES))
+
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix='.catalog-', dir=parent)
+    np.save(os.path.join(tmp, 'ids.npy'), np.array(ids, dtype=ID_DTYPE))
+    np.save(os.path.join(tmp, 'features.npy'), features)
+    np.save(os.path.join(tmp, 'genre_offsets.npy'), offsets)
+    np.save(os.path.join(tmp, 'genre_rows.npy'), genre_rows)
+    np.save(os.path.join(tmp, 'genre_features.npy'), features[genre_rows])
+    with open(os.path.join(tmp, 'genres.json'), 'w', encoding='utf-8') as f:
+        json.dump(genre_names, f)
+
+    # Workers that already mapped the old files keep reading them until they reload
+    if os.path.exists(path):
+        old = f'{path}.old'
+        shutil.rmtree(old, ignore_errors=True)
+        os.replace(path, old)
+        os.replace(tmp, path)
+        shutil.rmtree(old, ignore_errors=True)
+    else:
+        os.replace(tmp, path)
+    return len(ids)
+
+
+def read_tracks(path):
+    """Yield (id, genres, features) from a JSONL or CSV file, skipping incomplete rows"""
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        if path.endswith('.csv'):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for row in rows:
+            try:
+                genres = row['genres']
+                if isinstance(genres, str):
+                    genres = [genre.strip() for genre in genres.split('|') if genre.strip()]
+                yield row['id'], genres, [float(row[name]) for name in FEATURES]
+            except (KeyError, TypeError, ValueError):
+                continue
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or query the local track catalog')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    ingest = commands.add_parser('ingest', help='build a catalog from JSONL or CSV tracks')
+    ingest.add_argument('input')
+    ingest.add_argument('--out', required=True, help='catalog directory to write')
+
+    search = commands.add_parser('search', help='query a catalog')
+    search.add_argument('catalog')
+    search.add_argument('--genres', default='')
+    search.add_argument('-k', type=int, default=10)
+    for name in FEATURES:
+        search.add_argument(f'--{name}', type=float)
+
+    args = parser.parse_args()
+    if args.command == 'ingest':
+        count = write_catalog(args.out, read_tracks(args.input))
+        print(f"✅ Wrote {count} tracks to {args.out}")
+    else:
+        catalog = TrackCatalog.load(args.catalog)
+        target = {name: getattr(args, name) for name in FEATURES if getattr(args, name) is not None}
+        genres = [genre for genre in args.genres.split(',') if genre]
+        for track_id in catalog.search(target, genres, k=args.k):
+            print(track_id)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Compact track record and JSON helpers for recommendation responses.
+
+Track keeps only the fields the UI renders, in ``__slots__`` instead of a
+per-track dict, and is built from a raw Spotify track object in one pass so the
+raw payload can be dropped straight away.
+
+dumps_json/loads_json use orjson when it is installed (and FAST_JSON isn't
+disabled), falling back to the standard library otherwise.
+"""
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+FIELDS = ('id', 'name', 'artist', 'album', 'image', 'preview_url', 'external_url')
+FAST_JSON = orjson is not None and os.getenv('FAST_JSON', 'true').lower() == 'true'
+
+
+class Track:
+    """A recommended track: the display fields only, without a per-instance dict"""
+
+    __slots__ = FIELDS
+
+    def __init__(self, id, name, artist, album, image=None, preview_url=None, external_url=None):
+        self.id = id
+        self.name = name
+        self.artist = artist
+        self.album = album
+        self.image = image
+        self.preview_url = preview_url
+        self.external_url = external_url
+
+    @classmethod
+    def from_spotify(cls, track):
+        """Pick the display fields out of a Spotify track object"""
+        album = track['album']
+        images = album['images']
+        return cls(
+            track['id'],
+            track['name'],
+            ', '.join([artist['name'] for artist in track['artists']]),
+            album['name'],
+            images[0]['url'] if images else None,
+            track.get('preview_url'),
+            track['external_urls']['spotify'],
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{field: data.get(field) for field in FIELDS})
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'artist': self.artist,
+            'album': self.album,
+            'image': self.image,
+            'preview_url': self.preview_url,
+            'external_url': self.external_url,
+        }
+
+    def __eq__(self, other):
+        return isinstance(other, Track) and all(getattr(self, f) == getattr(other, f) for f in FIELDS)
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __repr__(self):
+        return f'Track(id={self.id!r}, name={self.name!r}, artist={self.artist!r})'
+
+
+def json_default(value):
+    """Serialize Track records for json/orjson"""
+    if isinstance(value, Track):
+        return value.to_dict()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def dumps_json(value, default=json_default, sort_keys=False, indent=None):
+    """Encode ``value`` to UTF-8 JSON bytes"""
+    if FAST_JSON:
+        option = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(value, default=default, option=option)
+    return json.dumps(value, default=default, sort_keys=sort_keys, indent=indent,
+                      ensure_ascii=False).encode('utf-8')
+
+
+def loads_json(data):
+    """Decode JSON from bytes or str"""
+    if FAST_JSON:
+        return orjson.loads(data)
+    return json.loads(data)
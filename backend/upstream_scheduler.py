@@ -0,0 +1,350 @@
+"""
+Rate-limit-aware scheduling of outbound Spotify calls.
+
+Every call passes through three gates before it is sent:
+
+1. a hold set by an earlier 429: the endpoint is paused until ``Retry-After``
+   has elapsed, and the call is requeued instead of failing (unless that is
+   past the ``max_wait`` budget, in which case it fails at once);
+2. a per-endpoint token bucket, which spaces bursts out;
+3. a global concurrency cap, handed out by priority so interactive
+   recommendation calls overtake bulk playlist writes.
+
+Holds and buckets live in a rate state backend. ``LocalRateState`` covers one
+process; ``SQLiteRateState`` shares them between worker processes through a
+local SQLite file.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+INTERACTIVE = 0
+BULK = 10
+
+logger = logging.getLogger(__name__)
+
+
+def endpoint_for(url):
+    """Name the rate-limit bucket for a URL, e.g. /v1/playlists/{id}/tracks -> playlists-tracks"""
+    parts = [part for part in urlsplit(url).path.split('/') if part and part not in ('v1', 'api')]
+    if not parts:
+        return 'root'
+    if len(parts) >= 3:
+        return f'{parts[0]}-{parts[2]}'
+    return parts[0]
+
+
+def parse_rate_limits(value):
+    """Parse "endpoint=rate:burst,..." into {endpoint: (rate, burst)}"""
+    limits = {}
+    for item in (value or '').split(','):
+        endpoint, sep, spec = item.strip().partition('=')
+        if not sep:
+            continue
+        rate, _, burst = spec.partition(':')
+        try:
+            limits[endpoint.strip()] = (float(rate), float(burst or rate))
+        except ValueError:
+            continue
+    return limits
+
+
+def retry_after_seconds(value, default=1.0):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)"""
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+class RateLimited(Exception):
+    """An endpoint is held by a 429 for longer than the scheduler may wait"""
+
+    status_code = 429
+
+    def __init__(self, endpoint, retry_after):
+        super().__init__(f'Spotify {endpoint} is rate limited for another {retry_after:.1f}s')
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+
+class LocalRateState:
+    """Holds and token buckets for a single process"""
+
+    def __init__(self):
+        self._buckets = {}
+        self._holds = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, endpoint, rate, burst, now):
+        """Take one token (possibly borrowing from the future); return seconds to wait"""
+        with self._lock:
+            tokens, updated = self._buckets.get(endpoint, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate) - 1
+            self._buckets[endpoint] = (tokens, now)
+            hold = self._holds.get(endpoint, 0) - now
+        return max(hold, -tokens / rate if tokens < 0 else 0.0, 0.0)
+
+    def refund(self, endpoint, burst):
+        """Give back a token taken by reserve() for a call that was never sent"""
+        with self._lock:
+            if endpoint in self._buckets:
+                tokens, updated = self._buckets[endpoint]
+                self._buckets[endpoint] = (min(burst, tokens + 1), updated)
+
+    def hold(self, endpoint, until):
+        with self._lock:
+            self._holds[endpoint] = max(until, self._holds.get(endpoint, 0))
+
+
+class SQLiteRateState:
+    """Holds and token buckets shared by every process using the same SQLite file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute('CREATE TABLE IF NOT EXISTS rate_buckets (endpoint TEXT PRIMARY KEY, tokens REAL, updated REAL)')
+        conn.execute('CREATE TABLE IF NOT EXISTS rate_holds (endpoint TEXT PRIMARY KEY, until REAL)')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def reserve(self, endpoint, rate, burst, now):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated FROM rate_buckets WHERE endpoint = ?', (endpoint,)).fetchone()
+            tokens, updated = row or (burst, now)
+            tokens = min(burst, tokens + max(0.0, now - updated) * rate) - 1
+            conn.execute('INSERT OR REPLACE INTO rate_buckets (endpoint, tokens, updated) VALUES (?, ?, ?)',
+                         (endpoint, tokens, now))
+            hold = conn.execute('SELECT until FROM rate_holds WHERE endpoint = ?', (endpoint,)).fetchone()
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        hold_wait = hold[0] - now if hold else 0.0
+        return max(hold_wait, -tokens / rate if tokens < 0 else 0.0, 0.0)
+
+    def refund(self, endpoint, burst):
+        self._connect().execute('UPDATE rate_buckets SET tokens = MIN(?, tokens + 1) WHERE endpoint = ?',
+                                (burst, endpoint))
+
+    def hold(self, endpoint, until):
+        self._connect().execute(
+            'INSERT INTO rate_holds (endpoint, until) VALUES (?, ?) '
+            'ON CONFLICT(endpoint) DO UPDATE SET until = MAX(until, excluded.until)',
+            (endpoint, until))
+
+
+class PrioritySemaphore:
+    """Counting semaphore that wakes the lowest ``priority`` value first (FIFO within a priority)"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._active = 0
+        self._waiters = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self, priority=INTERACTIVE):
+        with self._lock:
+            if self._active < self.limit and not self._waiters:
+                self._active += 1
+                ready = None
+            else:
+                ready = threading.Event()
+                heapq.heappush(self._waiters, (priority, next(self._seq), ready))
+        if ready is not None:
+            ready.wait()  # the releasing thread hands its slot straight to us
+        try:
+            yield
+        finally:
+            with self._lock:
+                if self._waiters:
+                    heapq.heappop(self._waiters)[2].set()
+                else:
+                    self._active -= 1
+
+    @property
+    def waiting(self):
+        return len(self._waiters)
+
+
+class AsyncPrioritySemaphore:
+    """asyncio counterpart of PrioritySemaphore for the coroutines of one event loop"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._active = 0
+        self._waiters = []
+        self._seq = itertools.count()
+
+    @asynccontextmanager
+    async def slot(self, priority=INTERACTIVE):
+        if self._active < self.limit and not self._waiters:
+            self._active += 1
+        else:
+            ready = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (priority, next(self._seq), ready))
+            try:
+                await ready
+            except asyncio.CancelledError:
+                # Cancelled right after a slot was handed over: pass it on
+                if ready.done() and not ready.cancelled():
+                    self._release()
+                raise
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _release(self):
+        while self._waiters:
+            ready = heapq.heappop(self._waiters)[2]
+            if not ready.done():  # skip waiters that were cancelled
+                ready.set_result(None)
+                return
+        self._active -= 1
+
+    @property
+    def waiting(self):
+        return len(self._waiters)
+
+
+class UpstreamScheduler:
+    """Gatekeeper for outbound Spotify calls: holds, token buckets and a priority concurrency cap"""
+
+    def __init__(self, state=None, max_concurrency=32, rate=20.0, burst=40.0, rate_limits=None,
+                 max_wait=30.0):
+        self.state = state or LocalRateState()
+        self.slots = PrioritySemaphore(max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.burst = burst
+        self.rate_limits = dict(rate_limits or {})
+        self.max_wait = max_wait
+        self.throttled = 0
+        self.requeued = 0
+        self.gave_up = 0
+        self.wait_seconds = 0.0
+        self._async_slots = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _limits(self, endpoint):
+        return self.rate_limits.get(endpoint, (self.rate, self.burst))
+
+    def run(self, url, send, priority=INTERACTIVE):
+        """Call send() once admitted; on 429 hold the endpoint and requeue until max_wait runs out.
+
+        A call that would have to wait past max_wait fails straight away: it
+        returns the last 429 response, or raises RateLimited if it has none.
+        """
+        endpoint = endpoint_for(url)
+        rate, burst = self._limits(endpoint)
+        deadline = time.time() + self.max_wait
+        response = None
+        while True:
+            wait = self.state.reserve(endpoint, rate, burst, time.time())
+            if wait > deadline - time.time():
+                return self._give_up(endpoint, burst, wait, response)
+            if wait:
+                self._count('wait_seconds', wait)
+                time.sleep(wait)
+            with self.slots.slot(priority):
+                response = send()
+            if response.status_code != 429 or not self._requeue(endpoint, response, deadline):
+                return response
+
+    async def run_async(self, url, send, priority=INTERACTIVE):
+        """asyncio flavour of run(); send is a coroutine function"""
+        endpoint = endpoint_for(url)
+        rate, burst = self._limits(endpoint)
+        deadline = time.time() + self.max_wait
+        loop = asyncio.get_running_loop()
+        slots = self._async_slots.get(loop)
+        if slots is None:
+            slots = self._async_slots[loop] = AsyncPrioritySemaphore(self.max_concurrency)
+        response = None
+        while True:
+            # SQLiteRateState writes (BEGIN IMMEDIATE) and may wait on other workers' locks; keep that off the loop
+            wait = await asyncio.to_thread(self.state.reserve, endpoint, rate, burst, time.time())
+            if wait > deadline - time.time():
+                return await asyncio.to_thread(self._give_up, endpoint, burst, wait, response)
+            if wait:
+                self._count('wait_seconds', wait)
+                await asyncio.sleep(wait)
+            async with slots.slot(priority):
+                response = await send()
+            if response.status_code != 429:
+                return response
+            if not await asyncio.to_thread(self._requeue, endpoint, response, deadline):
+                return response
+
+    def _requeue(self, endpoint, response, deadline):
+        self._count('throttled')
+        until = time.time() + retry_after_seconds(response.headers.get('Retry-After'))
+        self.state.hold(endpoint, until)
+        if until > deadline:
+            self._count('gave_up')
+            logger.warning("Spotify %s is rate limited beyond our %.0fs wait budget", endpoint, self.max_wait)
+            return False
+        self._count('requeued')
+        logger.info("Spotify %s returned 429, requeueing for %.1fs", endpoint, until - time.time())
+        return True
+
+    def _give_up(self, endpoint, burst, wait, response):
+        # Sleeping out the budget only to send into a window known to be limited would fail anyway
+        self.state.refund(endpoint, burst)
+        self._count('gave_up')
+        logger.warning("Spotify %s needs a %.1fs wait, beyond our %.0fs budget", endpoint, wait, self.max_wait)
+        if response is not None:
+            return response
+        raise RateLimited(endpoint, wait)
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def stats(self):
+        return {
+            'max_concurrency': self.max_concurrency,
+            'waiting': self.slots.waiting,
+            'throttled': self.throttled,
+            'requeued': self.requeued,
+            'gave_up': self.gave_up,
+            'wait_seconds': round(self.wait_seconds, 3),
+        }
+
+
+def create_rate_state(backend, path=None):
+    """Build the rate state named by ``backend`` ("sqlite" or "memory")"""
+    if backend == 'memory':
+        return LocalRateState()
+    if backend == 'sqlite':
+        return SQLiteRateState(path)
+    raise ValueError(f'Unknown upstream rate state backend: {backend}')
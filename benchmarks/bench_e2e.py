@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test: the whole app under gunicorn against local Spotify and Gemini stubs.
+
+Starts two stub servers in this process:
+- a Spotify stub for /api/token, /v1/me, /v1/recommendations, /v1/tracks,
+  /v1/users/{id}/playlists and /v1/playlists/{id}/tracks;
+- a fake Gemini backend answering generateContent after --gemini-latency-ms
+  (plus up to --gemini-jitter-ms), failing a --gemini-error-rate fraction of
+  calls with a 500.
+
+The app runs in a gunicorn subprocess pointed at them through SPOTIFY_API_BASE,
+SPOTIFY_TOKEN_URL and GEMINI_API_ENDPOINT, with throwaway state databases.
+--concurrency virtual users then loop over a journey for --duration seconds:
+/login -> /callback (fresh session), --recommendations-per-login calls to
+/api/recommendations, and one /api/create_playlist with the tracks returned.
+
+The report is JSON (stdout, and --out): requests, errors, throughput and
+p50/p95/p99 per route, plus how many calls each stub served. Pass a previous
+report as --baseline to add per-route ratios, and --max-regression to exit 1
+when any route's p95 got that much slower, e.g.:
+
+    python benchmarks/bench_e2e.py --concurrency 32 --out before.json
+    python benchmarks/bench_e2e.py --concurrency 32 --baseline before.json --max-regression 0.2
+
+The upstream rate limits are lifted so the app, not the limiter, is measured;
+any app setting exported in the environment (UPSTREAM_RATE, MOOD_ANALYSIS_MODE,
+...) overrides the defaults used here.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+BACKEND = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend')
+
+MOODS = [
+    'happy and energetic', 'chill rainy evening vibes', 'pump me up for the gym', 'sad and lonely',
+    'focused late night coding', 'romantic dinner', 'sunday morning coffee', 'angry and restless',
+    'nostalgic road trip', 'calm before sleep', 'summer party with friends', 'melancholic but hopeful',
+]
+GENRES = ['pop', 'rock', 'indie', 'electronic', 'chill', 'jazz', 'hip-hop', 'dance', 'ambient', 'soul']
+ROUTES = ('/login', '/callback', '/api/recommendations', '/api/create_playlist')
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    calls = None  # Counter shared by every handler of one server
+    lock = threading.Lock()
+
+    def count(self, key):
+        with self.lock:
+            self.calls[key] += 1
+
+    def reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def log_message(self, format, *args):
+        pass
+
+
+def stub_track(track_id):
+    return {
+        'id': track_id,
+        'name': f'Track {track_id[:6]}',
+        'artists': [{'name': 'Stub Artist'}],
+        'album': {'name': 'Stub Album', 'images': [{'url': f'https://i.scdn.co/image/{track_id}'}]},
+        'preview_url': None,
+        'external_urls': {'spotify': f'https://open.spotify.com/track/{track_id}'},
+        'uri': f'spotify:track:{track_id}',
+    }
+
+
+def track_ids_for(key, count):
+    # Stable ids per seed, so identical recommendation params return identical tracks
+    return [hashlib.sha1(f'{key}:{i}'.encode()).hexdigest()[:22] for i in range(count)]
+
+
+class SpotifyStub(StubHandler):
+    latency = 0.0
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        self.count(f'GET {url.path}')
+        time.sleep(self.latency)
+        if url.path == '/v1/me':
+            user_id = self.headers.get('Authorization', '').partition('stub-token-')[2] or 'stub_user'
+            return self.reply(200, {'id': user_id, 'display_name': f'Stub {user_id}'})
+        if url.path == '/v1/recommendations':
+            seed = '{}:{}'.format(query.get('seed_genres', [''])[0], query.get('target_energy', [''])[0])
+            limit = int(query.get('limit', ['20'])[0])
+            return self.reply(200, {'tracks': [stub_track(i) for i in track_ids_for(seed, limit)]})
+        if url.path == '/v1/tracks':
+            ids = query.get('ids', [''])[0].split(',')
+            return self.reply(200, {'tracks': [stub_track(i) for i in ids]})
+        self.reply(404, {'error': {'status': 404, 'message': 'Not found'}})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        body = self.read_body()
+        parts = url.path.strip('/').split('/')
+        time.sleep(self.latency)
+        if url.path == '/api/token':
+            self.count('POST /api/token')
+            form = parse_qs(body.decode())
+            # The auth code names the user; /v1/me reads it back out of the token
+            user = form.get('code', ['app'])[0]
+            return self.reply(200, {'access_token': f'stub-token-{user}', 'refresh_token': f'stub-refresh-{user}',
+                                    'token_type': 'Bearer', 'expires_in': 3600})
+        if parts[:2] == ['v1', 'users'] and parts[-1] == 'playlists':
+            self.count('POST /v1/users/{id}/playlists')
+            playlist_id = hashlib.sha1(body).hexdigest()[:22]
+            return self.reply(201, {'id': playlist_id,
+                                    'external_urls': {'spotify': f'https://open.spotify.com/playlist/{playlist_id}'}})
+        if parts[:2] == ['v1', 'playlists'] and parts[-1] == 'tracks':
+            self.count('POST /v1/playlists/{id}/tracks')
+            return self.reply(201, {'snapshot_id': hashlib.sha1(body).hexdigest()})
+        self.count(f'POST {url.path}')
+        self.reply(404, {'error': {'status': 404, 'message': 'Not found'}})
+
+
+class GeminiStub(StubHandler):
+    latency = 0.0
+    jitter = 0.0
+    error_rate = 0.0
+
+    def do_POST(self):
+        body = self.read_body()
+        time.sleep(self.latency + random.random() * self.jitter)
+        if random.random() < self.error_rate:
+            self.count('error')
+            return self.reply(500, {'error': {'code': 500, 'message': 'Stub failure', 'status': 'INTERNAL'}})
+        self.count('ok')
+        digest = hashlib.sha1(body).digest()
+        analysis = {
+            'genres': [GENRES[digest[0] % len(GENRES)], GENRES[digest[1] % len(GENRES)]],
+            'audio_features': {'valence': digest[2] / 255, 'energy': digest[3] / 255, 'danceability': digest[4] / 255},
+        }
+        self.reply(200, {'candidates': [{'content': {'parts': [{'text': json.dumps(analysis)}], 'role': 'model'},
+                                         'finishReason': 'STOP'}]})
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # every virtual user's connections may arrive at once
+
+
+def start_stub(handler, **attributes):
+    handler = type(handler.__name__, (handler,), dict(attributes, calls=Counter()))
+    server = StubServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_app(args, spotify_origin, gemini_origin, state_dir):
+    port = free_port()
+    origin = f'http://127.0.0.1:{port}'
+    env = dict(
+        UPSTREAM_RATE='100000', UPSTREAM_BURST='100000', UPSTREAM_RATE_LIMITS='', UPSTREAM_MAX_CONCURRENCY='256',
+        LOG_LEVEL='WARNING', MOOD_TRAINING_LOG='', MOOD_CACHE_FILE='', TRACK_CACHE_FILE='',
+        MOOD_CLASSIFIER_FILE=os.path.join(state_dir, 'classifier.npz'),
+    )
+    env.update(os.environ)
+    env.update(
+        MOODIFY_BIND=f'127.0.0.1:{port}', WEB_CONCURRENCY=str(args.workers), GUNICORN_THREADS=str(args.threads),
+        SPOTIFY_CLIENT_ID='stub-client', SPOTIFY_CLIENT_SECRET='stub-secret', REDIRECT_URI=f'{origin}/callback',
+        SPOTIFY_TOKEN_URL=f'{spotify_origin}/api/token', SPOTIFY_API_BASE=f'{spotify_origin}/v1',
+        GEMINI_API_KEY='stub-key', GEMINI_API_ENDPOINT=gemini_origin,
+        SESSION_DB=os.path.join(state_dir, 'sessions.db'), OAUTH_STATE_DB=os.path.join(state_dir, 'oauth.db'),
+        UPSTREAM_STATE_DB=os.path.join(state_dir, 'upstream.db'),
+        PYTHONWARNINGS='ignore',
+    )
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', os.path.join(BACKEND, 'gunicorn.conf.py')],
+                               env=env)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f'gunicorn exited with status {process.returncode}')
+        try:
+            if requests.get(f'{origin}/metrics', timeout=1).status_code == 200:
+                return process, origin
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise SystemExit('gunicorn did not start within 60s')
+
+
+class Recorder:
+    """Latencies and statuses per route, from every virtual user"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.errors = Counter()
+
+    def call(self, route, send, expected):
+        start = time.perf_counter()
+        try:
+            response = send()
+            status = response.status_code
+        except requests.RequestException:
+            response, status = None, 'error'
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.latencies[route].append(elapsed)
+            self.statuses[route][str(status)] += 1
+            if status != expected:
+                self.errors[route] += 1
+        return response if status == expected else None
+
+
+def journey(origin, recorder, user, args, rng):
+    with requests.Session() as client:
+        response = recorder.call('/login', lambda: client.get(f'{origin}/login', allow_redirects=False), 302)
+        if response is None:
+            return
+        state = parse_qs(urlsplit(response.headers['Location']).query)['state'][0]
+        if recorder.call('/callback', lambda: client.get(f'{origin}/callback', params={'code': user, 'state': state},
+                                                         allow_redirects=False), 302) is None:
+            return
+
+        tracks = []
+        for _ in range(args.recommendations_per_login):
+            mood = rng.choice(MOODS)
+            if args.unique_moods:
+                mood = f'{mood} {rng.randrange(10 ** 9)}'
+            response = recorder.call('/api/recommendations',
+                                     lambda: client.get(f'{origin}/api/recommendations', params={'mood': mood}), 200)
+            if response is not None:
+                tracks = response.json()['tracks'] or tracks
+
+        if tracks:
+            track_ids = [track['id'] for track in tracks][:args.playlist_tracks]
+            while len(track_ids) < args.playlist_tracks:
+                track_ids += track_ids[:args.playlist_tracks - len(track_ids)]
+            recorder.call('/api/create_playlist',
+                          lambda: client.post(f'{origin}/api/create_playlist',
+                                              json={'mood': mood, 'track_ids': track_ids}), 200)
+
+
+def virtual_user(origin, recorder, index, args, deadline):
+    rng = random.Random(index)
+    journeys = 0
+    while time.monotonic() < deadline:
+        journey(origin, recorder, f'user{index}-{journeys}', args, rng)
+        journeys += 1
+
+
+def percentile(sorted_values, fraction):
+    # Nearest rank
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values)) - 1))]
+
+
+def summarize(recorder, elapsed):
+    routes = {}
+    for route in ROUTES:
+        latencies = sorted(recorder.latencies[route])
+        count = len(latencies)
+        routes[route] = {
+            'requests': count,
+            'errors': recorder.errors[route],
+            'statuses': dict(recorder.statuses[route]),
+            'throughput_rps': round(count / elapsed, 2),
+            'mean_ms': round(sum(latencies) / count * 1000, 2) if count else None,
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 2) if count else None,
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 2) if count else None,
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2) if count else None,
+            'max_ms': round(latencies[-1] * 1000, 2) if count else None,
+        }
+    total = sum(route['requests'] for route in routes.values())
+    return routes, {'requests': total, 'errors': sum(recorder.errors.values()),
+                    'throughput_rps': round(total / elapsed, 2)}
+
+
+def compare(report, baseline, max_regression):
+    """Ratios of this run to the baseline per route; returns (comparison, regressed routes)"""
+    comparison, regressed = {}, []
+    for route, current in report['routes'].items():
+        previous = baseline.get('routes', {}).get(route)
+        if not previous:
+            continue
+        ratios = {}
+        for key in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms'):
+            if current[key] and previous.get(key):
+                ratios[key] = round(current[key] / previous[key], 3)
+        comparison[route] = ratios
+        if max_regression is not None and ratios.get('p95_ms', 0) > 1 + max_regression:
+            regressed.append(route)
+    return comparison, regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=16, help='virtual users')
+    parser.add_argument('--duration', type=float, default=20, help='seconds of load')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--threads', type=int, default=8, help='threads per gunicorn worker')
+    parser.add_argument('--recommendations-per-login', type=int, default=3)
+    parser.add_argument('--playlist-tracks', type=int, default=50)
+    parser.add_argument('--unique-moods', action='store_true',
+                        help='make every mood unique, so no mood analysis or recommendation cache can hit')
+    parser.add_argument('--spotify-latency-ms', type=float, default=20)
+    parser.add_argument('--gemini-latency-ms', type=float, default=300)
+    parser.add_argument('--gemini-jitter-ms', type=float, default=200)
+    parser.add_argument('--gemini-error-rate', type=float, default=0.0)
+    parser.add_argument('--baseline', help='earlier report to compare against')
+    parser.add_argument('--max-regression', type=float,
+                        help='with --baseline, exit 1 if any p95 grew by more than this fraction')
+    parser.add_argument('--out', help='also write the report to this file')
+    args = parser.parse_args()
+
+    spotify_server, spotify_origin = start_stub(SpotifyStub, latency=args.spotify_latency_ms / 1000)
+    gemini_server, gemini_origin = start_stub(GeminiStub, latency=args.gemini_latency_ms / 1000,
+                                              jitter=args.gemini_jitter_ms / 1000, error_rate=args.gemini_error_rate)
+
+    with tempfile.TemporaryDirectory(prefix='moodify-bench-') as state_dir:
+        process, origin = start_app(args, spotify_origin, gemini_origin, state_dir)
+        try:
+            print(f"🧪 {args.concurrency} users for {args.duration:g}s against {origin} "
+                  f"({args.workers} workers x {args.threads} threads)", file=sys.stderr)
+            recorder = Recorder()
+            deadline = time.monotonic() + args.duration
+            started = time.perf_counter()
+            users = [threading.Thread(target=virtual_user, args=(origin, recorder, i, args, deadline))
+                     for i in range(args.concurrency)]
+            for user in users:
+                user.start()
+            for user in users:
+                user.join()
+            elapsed = time.perf_counter() - started
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+    spotify_server.shutdown()
+    gemini_server.shutdown()
+
+    routes, total = summarize(recorder, elapsed)
+    config = {key: value for key, value in vars(args).items() if key not in ('baseline', 'max_regression', 'out')}
+    report = {
+        'config': config,
+        'elapsed_s': round(elapsed, 3),
+        'routes': routes,
+        'total': total,
+        'upstream': {'spotify': dict(spotify_server.RequestHandlerClass.calls),
+                     'gemini': dict(gemini_server.RequestHandlerClass.calls)},
+    }
+    regressed = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            report['comparison'], regressed = compare(report, json.load(f), args.max_regression)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(output + '\n')
+    if regressed:
+        print(f"❌ p95 regressed by more than {args.max_regression:.0%}: {', '.join(regressed)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
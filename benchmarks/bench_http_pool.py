@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark per-call requests.get() against the pooled SpotifyClient.
+
+Runs a local keep-alive stub server and counts how many connections each
+approach opens. Pass --certfile/--keyfile to serve over TLS so the handshake
+cost is included, e.g.:
+
+    openssl req -x509 -newkey rsa:2048 -nodes -subj /CN=127.0.0.1 \\
+        -keyout key.pem -out cert.pem
+    python benchmarks/bench_http_pool.py --certfile cert.pem --keyfile key.pem
+"""
+import argparse
+import os
+import ssl
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+import urllib3
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+from spotify_client import SpotifyClient  # noqa: E402
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+BODY = b'{"id": "stub_user", "display_name": "Stub User"}'
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with StubHandler.lock:
+            StubHandler.connections += 1
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+
+    def do_GET(self):
+        self.do_HEAD()
+        self.wfile.write(BODY)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(certfile=None, keyfile=None):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    scheme = 'http'
+    if certfile:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        scheme = 'https'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'{scheme}://127.0.0.1:{server.server_port}'
+
+
+def insecure(client):
+    # Trust the self-signed stub certificate regardless of REQUESTS_CA_BUNDLE
+    client.session.trust_env = False
+    client.session.verify = False
+
+
+def run(label, call, url, iterations):
+    StubHandler.connections = 0
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        response = call(url)
+        response.content
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    print(f"{label:<22} p50={statistics.median(timings):7.3f}ms "
+          f"p95={timings[int(len(timings) * 0.95) - 1]:7.3f}ms "
+          f"mean={statistics.mean(timings):7.3f}ms connections={StubHandler.connections}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--certfile')
+    parser.add_argument('--keyfile')
+    args = parser.parse_args()
+
+    server, origin = start_server(args.certfile, args.keyfile)
+    url = f'{origin}/v1/me'
+    client = SpotifyClient(f'{origin}/api/token', f'{origin}/v1', pool_sizes={'127.0.0.1': 4})
+    insecure(client)
+
+    print(f"🧪 {args.iterations} sequential GETs against {url}")
+    run('requests.get()', lambda u: requests.get(u, verify=False, timeout=10), url, args.iterations)
+    run('SpotifyClient (cold)', client.get, url, args.iterations)
+    client.reset()
+    insecure(client)
+    client.warm(connections=1)
+    run('SpotifyClient (warm)', client.get, url, args.iterations)
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
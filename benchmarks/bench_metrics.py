@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Benchmark the cost of stage instrumentation.
+
+Times a no-op function bare, wrapped in Histogram.timed, and inside a
+Histogram.time() block, plus Counter.inc with labels, from --threads threads at
+once. The difference is what every instrumented stage pays per call.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+BACKEND = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend')
+sys.path.insert(0, BACKEND)
+from metrics import MetricsRegistry  # noqa: E402
+
+
+def ns_per_call(fn, calls, threads):
+    def worker():
+        for _ in range(calls):
+            fn()
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return (time.perf_counter() - start) * 1e9 / (calls * threads)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--calls', type=int, default=200000, help='calls per thread')
+    parser.add_argument('--threads', type=int, default=4)
+    args = parser.parse_args()
+
+    registry = MetricsRegistry()
+    stages = registry.histogram('bench_stage_seconds', 'bench', ['stage'])
+    responses = registry.counter('bench_responses_total', 'bench', ['service', 'endpoint', 'status'])
+
+    def noop():
+        return None
+
+    timed = stages.timed('decorated')(noop)
+
+    def context():
+        with stages.time('context'):
+            return None
+
+    def count():
+        responses.inc('spotify', 'recommendations', 200)
+
+    bare = ns_per_call(noop, args.calls, args.threads)
+    print(f"{args.threads} threads x {args.calls} calls")
+    print(f"  bare call              {bare:8.0f} ns")
+    print(f"  @Histogram.timed       {ns_per_call(timed, args.calls, args.threads) - bare:8.0f} ns overhead")
+    print(f"  with Histogram.time()  {ns_per_call(context, args.calls, args.threads) - bare:8.0f} ns overhead")
+    print(f"  Counter.inc(labels)    {ns_per_call(count, args.calls, args.threads) - bare:8.0f} ns overhead")
+    print(f"  /metrics render        {len(registry.render())} bytes")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark the keyword mood engine.
+
+Measures nanoseconds per input character for moods of increasing length, with
+the shipped lexicon and with one padded out by --extra-terms synthetic terms.
+A single-pass automaton should stay roughly flat in both directions. The old
+if/elif chain is timed alongside for reference.
+"""
+import argparse
+import json
+import os
+import random
+import string
+import sys
+import time
+
+BACKEND = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend')
+sys.path.insert(0, BACKEND)
+from mood_lexicon import MoodLexicon  # noqa: E402
+
+WORDS = ('feeling chill tonight but also kind of happy and ready for a road trip with jazz '
+         'after a long rainy day at work thinking about summer beach parties and old memories').split()
+
+
+def legacy_keyword_mood_params(mood):
+    """The previous if/elif chain over substring checks"""
+    mood_lower = mood.lower()
+    if any(word in mood_lower for word in ['chill', 'calm', 'relax', 'peaceful']):
+        return {'genres': ['ambient', 'chill', 'new-age'],
+                'audio_features': {'valence': 0.3, 'energy': 0.2, 'danceability': 0.3}}
+    elif any(word in mood_lower for word in ['happy', 'upbeat', 'energetic', 'party']):
+        return {'genres': ['pop', 'dance', 'disco'],
+                'audio_features': {'valence': 0.8, 'energy': 0.8, 'danceability': 0.7}}
+    elif any(word in mood_lower for word in ['sad', 'melancholy', 'depressed', 'blue']):
+        return {'genres': ['indie', 'alternative', 'blues'],
+                'audio_features': {'valence': 0.2, 'energy': 0.3, 'danceability': 0.2}}
+    elif any(word in mood_lower for word in ['workout', 'gym', 'exercise', 'run']):
+        return {'genres': ['hip-hop', 'electronic', 'techno'],
+                'audio_features': {'valence': 0.7, 'energy': 0.9, 'danceability': 0.8}}
+    elif any(word in mood_lower for word in ['focus', 'study', 'concentration']):
+        return {'genres': ['ambient', 'classical', 'electronic'],
+                'audio_features': {'valence': 0.4, 'energy': 0.3, 'danceability': 0.2}}
+    return {'genres': ['pop'], 'audio_features': {'valence': 0.5, 'energy': 0.5, 'danceability': 0.5}}
+
+
+def make_mood(length, rng):
+    words = []
+    while sum(len(word) + 1 for word in words) < length:
+        words.append(rng.choice(WORDS))
+    return ' '.join(words)[:length]
+
+
+def padded_lexicon(extra_terms, rng):
+    with open(os.path.join(BACKEND, 'mood_lexicon.json'), 'r', encoding='utf-8') as f:
+        lexicon = json.load(f)
+    profiles = list(lexicon['profiles'])
+    for _ in range(extra_terms):
+        term = ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 12)))
+        lexicon['terms'][term] = {rng.choice(profiles): 1.0}
+    return MoodLexicon(lexicon)
+
+
+def ns_per_char(fn, moods):
+    chars = sum(len(mood) for mood in moods)
+    start = time.perf_counter()
+    for mood in moods:
+        fn(mood)
+    return (time.perf_counter() - start) * 1e9 / chars
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--lengths', default='16,64,256,1024,4096')
+    parser.add_argument('--chars', type=int, default=400000, help='characters analyzed per measurement')
+    parser.add_argument('--extra-terms', type=int, default=20000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    start = time.perf_counter()
+    shipped = MoodLexicon.load(os.path.join(BACKEND, 'mood_lexicon.json'))
+    shipped_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    padded = padded_lexicon(args.extra_terms, rng)
+    padded_ms = (time.perf_counter() - start) * 1000
+    print(f'shipped lexicon: {shipped.term_count} terms, compiled in {shipped_ms:.1f} ms')
+    print(f'padded lexicon:  {padded.term_count} terms, compiled in {padded_ms:.1f} ms')
+    print()
+    print(f"{'length':>7}  {'shipped ns/char':>16}  {'padded ns/char':>15}  {'legacy ns/char':>15}")
+    for length in (int(value) for value in args.lengths.split(',')):
+        moods = [make_mood(length, rng) for _ in range(max(1, args.chars // length))]
+        print(f'{length:>7}  {ns_per_char(shipped.analyze, moods):>16.1f}  '
+              f'{ns_per_char(padded.analyze, moods):>15.1f}  '
+              f'{ns_per_char(legacy_keyword_mood_params, moods):>15.1f}')
+
+
+if __name__ == '__main__':
+    main()
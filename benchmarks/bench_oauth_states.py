@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Benchmark OAuth state store throughput with many outstanding states.
+
+Each "login" saves a fresh state and each "callback" pops it, while --outstanding
+abandoned states sit in the store (users who never finished the OAuth dance).
+Compares the old JSON-file approach with the memory and SQLite backends.
+"""
+import argparse
+import json
+import os
+import secrets
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+from oauth_state_store import MemoryStateStore, SQLiteStateStore  # noqa: E402
+
+
+class JsonFileStateStore:
+    """The previous implementation: rewrite the whole JSON file on every change"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def _read(self):
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return {}
+
+    def _write(self, states):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(states, f)
+
+    def save(self, state):
+        states = self._read()
+        states[state] = {'ts': int(time.time())}
+        self._write(states)
+
+    def pop(self, state):
+        states = self._read()
+        if state in states:
+            del states[state]
+            self._write(states)
+            return True
+        return False
+
+
+def run(label, store, outstanding, logins):
+    for _ in range(outstanding):
+        store.save(secrets.token_urlsafe(16))
+    start = time.perf_counter()
+    for _ in range(logins):
+        state = secrets.token_urlsafe(16)
+        store.save(state)
+        assert store.pop(state)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10} {logins / elapsed:10.0f} login+callback/s  ({elapsed / logins * 1e6:8.1f}µs each)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--outstanding', type=int, default=10000)
+    parser.add_argument('--logins', type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"🧪 {args.logins} logins with {args.outstanding} outstanding states")
+    with tempfile.TemporaryDirectory() as tmp:
+        run('json-file', JsonFileStateStore(os.path.join(tmp, 'states.json')), args.outstanding,
+            min(args.logins, 50))
+        run('memory', MemoryStateStore(sweep_interval=0), args.outstanding, args.logins)
+        run('sqlite', SQLiteStateStore(os.path.join(tmp, 'states.db'), sweep_interval=0), args.outstanding,
+            args.logins)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Benchmark cold start: interpreter launch to first served request.
+
+Each run starts a fresh interpreter that imports the app and serves GET / and
+GET /metrics through the Flask test client. The benchmark reports the median
+import time, first-request time and total wall time (including interpreter
+start-up). With --gemini-key it also times building the Gemini model on first
+use, which is what a worker pays in warm_worker() or on its first AI request.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend')
+
+CHILD = r'''
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+assert client.get('/').status_code == 200
+assert client.get('/metrics').status_code == 200
+served = time.perf_counter()
+model = None
+if app.GEMINI_API_KEY:
+    app.get_gemini_model()
+    model = (time.perf_counter() - served) * 1000
+print(json.dumps({'import_ms': (imported - start) * 1000, 'first_request_ms': (served - imported) * 1000,
+                  'gemini_model_ms': model}))
+'''
+
+
+def run_once(env):
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-W', 'ignore', '-c', CHILD, BACKEND], env=env,
+                            capture_output=True, text=True, check=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result['wall_ms'] = (time.perf_counter() - start) * 1000
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--gemini-key', help='dummy GEMINI_API_KEY, to time building the model (no call is made)')
+    args = parser.parse_args()
+
+    env = dict(os.environ, OAUTH_STATE_BACKEND='memory', UPSTREAM_STATE_BACKEND='memory',
+               SESSION_BACKEND='memory', MOOD_TRAINING_LOG='', LOG_LEVEL='WARNING')
+    env.pop('GEMINI_API_KEY', None)
+    if args.gemini_key:
+        env['GEMINI_API_KEY'] = args.gemini_key
+
+    results = [run_once(env) for _ in range(args.runs)]
+    print(f"median of {args.runs} cold starts:")
+    for key in ('import_ms', 'first_request_ms', 'wall_ms', 'gemini_model_ms'):
+        values = [result[key] for result in results if result[key] is not None]
+        if values:
+            print(f"  {key:<18}{statistics.median(values):8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Benchmark local catalog search latency.
+
+Builds a synthetic catalog of --tracks tracks spread over Spotify's seed genres,
+memory-maps it like a worker would, and times nearest-neighbor queries with no
+genre filter, one genre and three genres.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+from track_catalog import FEATURES, TrackCatalog, write_catalog  # noqa: E402
+
+GENRES = [
+    'acoustic', 'afrobeat', 'alt-rock', 'alternative', 'ambient', 'blues', 'bossanova', 'brazil',
+    'breakbeat', 'british', 'chill', 'classical', 'club', 'country', 'dance', 'dancehall', 'deep-house',
+    'disco', 'drum-and-bass', 'dub', 'dubstep', 'electronic', 'folk', 'funk', 'garage', 'gospel', 'groove',
+    'grunge', 'hip-hop', 'house', 'indie', 'jazz', 'latin', 'metal', 'new-age', 'pop', 'punk', 'r-n-b',
+    'reggae', 'rock', 'soul', 'techno', 'trance', 'world-music',
+]
+ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+
+
+def synthetic_tracks(count, rng):
+    features = np.random.default_rng(7).random((count, len(FEATURES)), dtype=np.float32)
+    for row in range(count):
+        track_id = ''.join(rng.choice(ALPHABET) for _ in range(22))
+        yield track_id, rng.sample(GENRES, rng.randint(1, 3)), features[row]
+
+
+def time_queries(catalog, genres_for_query, queries, rng):
+    latencies = []
+    for _ in range(queries):
+        target = {name: rng.random() for name in FEATURES}
+        start = time.perf_counter()
+        catalog.search(target, genres_for_query(), k=10)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return latencies[len(latencies) // 2] * 1e6, latencies[int(len(latencies) * 0.99)] * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tracks', type=int, default=200000)
+    parser.add_argument('--queries', type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'catalog')
+        start = time.perf_counter()
+        write_catalog(path, synthetic_tracks(args.tracks, rng))
+        print(f'ingested {args.tracks} tracks in {time.perf_counter() - start:.1f}s, '
+              f'{sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)) / 1e6:.1f} MB on disk')
+
+        start = time.perf_counter()
+        catalog = TrackCatalog.load(path)
+        print(f'memory-mapped in {(time.perf_counter() - start) * 1000:.2f} ms')
+
+        cases = [
+            ('no genre filter', lambda: None),
+            ('1 genre', lambda: [rng.choice(GENRES)]),
+            ('3 genres', lambda: rng.sample(GENRES, 3)),
+        ]
+        print(f"{'query':<18}{'p50 us':>10}{'p99 us':>10}")
+        for name, genres_for_query in cases:
+            p50, p99 = time_queries(catalog, genres_for_query, args.queries, rng)
+            print(f'{name:<18}{p50:>10.0f}{p99:>10.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark track records and response serialization.
+
+Compares the per-track dicts extract_tracks used to build with Track records:
+retained memory for --tracks tracks (tracemalloc), and the time to encode a
+/api/recommendations response the way jsonify did (json.dumps, sorted keys)
+against dumps_json with orjson and with the stdlib fallback.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+BACKEND = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend')
+sys.path.insert(0, BACKEND)
+import track_record  # noqa: E402
+from track_record import Track, dumps_json  # noqa: E402
+
+
+def spotify_track(i):
+    return {
+        'id': f'{i:022d}',
+        'name': f'Track number {i}',
+        'artists': [{'name': 'Some Artist', 'id': 'a'}, {'name': f'Featured {i % 97}', 'id': 'b'}],
+        'album': {'name': f'Album {i % 1000}', 'images': [{'url': f'https://i.scdn.co/image/{i:040x}', 'height': 640}]},
+        'preview_url': f'https://p.scdn.co/mp3-preview/{i:040x}',
+        'external_urls': {'spotify': f'https://open.spotify.com/track/{i:022d}'},
+        'popularity': i % 100,
+        'duration_ms': 200000 + i,
+    }
+
+
+def legacy_extract(track):
+    """The dict extract_tracks built before Track"""
+    return {
+        'id': track['id'],
+        'name': track['name'],
+        'artist': ', '.join([artist['name'] for artist in track['artists']]),
+        'album': track['album']['name'],
+        'image': track['album']['images'][0]['url'] if track['album']['images'] else None,
+        'preview_url': track.get('preview_url'),
+        'external_url': track['external_urls']['spotify'],
+    }
+
+
+def retained_bytes(build, raw):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    records = [build(track) for track in raw]
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del records
+    return size
+
+
+def us_per_call(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) * 1e6 / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tracks', type=int, default=10000, help='tracks held in memory')
+    parser.add_argument('--response-tracks', type=int, default=10, help='tracks per API response')
+    parser.add_argument('--repeat', type=int, default=20000)
+    args = parser.parse_args()
+
+    raw = [spotify_track(i) for i in range(args.tracks)]
+    dict_bytes = retained_bytes(legacy_extract, raw)
+    track_bytes = retained_bytes(Track.from_spotify, raw)
+    print(f"memory for {args.tracks} tracks: dicts {dict_bytes / 1024:.0f} KiB "
+          f"({dict_bytes / args.tracks:.0f} B/track), Track {track_bytes / 1024:.0f} KiB "
+          f"({track_bytes / args.tracks:.0f} B/track)")
+
+    head = raw[:args.response_tracks]
+    dicts = {'mood': 'chill evening', 'tracks': [legacy_extract(t) for t in head], 'served_by': 'cache'}
+    records = {'mood': 'chill evening', 'tracks': [Track.from_spotify(t) for t in head], 'served_by': 'cache'}
+    assert json.loads(dumps_json(records)) == json.loads(json.dumps(dicts))
+
+    print(f"encode a {args.response_tracks}-track response:")
+    print(f"  json.dumps(dicts, sort_keys)   {us_per_call(lambda: json.dumps(dicts, sort_keys=True), args.repeat):8.2f} us")
+    fast = track_record.FAST_JSON
+    track_record.FAST_JSON = False
+    print(f"  dumps_json(Track), stdlib      {us_per_call(lambda: dumps_json(records, sort_keys=True), args.repeat):8.2f} us")
+    if track_record.orjson is not None:
+        track_record.FAST_JSON = True
+        print(f"  dumps_json(Track), orjson      {us_per_call(lambda: dumps_json(records, sort_keys=True), args.repeat):8.2f} us")
+    else:
+        print("  orjson is not installed")
+    track_record.FAST_JSON = fast
+
+
+if __name__ == '__main__':
+    main()
@@ -21,7 +21,89 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
 
-    async function generatePlaylist(mood) {
+    let activeStream = null;
+
+    function generatePlaylist(mood) {
+        if (activeStream) {
+            activeStream.close();
+            activeStream = null;
+        }
+        if (!window.EventSource) {
+            fetchPlaylist(mood);
+            return;
+        }
+
+        showLoading();
+
+        // Tracks are rendered as they arrive; a refined batch from Gemini may replace them later
+        const source = new EventSource('http://127.0.0.1:5000/api/recommendations/stream?mood=' + encodeURIComponent(mood));
+        activeStream = source;
+        let tracks = [];
+
+        function finish() {
+            source.close();
+            if (activeStream === source) {
+                activeStream = null;
+            }
+        }
+
+        source.addEventListener('track', function(e) {
+            const track = JSON.parse(e.data);
+            if (tracks.length === 0) {
+                hideLoading();
+                startPlaylist(mood);
+            }
+            tracks.push(track);
+            appendTrack(track);
+            setTrackCount(tracks.length);
+        });
+
+        source.addEventListener('refined', function(e) {
+            const data = JSON.parse(e.data);
+            if (data.tracks.length > 0) {
+                tracks = data.tracks;
+                hideLoading();
+                startPlaylist(mood);
+                tracks.forEach(appendTrack);
+                setTrackCount(tracks.length);
+            }
+        });
+
+        source.addEventListener('done', function() {
+            finish();
+            hideLoading();
+            if (tracks.length > 0) {
+                showPlaylistActions(mood, tracks);
+            } else {
+                showNoResults();
+            }
+        });
+
+        source.addEventListener('failure', function(e) {
+            finish();
+            if (tracks.length > 0) {
+                showPlaylistActions(mood, tracks);
+            } else {
+                hideLoading();
+                showError(JSON.parse(e.data).error);
+            }
+        });
+
+        source.onerror = function() {
+            if (activeStream !== source) {
+                return;
+            }
+            finish();
+            if (tracks.length > 0) {
+                showPlaylistActions(mood, tracks);
+            } else {
+                // Not logged in, or streaming is unavailable: the JSON endpoint explains which
+                fetchPlaylist(mood);
+            }
+        };
+    }
+
+    async function fetchPlaylist(mood) {
         showLoading();
         
         try {
@@ -66,35 +148,46 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     function displayTracks(tracks, mood) {
-        let html = `
+        startPlaylist(mood);
+        tracks.forEach(appendTrack);
+        setTrackCount(tracks.length);
+        showPlaylistActions(mood, tracks);
+    }
+
+    function startPlaylist(mood) {
+        resultDiv.innerHTML = `
             <div class="playlist-header">
                 <h3>Your ${mood} playlist is ready! 🎵</h3>
-                <p>Found ${tracks.length} perfect tracks for your mood</p>
+                <p class="track-count"></p>
             </div>
-            <div class="tracks">
+            <div class="tracks"></div>
         `;
+    }
 
-        tracks.forEach(track => {
-            html += `
-                <div class="track" data-track-id="${track.id}">
-                    ${track.image ? `<img src="${track.image}" alt="Album" class="track-image">` : ''}
-                    <div class="track-info">
-                        <div class="track-name">${track.name}</div>
-                        <div class="track-artist">${track.artist}</div>
-                        <div class="track-album">${track.album}</div>
-                    </div>
-                    <div class="track-controls">
-                        ${track.preview_url ? `<audio controls preload="none">
-                            <source src="${track.preview_url}" type="audio/mpeg">
-                        </audio>` : '<span class="no-preview">No preview</span>'}
-                    </div>
+    function appendTrack(track) {
+        resultDiv.querySelector('.tracks').insertAdjacentHTML('beforeend', `
+            <div class="track" data-track-id="${track.id}">
+                ${track.image ? `<img src="${track.image}" alt="Album" class="track-image">` : ''}
+                <div class="track-info">
+                    <div class="track-name">${track.name}</div>
+                    <div class="track-artist">${track.artist}</div>
+                    <div class="track-album">${track.album}</div>
                 </div>
-            `;
-        });
+                <div class="track-controls">
+                    ${track.preview_url ? `<audio controls preload="none">
+                        <source src="${track.preview_url}" type="audio/mpeg">
+                    </audio>` : '<span class="no-preview">No preview</span>'}
+                </div>
+            </div>
+        `);
+    }
 
-        html += '</div>';
-        
-        html += `
+    function setTrackCount(count) {
+        resultDiv.querySelector('.track-count').textContent = `Found ${count} perfect tracks for your mood`;
+    }
+
+    function showPlaylistActions(mood, tracks) {
+        resultDiv.insertAdjacentHTML('beforeend', `
             <div class="playlist-actions">
                 <button class="create-playlist-btn" onclick="createSpotifyPlaylist('${mood}', ${JSON.stringify(tracks.map(t => t.id))})">
                     Save to Spotify
@@ -103,9 +196,7 @@ document.addEventListener('DOMContentLoaded', function() {
                     Surprise Me!
                 </button>
             </div>
-        `;
-
-        resultDiv.innerHTML = html;
+        `);
     }
 
     function showError(message) {